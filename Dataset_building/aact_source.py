@@ -0,0 +1,92 @@
+"""
+Reads AACT pipe-delimited tables straight from the downloaded snapshot.
+
+AACT ships as one zip of `<table>.txt` files; extracting it to
+`CT_data_full/main_data` costs tens of GB. Every loader in Dataset_building
+goes through `read_table` instead, so `DATA_DIR` may point at any of:
+
+- the extracted directory (`main_data/studies.txt`, as before),
+- the AACT `.zip` itself (members are streamed out of the archive, matched
+  by file name so a leading folder inside the zip does not matter),
+- a directory of individually compressed tables (`studies.txt.gz`,
+  `studies.txt.zst`), e.g. after recompressing only the tables we use.
+
+Nothing is decompressed to disk. `usecols` is always passed through, so only
+the requested columns are materialized, and `chunksize` streams the table.
+`.zst` tables need the `zstandard` package (pandas imports it on demand).
+pandas itself is imported on first read, so `table_path` / `table_exists`
+stay cheap for callers that only locate files (run_pipeline, ctpipe status).
+"""
+
+import os
+import zipfile
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def _zip_member(archive, table):
+    """Name of the archive member holding `table` (e.g. 'studies.txt'), or None."""
+    for name in archive.namelist():
+        if os.path.basename(name) == table:
+            return name
+    return None
+
+
+def table_path(source, table):
+    """
+    File on disk that backs `table`: the plain file, the compressed file, or
+    the zip archive. Returns None if the table cannot be found.
+    """
+    if os.path.isfile(source) and zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            return source if _zip_member(archive, table) else None
+    plain = os.path.join(source, table)
+    if os.path.exists(plain):
+        return plain
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(plain + suffix):
+            return plain + suffix
+    return None
+
+
+def table_exists(source, table):
+    return table_path(source, table) is not None
+
+
+def read_table(source, table, **read_kwargs):
+    """
+    pd.read_csv for one AACT table (sep='|' by default). With `chunksize`, returns
+    an iterator of DataFrames; otherwise a DataFrame.
+    """
+    import pandas as pd
+
+    path = table_path(source, table)
+    if path is None:
+        raise FileNotFoundError(f"AACT table {table} not found in {source}")
+    read_kwargs.setdefault("sep", "|")
+    if read_kwargs.get("chunksize") is not None:
+        return _iter_chunks(source, table, path, read_kwargs)
+    if path != source:
+        return pd.read_csv(path, **read_kwargs)
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(_zip_member(archive, table)) as member:
+            return pd.read_csv(member, **read_kwargs)
+
+
+def _iter_chunks(source, table, path, read_kwargs):
+    import pandas as pd
+
+    if path != source:
+        with pd.read_csv(path, **read_kwargs) as reader:
+            yield from reader
+        return
+    # Keep the archive open while the caller consumes the chunks
+    with zipfile.ZipFile(source) as archive:
+        with archive.open(_zip_member(archive, table)) as member:
+            with pd.read_csv(member, **read_kwargs) as reader:
+                yield from reader
+
+
+def table_columns(source, table):
+    """Header of an AACT table, without reading any rows."""
+    return read_table(source, table, nrows=0).columns.tolist()
@@ -15,10 +15,14 @@ import os
 import re
 from collections import defaultdict
 
+from chunked_join import read_filtered
+from ground_truth_io import dataset_path, remove_dataset, write_ground_truth_dataset
+
 # Configuration
-DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data"
+DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data" # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
 PILOT_FILE = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/pilot_ground_truth.csv"
 FULL_FILE = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/terminated_ground_truth.csv"
+OUTPUT_FORMAT = "csv" # "csv", "parquet" or "both" (--format)
 
 # Medical Field Taxonomy - Mapping from MeSH/Condition terms to fields
 # Based on common MeSH tree structures and clinical practice
@@ -109,6 +113,11 @@ FIELD_MAPPINGS = {
     ],
 }
 
+FIELD_PATTERNS = {
+    field: [(keyword, re.compile(r'\b' + re.escape(keyword))) for keyword in keywords]
+    for field, keywords in FIELD_MAPPINGS.items()
+}
+
 
 def classify_medical_field(text):
     """
@@ -121,10 +130,11 @@ def classify_medical_field(text):
     text_lower = text.lower()
     
     # Score each field based on keyword matches
+    # (substring test first: a keyword can only match at a word boundary if it occurs at all)
     scores = defaultdict(int)
-    for field, keywords in FIELD_MAPPINGS.items():
-        for keyword in keywords:
-            if re.search(r'\b' + re.escape(keyword), text_lower):
+    for field, keywords in FIELD_PATTERNS.items():
+        for keyword, pattern in keywords:
+            if keyword in text_lower and pattern.search(text_lower):
                 scores[field] += 1
     
     if scores:
@@ -196,7 +206,28 @@ def extract_subfield(text, field):
     return f'{field} disorder'
 
 
-def process_ground_truth_file(input_file, output_file, test_mode=True):
+def classify_trial(mesh_terms, conditions, fallback_text):
+    """
+    Hierarchical medical field classification for one trial: MeSH terms first
+    (most reliable), then condition names, then title/summary text.
+    Returns {medical_field, medical_subfield, field_source}.
+    """
+    for text, label in ((mesh_terms, 'MeSH'), (conditions, 'Condition')):
+        if isinstance(text, str) and text:
+            field, _ = classify_medical_field(text)
+            if field != 'Unknown':
+                return {'medical_field': field, 'medical_subfield': extract_subfield(text, field), 'field_source': label}
+    
+    # Last resort: use brief_title or brief_summary
+    field, _ = classify_medical_field(fallback_text)
+    return {
+        'medical_field': field,
+        'medical_subfield': extract_subfield(fallback_text, field) if field != 'Unknown' else '',
+        'field_source': 'Title/Summary' if field != 'Unknown' else 'Unable to classify'
+    }
+
+
+def process_ground_truth_file(input_file, output_file, test_mode=True, output_format=OUTPUT_FORMAT):
     """
     Process a ground truth CSV file and add medical field columns.
     
@@ -204,6 +235,8 @@ def process_ground_truth_file(input_file, output_file, test_mode=True):
         input_file: Path to input CSV file
         output_file: Path to output CSV file
         test_mode: If True, shows detailed output for testing
+        output_format: "csv", "parquet" (dataset partitioned by medical_field/phase
+            next to output_file, see ground_truth_io.py) or "both"
     """
     print(f"\n{'='*60}")
     print(f"Processing: {os.path.basename(input_file)}")
@@ -218,30 +251,33 @@ def process_ground_truth_file(input_file, output_file, test_mode=True):
     # Load conditions, MeSH terms, and phase information
     print("\nLoading CT.gov data sources...")
     
+    # Only rows of the trials in this file are kept while each table streams
+    trial_ids = set(df['nct_id'])
+    
     # Load phase information from studies.txt
-    studies_phase = pd.read_csv(
-        os.path.join(DATA_DIR, "studies.txt"),
-        sep="|",
+    studies_phase = read_filtered(
+        DATA_DIR, "studies.txt",
         usecols=["nct_id", "phase"],
-        low_memory=False
+        ids=trial_ids,
+        dtype=str
     )
     print(f"  - Loaded phase information for {len(studies_phase)} studies")
     
     # Load conditions
-    conditions = pd.read_csv(
-        os.path.join(DATA_DIR, "conditions.txt"),
-        sep="|",
+    conditions = read_filtered(
+        DATA_DIR, "conditions.txt",
         usecols=["nct_id", "name"],
-        low_memory=False
+        ids=trial_ids,
+        dtype=str
     )
     print(f"  - Loaded {len(conditions)} condition records")
     
     # Load MeSH terms
-    browse_conditions = pd.read_csv(
-        os.path.join(DATA_DIR, "browse_conditions.txt"),
-        sep="|",
+    browse_conditions = read_filtered(
+        DATA_DIR, "browse_conditions.txt",
         usecols=["nct_id", "mesh_term"],
-        low_memory=False
+        ids=trial_ids,
+        dtype=str
     )
     print(f"  - Loaded {len(browse_conditions)} MeSH term records")
     
@@ -274,40 +310,9 @@ def process_ground_truth_file(input_file, output_file, test_mode=True):
     
     results = []
     for idx, row in df.iterrows():
-        # Try MeSH terms first (most reliable)
-        if pd.notna(row.get('all_mesh_terms')):
-            field, source = classify_medical_field(row['all_mesh_terms'])
-            if field != 'Unknown':
-                subfield = extract_subfield(row['all_mesh_terms'], field)
-                results.append({
-                    'medical_field': field,
-                    'medical_subfield': subfield,
-                    'field_source': 'MeSH'
-                })
-                continue
-        
-        # Fall back to condition names
-        if pd.notna(row.get('all_conditions')):
-            field, source = classify_medical_field(row['all_conditions'])
-            if field != 'Unknown':
-                subfield = extract_subfield(row['all_conditions'], field)
-                results.append({
-                    'medical_field': field,
-                    'medical_subfield': subfield,
-                    'field_source': 'Condition'
-                })
-                continue
-        
-        # Last resort: use brief_title or brief_summary
+        # MeSH terms first (most reliable), then condition names, then title/summary
         text = str(row.get('brief_title', '')) + ' ' + str(row.get('brief_summary', ''))
-        field, source = classify_medical_field(text)
-        subfield = extract_subfield(text, field) if field != 'Unknown' else ''
-        
-        results.append({
-            'medical_field': field,
-            'medical_subfield': subfield,
-            'field_source': 'Title/Summary' if field != 'Unknown' else 'Unable to classify'
-        })
+        results.append(classify_trial(row.get('all_mesh_terms'), row.get('all_conditions'), text))
     
     # Add results to dataframe
     results_df = pd.DataFrame(results)
@@ -322,8 +327,15 @@ def process_ground_truth_file(input_file, output_file, test_mode=True):
     df = df[base_cols + ['phase', 'medical_field', 'medical_subfield', 'field_source']]
     
     # Save output
-    print(f"\nSaving results to: {output_file}")
-    df.to_csv(output_file, index=False)
+    if output_format in ("csv", "both"):
+        print(f"\nSaving results to: {output_file}")
+        df.to_csv(output_file, index=False)
+    if output_format in ("parquet", "both"):
+        print(f"Saving partitioned dataset to: {dataset_path(output_file)}")
+        write_ground_truth_dataset(df, dataset_path(output_file))
+    else:
+        # A dataset from an earlier run would shadow the new CSV for readers
+        remove_dataset(dataset_path(output_file))
     
     # Print statistics
     print("\n" + "="*60)
@@ -353,17 +365,23 @@ def process_ground_truth_file(input_file, output_file, test_mode=True):
 
 
 if __name__ == "__main__":
-    import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Add medical field / subfield columns to the ground truth")
+    parser.add_argument("--full", action="store_true", help="Process terminated_ground_truth.csv (default: pilot file)")
+    parser.add_argument("--format", choices=["csv", "parquet", "both"], default=OUTPUT_FORMAT,
+                        help="Output as CSV, as a Parquet dataset partitioned by medical_field/phase, or both")
+    args = parser.parse_args()
     
     # Check command line argument for which dataset to process
-    if len(sys.argv) > 1 and sys.argv[1] == "--full":
+    if args.full:
         # Process full dataset
         full_output = FULL_FILE.replace('.csv', '_enriched.csv')
         print("\n" + "#" * 60)
         print("# PROCESSING FULL DATASET: terminated_ground_truth.csv")
         print("# Output: terminated_ground_truth_enriched.csv")
         print("#" * 60)
-        full_df = process_ground_truth_file(FULL_FILE, full_output, test_mode=False)
+        full_df = process_ground_truth_file(FULL_FILE, full_output, test_mode=False, output_format=args.format)
         
         print("\n" + "#" * 60)
         print("# FULL DATASET PROCESSING COMPLETE!")
@@ -376,7 +394,7 @@ if __name__ == "__main__":
         
         print("PHASE 1: Testing on pilot_ground_truth.csv")
         print("(To process full dataset, run: python add_medical_fields.py --full)")
-        pilot_df = process_ground_truth_file(PILOT_FILE, pilot_output, test_mode=True)
+        pilot_df = process_ground_truth_file(PILOT_FILE, pilot_output, test_mode=True, output_format=args.format)
         
         print("\n" + "#" * 60)
         print("# Pilot processing complete!")
@@ -0,0 +1,203 @@
+"""
+Chunked per-trial aggregation of one-to-many AACT tables.
+
+Tables such as reported_events.txt (~11M rows), outcome_measurements.txt
+(~4.6M), drop_withdrawals.txt or design_groups.txt have many rows per trial,
+so they can neither be loaded whole nor reduced with `drop_duplicates`. Each
+feature is declared in the `Aggregation` column of
+Prediction/Input_fields_for_LLM_prediction-Input.csv:
+
+    <func>(<column>) [where <column>=<value>[|<value>...]]
+
+    count(*)                                   rows per trial
+    sum(subjects_affected) where event_type=serious
+    max(subjects_at_risk) / min(...) / mean(...)
+    nunique(outcome_id)                        distinct values per trial
+    distinct(reason)                           distinct values joined with ' | '
+
+The `Variable name` of the row is the output column. Filters compare stripped,
+case-insensitive strings.
+
+`TrialAggregator` streams a table chunk by chunk (`update`). Numeric
+aggregates are reduced to one partial row per trial per chunk and merged
+whenever the buffer grows past COMBINE_ROWS; distinct-value aggregates keep
+only unique (nct_id, value) pairs. Memory is bounded by the number of trials
+(and their distinct values), never by the number of rows.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from aact_source import read_table
+
+CHUNK_SIZE = 500000 # Rows read per chunk
+COMBINE_ROWS = 2000000 # Buffered partial rows before they are merged
+DISTINCT_SEPARATOR = " | "
+
+SPEC_RE = re.compile(
+    r'^\s*(?P<func>count|sum|max|min|mean|nunique|distinct)\s*\(\s*(?P<column>\*|[\w]+)\s*\)'
+    r'(?:\s+where\s+(?P<where_col>\w+)\s*=\s*(?P<where_values>.+?))?\s*$',
+    re.IGNORECASE
+)
+NUMERIC_FUNCS = {"count", "sum", "max", "min", "mean"}
+# How per-chunk partials are merged
+MERGE_FUNCS = {"count": "sum", "sum": "sum", "max": "max", "min": "min"}
+
+
+def parse_aggregation(name, expression):
+    """Parses one `Aggregation` expression into a spec dict (raises ValueError if invalid)."""
+    match = SPEC_RE.match(expression)
+    if not match:
+        raise ValueError(f"Invalid aggregation for {name}: '{expression}' (expected e.g. 'sum(col) where col=value')")
+    func = match.group("func").lower()
+    column = match.group("column")
+    if column == "*" and func != "count":
+        raise ValueError(f"Invalid aggregation for {name}: only count() accepts '*'")
+    where_values = match.group("where_values")
+    return {
+        "name": name,
+        "func": func,
+        "column": None if column == "*" else column,
+        "where_col": match.group("where_col"),
+        "where_values": [v.strip().lower() for v in where_values.split("|")] if where_values else None,
+    }
+
+
+def required_columns(specs, id_col="nct_id"):
+    cols = [id_col]
+    for spec in specs:
+        cols += [c for c in (spec["column"], spec["where_col"]) if c]
+    return list(dict.fromkeys(cols))
+
+
+class TrialAggregator:
+    """Streams one table and computes every spec for it, one row per trial."""
+
+    def __init__(self, specs, id_col="nct_id", target_ids=None):
+        self.specs = specs
+        self.id_col = id_col
+        self.target_ids = set(target_ids) if target_ids is not None else None
+        self.rows_seen = 0
+        self._numeric_parts = []
+        self._numeric_rows = 0
+        self._distinct = {spec["name"]: [] for spec in specs if spec["func"] in ("nunique", "distinct")}
+
+    def _partial_columns(self, spec):
+        """Names of the partial columns for a numeric spec (mean keeps a sum and a count)."""
+        if spec["func"] == "mean":
+            return [f"{spec['name']}__sum", f"{spec['name']}__count"]
+        return [spec["name"]]
+
+    def update(self, chunk):
+        if self.target_ids is not None:
+            chunk = chunk[chunk[self.id_col].isin(self.target_ids)]
+        self.rows_seen += len(chunk)
+        if chunk.empty:
+            return
+
+        partial = {}
+        for spec in self.specs:
+            rows = chunk
+            if spec["where_col"]:
+                lowered = rows[spec["where_col"]].astype(str).str.strip().str.lower()
+                rows = rows[lowered.isin(spec["where_values"])]
+            ids = rows[self.id_col]
+
+            if spec["func"] in ("nunique", "distinct"):
+                values = rows[spec["column"]]
+                pairs = pd.DataFrame({"nct_id": ids, "value": values}).dropna().drop_duplicates()
+                self._distinct[spec["name"]].append(pairs)
+                continue
+
+            if spec["func"] == "count":
+                partial[spec["name"]] = ids.value_counts()
+                continue
+            values = pd.to_numeric(rows[spec["column"]], errors="coerce")
+            grouped = values.groupby(ids.to_numpy())
+            if spec["func"] == "mean":
+                partial[f"{spec['name']}__sum"] = grouped.sum(min_count=1)
+                partial[f"{spec['name']}__count"] = grouped.count()
+            elif spec["func"] == "sum":
+                partial[spec["name"]] = grouped.sum(min_count=1)
+            else:
+                partial[spec["name"]] = grouped.agg(spec["func"])
+
+        if partial:
+            part = pd.DataFrame(partial)
+            self._numeric_parts.append(part)
+            self._numeric_rows += len(part)
+            if self._numeric_rows > COMBINE_ROWS:
+                self._combine()
+        for name, parts in self._distinct.items():
+            if sum(len(p) for p in parts) > COMBINE_ROWS:
+                self._distinct[name] = [pd.concat(parts, ignore_index=True).drop_duplicates()]
+
+    def _merge_funcs(self):
+        funcs = {}
+        for spec in self.specs:
+            if spec["func"] in NUMERIC_FUNCS:
+                for col in self._partial_columns(spec):
+                    funcs[col] = "sum" if spec["func"] == "mean" else MERGE_FUNCS[spec["func"]]
+        return funcs
+
+    def _combine(self):
+        """Merges buffered per-chunk partials into one row per trial."""
+        if len(self._numeric_parts) > 1:
+            merged = pd.concat(self._numeric_parts)
+            funcs = self._merge_funcs()
+            grouped = merged.groupby(level=0)
+            combined = {}
+            for col, func in funcs.items():
+                if col not in merged.columns:
+                    continue
+                # min_count=1 keeps "no values" as NaN instead of 0
+                combined[col] = grouped[col].sum(min_count=1) if func == "sum" else grouped[col].agg(func)
+            self._numeric_parts = [pd.DataFrame(combined)]
+        self._numeric_rows = len(self._numeric_parts[0]) if self._numeric_parts else 0
+
+    def result(self):
+        """DataFrame with one row per trial that had at least one matching row."""
+        self._combine()
+        numeric = self._numeric_parts[0] if self._numeric_parts else pd.DataFrame()
+        columns = {}
+        for spec in self.specs:
+            name = spec["name"]
+            if spec["func"] == "mean":
+                if f"{name}__sum" in numeric.columns:
+                    columns[name] = numeric[f"{name}__sum"] / numeric[f"{name}__count"].replace(0, np.nan)
+            elif spec["func"] in NUMERIC_FUNCS:
+                if name in numeric.columns:
+                    columns[name] = numeric[name]
+            else:
+                parts = self._distinct[name]
+                if not parts:
+                    continue
+                pairs = pd.concat(parts, ignore_index=True).drop_duplicates()
+                grouped = pairs.groupby("nct_id")["value"]
+                if spec["func"] == "nunique":
+                    columns[name] = grouped.size()
+                else:
+                    columns[name] = grouped.agg(lambda v: DISTINCT_SEPARATOR.join(sorted(map(str, v))))
+
+        out = pd.DataFrame(columns)
+        out.index.name = self.id_col
+        for spec in self.specs:
+            if spec["name"] not in out.columns:
+                out[spec["name"]] = np.nan
+        # Trials present in the table but without a matching row count as zero
+        for spec in self.specs:
+            if spec["func"] in ("count", "nunique"):
+                out[spec["name"]] = out[spec["name"]].fillna(0).astype("int64")
+        return out[[spec["name"] for spec in self.specs]].reset_index()
+
+
+def aggregate_table(source, table, specs, target_ids=None, chunksize=CHUNK_SIZE, id_col="nct_id"):
+    """Streams `table` from the AACT `source` and returns one row per trial with every spec."""
+    aggregator = TrialAggregator(specs, id_col=id_col, target_ids=target_ids)
+    usecols = required_columns(specs, id_col)
+    for chunk in read_table(source, table, usecols=usecols, dtype=str, chunksize=chunksize):
+        aggregator.update(chunk)
+    print(f"  Aggregated {aggregator.rows_seen} matching rows of {table} into {len(specs)} features")
+    return aggregator.result()
@@ -5,13 +5,15 @@ This script analyzes the terminated_ground_truth_enriched.csv to determine
 if the brief_summary column provides additional context about why trials were stopped.
 """
 
-import pandas as pd
-import re
-from collections import Counter
+from ground_truth_io import read_ground_truth, resolve_ground_truth
+from text_scan import TERMINATION_KEYWORDS, scan_termination_mentions
+
+# Columns used below (detailed_description is never read)
+COLUMNS = ['nct_id', 'phase', 'medical_field', 'termination_category', 'why_stopped', 'brief_summary']
 
 # Load data
 print("Loading data...")
-df = pd.read_csv('terminated_ground_truth_enriched.csv')
+df = read_ground_truth(resolve_ground_truth('terminated_ground_truth_enriched.csv'), columns=COLUMNS)
 
 print(f"\n{'='*70}")
 print("BRIEF SUMMARY ANALYSIS: Termination Information")
@@ -23,20 +25,17 @@ print(f"Trials with brief_summary: {df['brief_summary'].notna().sum():,} ({df['b
 print(f"Trials without brief_summary: {df['brief_summary'].isna().sum():,} ({df['brief_summary'].isna().sum()/len(df)*100:.1f}%)")
 
 # Check if brief_summary contains termination-related keywords
-termination_keywords = [
-    'terminated', 'stopped', 'discontinued', 'closed', 'halted',
-    'enrollment', 'accrual', 'recruit', 'funding', 'sponsor',
-    'safety', 'adverse', 'efficacy', 'futility'
-]
+# Single pass over the column: trial x keyword hit matrix (see text_scan.py)
+termination_keywords = TERMINATION_KEYWORDS
+scan = scan_termination_mentions(df['brief_summary'])
 
 print(f"\n{'='*70}")
 print("KEYWORD ANALYSIS IN BRIEF_SUMMARY")
 print(f"{'='*70}\n")
 
-keyword_counts = {}
+keyword_counts = scan.hits[termination_keywords].sum().to_dict()
 for keyword in termination_keywords:
-    count = df['brief_summary'].str.contains(keyword, case=False, na=False).sum()
-    keyword_counts[keyword] = count
+    count = keyword_counts[keyword]
     print(f"{keyword:20s}: {count:5,} trials ({count/len(df)*100:5.1f}%)")
 
 # Compare why_stopped vs brief_summary content
@@ -49,9 +48,7 @@ print("Analyzing if brief_summary provides ADDITIONAL termination context...\n")
 
 # Check for trials where brief_summary mentions termination but why_stopped is short
 df['why_stopped_length'] = df['why_stopped'].fillna('').str.len()
-df['summary_has_term_info'] = df['brief_summary'].str.contains(
-    '|'.join(termination_keywords), case=False, na=False
-)
+df['summary_has_term_info'] = scan.any_hit(termination_keywords)
 
 additional_info_cases = df[
     (df['summary_has_term_info'] == True) & 
@@ -1,16 +1,23 @@
 
-import pandas as pd
-import os
-from collections import Counter
-import re
+import argparse
 
-DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data"
+from assign_taxonomy import get_termination_category
+from aact_source import read_table
+from term_stats import TermStats
+
+DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data" # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
+CHUNK_SIZE = 100000 # Rows of studies.txt per chunk for streaming term statistics
+
+def print_top_terms(stats, k=20, column='all', value='all'):
+    labels = {1: "Words", 2: "Bigrams", 3: "Trigrams"}
+    for n in stats.ngram_sizes:
+        print(f"\nTop {k} Common {labels.get(n, f'{n}-grams')} (Filtered):")
+        print([(term, count) for term, count, _ in stats.top(n=n, k=k, column=column, value=value)])
 
 def analyze_full_pipeline():
     print("Loading studies.txt...")
-    studies = pd.read_csv(
-        os.path.join(DATA_DIR, "studies.txt"),
-        sep="|",
+    studies = read_table(
+        DATA_DIR, "studies.txt",
         usecols=["nct_id", "overall_status", "study_type", "why_stopped"],
         low_memory=False
     )
@@ -20,9 +27,8 @@ def analyze_full_pipeline():
     print(f"Unique NCT IDs: {unique_ids}")
     
     print("Loading designs.txt...")
-    designs = pd.read_csv(
-        os.path.join(DATA_DIR, "designs.txt"),
-        sep="|",
+    designs = read_table(
+        DATA_DIR, "designs.txt",
         usecols=["nct_id", "primary_purpose"],
         low_memory=False
     )
@@ -61,16 +67,51 @@ def analyze_full_pipeline():
     print("\nTop 20 Exact Reasons:")
     print(final_prospects["why_stopped"].value_counts().head(20))
     
-    # Top 20 Words
-    text = " ".join(final_prospects["why_stopped"].tolist()).lower()
-    # Simple tokenization
-    words = re.findall(r'\b[a-z]{3,}\b', text) # Ignore short words
-    stop_words = {'the', 'was', 'and', 'for', 'due', 'not', 'study', 'with', 'this', 'were', 'from', 'that', 'are', 'have', 'been'} 
-    filtered_words = [w for w in words if w not in stop_words]
+    # Top 20 Words / Bigrams / Trigrams (tokenized per row, see term_stats.py)
+    stats = TermStats(ngram_sizes=(1, 2, 3))
+    for start in range(0, len(final_prospects), CHUNK_SIZE):
+        stats.update(final_prospects.iloc[start:start + CHUNK_SIZE])
+    print_top_terms(stats)
+
+def analyze_term_statistics(capacity=None, k=20, output_file=None):
+    """
+    Streams why_stopped over ALL of studies.txt in chunks and counts
+    uni/bi/trigrams overall and per termination_category and phase.
+    """
+    stats = TermStats(ngram_sizes=(1, 2, 3), group_by=("termination_category", "phase"), capacity=capacity)
+    
+    print(f"Streaming studies.txt in chunks of {CHUNK_SIZE}...")
+    reader = read_table(
+        DATA_DIR, "studies.txt",
+        usecols=["nct_id", "why_stopped", "phase"],
+        chunksize=CHUNK_SIZE,
+        low_memory=False
+    )
+    for chunk in reader:
+        chunk = chunk[chunk["why_stopped"].notna()].copy()
+        chunk["termination_category"] = chunk["why_stopped"].map(get_termination_category)
+        stats.update(chunk)
+    print(f"Rows with why_stopped text: {stats.rows_seen}")
     
-    common_words = Counter(filtered_words).most_common(20)
-    print("\nTop 20 Common Words (Filtered):")
-    print(common_words)
+    print_top_terms(stats, k=k)
+    for column in stats.group_by:
+        for value in stats.group_values(column):
+            print(f"\n--- {column} = {value} ---")
+            print_top_terms(stats, k=k, column=column, value=value)
+    
+    if output_file:
+        stats.to_frame(k=k).to_csv(output_file, index=False)
+        print(f"Saved term statistics to {output_file}")
 
 if __name__ == "__main__":
-    analyze_full_pipeline()
+    parser = argparse.ArgumentParser(description="why_stopped frequency analysis")
+    parser.add_argument("--all", action="store_true", help="Stream term statistics over all of CT.gov, broken down by category/phase")
+    parser.add_argument("--capacity", type=int, default=None, help="Bounded-memory mode: keep top-K heavy hitters per counter")
+    parser.add_argument("--top", type=int, default=20, help="Number of terms to report per group")
+    parser.add_argument("--output", default=None, help="Optional CSV for the per-group top terms")
+    args = parser.parse_args()
+    
+    if args.all:
+        analyze_term_statistics(capacity=args.capacity, k=args.top, output_file=args.output)
+    else:
+        analyze_full_pipeline()
@@ -1,11 +1,12 @@
 
-import pandas as pd
-import os
 import re
 
+from chunked_join import read_filtered, stream_table, join_tables
+
 # Configuration
-DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data"
+DATA_DIR = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/CT_data_full/main_data" # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
 OUTPUT_FILE = r"c:/Users/1234/OneDrive - Vanderbilt/Projects/LLM-clinical trials/terminated_ground_truth.csv"
+JOIN_MEMORY_MB = 1024 # Memory ceiling for the studies x designs join (spills to disk above it)
 
 def get_termination_category(why_stopped):
     if not isinstance(why_stopped, str):
@@ -42,30 +43,21 @@ def get_termination_category(why_stopped):
 
 def process_taxonomy():
     print("Loading data...")
-    # Load raw data
-    studies = pd.read_csv(
-        os.path.join(DATA_DIR, "studies.txt"),
-        sep="|",
+    # Predicates are applied while each table streams; only matching rows reach the join
+    print("Filtering for Terminated / Interventional / Treatment...")
+    studies = stream_table(
+        DATA_DIR, "studies.txt",
         usecols=["nct_id", "overall_status", "study_type", "why_stopped", "brief_title"],
-        low_memory=False
+        where={"study_type": "INTERVENTIONAL", "overall_status": "TERMINATED"},
+        dtype=str
     )
-    designs = pd.read_csv(
-        os.path.join(DATA_DIR, "designs.txt"),
-        sep="|",
+    designs = stream_table(
+        DATA_DIR, "designs.txt",
         usecols=["nct_id", "primary_purpose"],
-        low_memory=False
+        where={"primary_purpose": "TREATMENT"},
+        dtype=str
     )
-    
-    # Merge
-    merged = studies.merge(designs, on="nct_id", how="left")
-    
-    # Filter
-    print("Filtering for Terminated / Interventional / Treatment...")
-    df = merged[
-        (merged["study_type"] == "INTERVENTIONAL") &
-        (merged["overall_status"] == "TERMINATED") &
-        (merged["primary_purpose"] == "TREATMENT")
-    ].copy()
+    df = join_tables(studies, designs, on="nct_id", how="inner", memory_limit_mb=JOIN_MEMORY_MB)
     
     print(f"Candidates before cleaning: {len(df)}")
     
@@ -79,11 +71,11 @@ def process_taxonomy():
     
     # Add Brief Summary for context (useful for next steps)
     print("Loading brief summaries...")
-    brief_summaries = pd.read_csv(
-        os.path.join(DATA_DIR, "brief_summaries.txt"),
-        sep="|",
+    brief_summaries = read_filtered(
+        DATA_DIR, "brief_summaries.txt",
         usecols=["nct_id", "description"],
-        low_memory=False
+        ids=set(df["nct_id"]),
+        dtype=str
     ).rename(columns={"description": "brief_summary"})
     
     df = df.merge(brief_summaries, on="nct_id", how="left")
@@ -96,16 +88,13 @@ def process_taxonomy():
     print(f"Count of studies needing detailed description: {len(target_ids)}")
     
     print("Loading detailed descriptions...")
-    detailed_descriptions = pd.read_csv(
-        os.path.join(DATA_DIR, "detailed_descriptions.txt"),
-        sep="|",
+    detailed_descriptions = read_filtered(
+        DATA_DIR, "detailed_descriptions.txt",
         usecols=["nct_id", "description"],
-        low_memory=False
+        ids=target_ids,  # Filtered while streaming, so the full table is never loaded
+        dtype=str
     ).rename(columns={"description": "detailed_description"})
     
-    # Filter immediately to keep only relevant IDs
-    detailed_descriptions = detailed_descriptions[detailed_descriptions["nct_id"].isin(target_ids)]
-    
     print("Merging filtered detailed descriptions...")
     df = df.merge(detailed_descriptions, on="nct_id", how="left")
     
@@ -2,71 +2,54 @@ import pandas as pd
 import os
 import numpy as np
 
+from aact_source import read_table, table_columns, table_exists
+from aggregation import aggregate_table, parse_aggregation
+from feature_normalization import load_field_specs, normalize_features
+from ground_truth_io import ground_truth_columns, read_ground_truth, resolve_ground_truth
+from sampling import stratified_sample
+from trial_store import open_store
+
 # Define paths
 BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
 GROUND_TRUTH_PATH = os.path.join(BASE_DIR, "Final_data_sets", "terminated_ground_truth_enriched.csv")
 DEEPSEEK_RESULTS_PATH = os.path.join(BASE_DIR, "output", "deepseek_extraction_results.csv")
 INPUT_FIELDS_PATH = os.path.join(BASE_DIR, "Prediction", "Input_fields_for_LLM_prediction-Input.csv")
-DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data")
+DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data") # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
 OUTPUT_PATH = os.path.join(BASE_DIR, "Pilot_datasets", "pilot_prediction_dataset.csv")
+TRIAL_STORE_PATH = os.path.join(BASE_DIR, "Indexes", "trial_store.sqlite") # Used when built for the current snapshot (trial_store.py --build)
+
+# Sampling configuration (see sampling.py)
+GROUP_A_SIZE = 50 # From ground truth
+GROUP_B_SIZE = 30 # From DeepSeek results (Unclear/No Context)
+GROUP_A_STRATA = ['termination_category'] # Add 'phase', 'medical_field' for finer strata
+GROUP_A_MIN_PER_STRATUM = 2
+SAMPLING_SEED = 42
+# Ground truth columns carried into the pilot dataset (long text is taken from the AACT tables instead)
+GT_COLUMNS = ['nct_id', 'brief_title', 'why_stopped', 'termination_category', 'phase', 'medical_field', 'medical_subfield']
+CHUNK_SIZE = 500000 # Rows per chunk when streaming AACT tables
 
 def load_and_select_nct_ids():
-    """Selects 80 unique nct_ids: 50 from ground truth, 30 from deepseek results."""
+    """Selects unique nct_ids: GROUP_A_SIZE from ground truth, GROUP_B_SIZE from deepseek results."""
     print("Loading source datasets...")
-    df_gt = pd.read_csv(GROUND_TRUTH_PATH)
+    gt_path = resolve_ground_truth(GROUND_TRUTH_PATH)
+    available = ground_truth_columns(gt_path)
+    df_gt = read_ground_truth(gt_path, columns=[c for c in GT_COLUMNS + GROUP_A_STRATA if c in available])
     df_ds = pd.read_csv(DEEPSEEK_RESULTS_PATH)
     
-    # Selection Group A: 50 from Ground Truth (stratified by termination_category)
-    # Filter for valid categories if needed, but here we just want variety
-    print("Selecting 50 trials from Ground Truth...")
-    # Group by termination_category and sample to ensure diversity
-    # If a category has few samples, take all, then fill remainder randomly
-    group_a_ids = []
-    
-    # Get counts per category
-    category_counts = df_gt['termination_category'].value_counts()
-    
-    # Calculate target samples per category (proportional, but capped/floored)
-    # Simple approach: Sample up to k items from each category until we have 50?
-    # Or just random sample 50 from the whole set, hoping for diversity? 
-    # Better: Stratified sampling.
-    
-    # Let's try to get a mix. 
-    # If we simply sample 50 random rows, we might get mostly "Enrollment".
-    # Let's take 5 samples from top 10 categories, or similar logic. 
-    # Actually, verify column exists first.
-    if 'termination_category' not in df_gt.columns:
-        print("Warning: 'termination_category' not found, doing random sampling.")
-        sampled_gt = df_gt.sample(n=50, random_state=42)
-    else:
-        # Stratified sampling
-        # We want ~50. 
-        # Calculate weights inverse to frequency? Or just take one from each category first?
-        # Let's just do a simple stratified sample using pandas groupby
-        # If n < 50, take all.
-        try:
-            # Fraction to get approx 50
-            frac = 50 / len(df_gt)
-            # Ensure at least 1 per category if possible? 
-            # A simpler robust way:
-            df_gt_shuffled = df_gt.sample(frac=1, random_state=42)
-            # Take distinct categories first
-            unique_cats = df_gt_shuffled.groupby('termination_category').head(2) 
-            remaining_needed = 50 - len(unique_cats)
-            if remaining_needed > 0:
-                remaining = df_gt_shuffled[~df_gt_shuffled.index.isin(unique_cats.index)]
-                sampled_gt = pd.concat([unique_cats, remaining.head(remaining_needed)])
-            else:
-                sampled_gt = unique_cats.head(50)
-        except Exception as e:
-            print(f"Stratified sampling failed: {e}. Falling back to random.")
-            sampled_gt = df_gt.sample(n=50, random_state=42)
+    # Selection Group A: stratified by termination_category (exact allocation, fixed seed)
+    # so that a dominant category like "Enrollment" cannot crowd out the others.
+    print(f"Selecting {GROUP_A_SIZE} trials from Ground Truth...")
+    strata = [c for c in GROUP_A_STRATA if c in df_gt.columns]
+    if len(strata) < len(GROUP_A_STRATA):
+        print(f"Warning: strata {set(GROUP_A_STRATA) - set(strata)} not found, sampling without them.")
+    sampled_gt = stratified_sample(df_gt, GROUP_A_SIZE, strata=strata,
+                                   min_per_stratum=GROUP_A_MIN_PER_STRATUM, seed=SAMPLING_SEED)
 
     group_a_ids = set(sampled_gt['nct_id'].unique())
     print(f"Selected {len(group_a_ids)} from Ground Truth.")
 
-    # Selection Group B: 30 from Deepseek (Unclear/No Context)
-    print("Selecting 30 trials from Deepseek results (Unclear/No Context)...")
+    # Selection Group B: from Deepseek (Unclear/No Context)
+    print(f"Selecting {GROUP_B_SIZE} trials from Deepseek results (Unclear/No Context)...")
     # Filter for 'No Context', 'Unclear', or NaNs in 'primary_reasons'
     # Based on user chat, ANY from this file are good as they are pre-processed for this.
     # But let's prioritize empty or "No Context" if present.
@@ -74,7 +57,7 @@ def load_and_select_nct_ids():
     if 'primary_reasons' in df_ds.columns:
         unclear_mask = df_ds['primary_reasons'].astype(str).str.contains('No Context|Unclear|nan|None', case=False, regex=True) | df_ds['primary_reasons'].isnull()
         candidates_b = df_ds[unclear_mask]
-        if len(candidates_b) < 30:
+        if len(candidates_b) < GROUP_B_SIZE:
             # Fallback to any from deepseek
             candidates_b = df_ds
     else:
@@ -83,11 +66,9 @@ def load_and_select_nct_ids():
     # Remove IDs already in Group A
     candidates_b = candidates_b[~candidates_b['nct_id'].isin(group_a_ids)]
     
-    # Sample 30
-    if len(candidates_b) >= 30:
-        sampled_b = candidates_b.sample(n=30, random_state=42)
-    else:
-        sampled_b = candidates_b
+    # Sample (simple random with the same seeded ranking)
+    sampled_b = stratified_sample(candidates_b, GROUP_B_SIZE, seed=SAMPLING_SEED)
+    if len(sampled_b) < GROUP_B_SIZE:
         print(f"Warning: Only found {len(sampled_b)} valid candidates in Deepseek results.")
     
     group_b_ids = set(sampled_b['nct_id'].unique())
@@ -98,11 +79,15 @@ def load_and_select_nct_ids():
     return all_ids, sampled_gt, sampled_b
 
 def get_mapping_from_input_file():
-    """Reads the mapping CSV and returns a dict {source_file: [col1, col2...]}."""
+    """
+    Reads the mapping CSV and returns ({source_file: [col1, col2...]}, {source_file: [aggregation spec...]}).
+    Rows with an `Aggregation` expression are one-to-many features (see aggregation.py).
+    """
     print("Reading input fields mapping...")
     df_map = pd.read_csv(INPUT_FIELDS_PATH)
     
     mapping = {}
+    aggregations = {}
     for _, row in df_map.iterrows():
         source = row['Source file']
         var_name = row['Variable name']
@@ -111,6 +96,11 @@ def get_mapping_from_input_file():
         source = source.strip()
         var_name = var_name.strip()
         
+        expression = row.get('Aggregation')
+        if isinstance(expression, str) and expression.strip():
+            aggregations.setdefault(source, []).append(parse_aggregation(var_name, expression))
+            continue
+        
         if source not in mapping:
             mapping[source] = []
         mapping[source].append(var_name)
@@ -121,19 +111,34 @@ def get_mapping_from_input_file():
     if 'description' not in mapping['brief_summaries.txt']:
         mapping['brief_summaries.txt'].append('description')
         
-    return mapping
+    return mapping, aggregations
 
-def extract_data(target_nct_ids, mapping):
-    """Iterates through source files and extracts data for target IDs."""
+def extract_data(target_nct_ids, mapping, aggregations=None):
+    """Streams source files and extracts (or aggregates) data for target IDs."""
     
     # Initialize base dataframe with nct_ids
     # We want a DataFrame that we can merge into. 
     combined_df = pd.DataFrame({'nct_id': target_nct_ids})
+    target_set = set(target_nct_ids)
+    
+    # Fast path: indexed lookups in the per-trial document store
+    store = open_store(DATA_DIR, TRIAL_STORE_PATH)
+    store_fields = store.fields() if store else {}
+    store_df = None
     
     for source_file, columns in mapping.items():
-        file_path = os.path.join(DATA_DIR, source_file)
-        if not os.path.exists(file_path):
-            print(f"Warning: Source file {source_file} not found at {file_path}. Skipping.")
+        stored = store_fields.get(source_file, {})
+        if stored and all(c in stored for c in columns):
+            if store_df is None:
+                print(f"Reading {len(target_set)} trials from the trial store...")
+                store_df = store.get_frame(target_nct_ids)
+            keys = {stored[c]: c for c in columns}
+            df_stored = store_df.reindex(columns=['nct_id'] + list(keys)).rename(columns=keys)
+            combined_df = pd.merge(combined_df, df_stored, on='nct_id', how='left')
+            continue
+        
+        if not table_exists(DATA_DIR, source_file):
+            print(f"Warning: Source file {source_file} not found in {DATA_DIR}. Skipping.")
             continue
             
         print(f"Processing {source_file}...")
@@ -144,42 +149,52 @@ def extract_data(target_nct_ids, mapping):
         
         cols_to_load = ['nct_id'] + columns
         # Remove duplicates
-        cols_to_load = list(set(cols_to_load))
+        cols_to_load = list(dict.fromkeys(cols_to_load))
         
         try:
-            # Pipe delimited
-            # Using iterator or chunksize if files are huge, but let's try standard read first with usecols
-            # columns might not exist in file? Best to check or read header first.
-            
             # Read just header
-            header = pd.read_csv(file_path, sep='|', nrows=0).columns.tolist()
+            header = table_columns(DATA_DIR, source_file)
             valid_cols = [c for c in cols_to_load if c in header]
             
             if 'nct_id' not in valid_cols:
                 print(f"Error: 'nct_id' not found in {source_file}. Skipping.")
                 continue
                 
-            df_chunk = pd.read_csv(file_path, sep='|', usecols=valid_cols, dtype=str)
-            
-            # Filter
-            df_filtered = df_chunk[df_chunk['nct_id'].isin(target_nct_ids)].copy()
+            # Stream and filter (only the target rows are ever held in memory)
+            df_filtered = pd.concat(
+                [chunk[chunk['nct_id'].isin(target_set)]
+                 for chunk in read_table(DATA_DIR, source_file, usecols=valid_cols, dtype=str, chunksize=CHUNK_SIZE)],
+                ignore_index=True
+            )
             
-            # Drop duplicates if any (one row per study per file usually, but extracted fields might be 1:1)
-            # brief_summaries is 1:1. designs is 1:1. 
-            # If multiple rows, we need to decide how to aggregate. 
-            # For now, drop duplicates on nct_id to keep it simple 1:1
-            if df_filtered.duplicated(subset=['nct_id']).any():
-                 # Aggregate? or first? input file implies simple variables.
-                 # Let's keep first for now but warn
-                 # print(f"Warning: Duplicates found in {source_file} for some IDs. Keeping first.")
-                 df_filtered = df_filtered.drop_duplicates(subset=['nct_id'])
+            # Plain fields are expected to be 1:1. One-to-many tables need an
+            # Aggregation spec in the mapping; never truncate them silently.
+            dup_mask = df_filtered.duplicated(subset=['nct_id'])
+            if dup_mask.any():
+                print(f"Warning: {df_filtered.loc[dup_mask, 'nct_id'].nunique()} trials have several rows in {source_file}; "
+                      f"keeping the first. Add an Aggregation spec for {columns} to aggregate them instead.")
+                df_filtered = df_filtered[~dup_mask]
             
             # Merge
             combined_df = pd.merge(combined_df, df_filtered, on='nct_id', how='left')
             
         except Exception as e:
             print(f"Error processing {source_file}: {e}")
-            
+    
+    # One-to-many tables: chunked per-trial aggregation
+    for source_file, specs in (aggregations or {}).items():
+        if not table_exists(DATA_DIR, source_file):
+            print(f"Warning: Source file {source_file} not found in {DATA_DIR}. Skipping.")
+            continue
+        print(f"Aggregating {source_file}...")
+        try:
+            aggregated = aggregate_table(DATA_DIR, source_file, specs, target_ids=target_set)
+            combined_df = pd.merge(combined_df, aggregated, on='nct_id', how='left')
+        except Exception as e:
+            print(f"Error aggregating {source_file}: {e}")
+    
+    if store:
+        store.close()
     return combined_df
 
 def main():
@@ -187,15 +202,20 @@ def main():
     target_ids, sampled_gt, sampled_ds = load_and_select_nct_ids()
     
     # 2. Get Field Mapping
-    mapping = get_mapping_from_input_file()
+    mapping, aggregations = get_mapping_from_input_file()
     
     # 3. Extract Data
-    extracted_df = extract_data(target_ids, mapping)
+    extracted_df = extract_data(target_ids, mapping, aggregations)
+    
+    # 3b. Normalize to typed features (ages in years, booleans, canonical categories, int counts)
+    extracted_df, failures = normalize_features(extracted_df, load_field_specs(INPUT_FIELDS_PATH))
+    for field, count in failures.items():
+        print(f"Warning: {count} values of {field} could not be normalized.")
     
     # 4. Enrich with Labels/Metadata
     # We want to add back the info from GT and Deepseek (like why_stopped, termination_category, etc)
     # GT columns to keep
-    gt_cols_to_enrich = ['nct_id', 'brief_title', 'why_stopped', 'termination_category', 'phase', 'medical_field', 'medical_subfield']
+    gt_cols_to_enrich = GT_COLUMNS
     ds_cols_to_enrich = ['nct_id', 'primary_reasons', 'reason_category'] # Adjust based on actual ds columns
     
     # Check actual columns in sampled_ds
@@ -0,0 +1,210 @@
+"""
+Out-of-core joins of AACT tables on nct_id.
+
+process_taxonomy used to load all of studies.txt and designs.txt, merge them
+and only then keep interventional / terminated / treatment trials;
+add_medical_fields loaded all of conditions.txt and browse_conditions.txt to
+annotate a few thousand trials. On the full snapshot that is most of a batch
+node's RAM. This module keeps memory bounded by the filtered rows instead:
+
+1. `stream_table` reads a table in chunks and applies the predicates while
+   streaming (`where={"overall_status": "TERMINATED"}` or a callable, plus an
+   `ids` semi-join filter), so rows that cannot match never accumulate.
+2. `hash_join` joins two such streams: the right side is the build side and is
+   buffered; the left side is streamed through it chunk by chunk, in order.
+3. If the buffered build side grows past `memory_limit_mb`, the join turns
+   into a partitioned (Grace) hash join: both sides are split into
+   `partitions` files by a hash of the key in a temporary directory, and
+   partition pairs are joined one at a time, so only one partition pair is in
+   memory at once.
+
+`join_tables` collects the result into one DataFrame in left-side order, as
+`left.merge(right, how=...)` of the filtered tables would return it.
+
+Usage:
+    studies = stream_table(DATA_DIR, "studies.txt", ["nct_id", "overall_status"], where={"overall_status": "TERMINATED"})
+    designs = stream_table(DATA_DIR, "designs.txt", ["nct_id", "primary_purpose"], where={"primary_purpose": "TREATMENT"})
+    df = join_tables(studies, designs, how="inner", memory_limit_mb=512)
+"""
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from aact_source import read_table
+
+CHUNK_SIZE = 200000 # Rows read per chunk
+JOIN_MEMORY_MB = 1024 # Build side buffered in memory up to this size; above it, partition to disk
+SPILL_PARTITIONS = 32 # Partitions per side once the join spills
+ROW_COLUMN = "_left_row" # Left-side row number carried through a spilled join to restore order
+
+
+def frame_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 1e6
+
+
+def _where_mask(chunk, where):
+    """Row mask for {column: value or list of values} (all must hold), or a callable(chunk) -> mask."""
+    if callable(where):
+        return where(chunk)
+    mask = pd.Series(True, index=chunk.index)
+    for column, allowed in where.items():
+        allowed = allowed if isinstance(allowed, (list, tuple, set)) else [allowed]
+        mask &= chunk[column].isin(allowed)
+    return mask
+
+
+def stream_table(source, table, usecols, where=None, ids=None, id_col="nct_id", chunksize=CHUNK_SIZE,
+                 **read_kwargs):
+    """
+    Yields chunks of an AACT table with the predicates applied while reading.
+
+    Args:
+        where: {column: value or list} or callable(chunk) -> boolean mask.
+        ids: keep only these nct_ids (semi-join with a set built elsewhere).
+        read_kwargs: passed to read_table (e.g. dtype=str).
+    """
+    usecols = list(dict.fromkeys([id_col] + list(usecols)))
+    matched = False
+    for chunk in read_table(source, table, usecols=usecols, chunksize=chunksize, **read_kwargs):
+        if where is not None:
+            chunk = chunk[_where_mask(chunk, where)]
+        if ids is not None:
+            chunk = chunk[chunk[id_col].isin(ids)]
+        if len(chunk):
+            matched = True
+            yield chunk
+    if not matched:
+        # One empty chunk, so a join over no matching rows still knows this side's columns
+        yield pd.DataFrame(columns=usecols)
+
+
+def read_filtered(source, table, usecols, where=None, ids=None, id_col="nct_id", **kwargs):
+    """stream_table collected into one DataFrame (only the matching rows are ever held)."""
+    chunks = list(stream_table(source, table, usecols, where=where, ids=ids, id_col=id_col, **kwargs))
+    return pd.concat(chunks, ignore_index=True)
+
+
+class _Spill:
+    """Hash partitions of one join side, one pickle file per (partition, chunk)."""
+
+    def __init__(self, directory, side, on, partitions):
+        self.directory = directory
+        self.side = side
+        self.on = on
+        self.partitions = partitions
+        self.files = [[] for _ in range(partitions)]
+        self.rows = 0
+
+    def add(self, chunk):
+        part = pd.util.hash_pandas_object(chunk[self.on], index=False).to_numpy() % self.partitions
+        for p, piece in chunk.groupby(part, sort=False):
+            path = os.path.join(self.directory, f"{self.side}-{p}-{len(self.files[p])}.pkl")
+            piece.to_pickle(path)
+            self.files[p].append(path)
+        self.rows += len(chunk)
+
+    def load(self, p, columns):
+        if not self.files[p]:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_pickle(path) for path in self.files[p]], ignore_index=True)
+
+
+def hash_join(left, right, on="nct_id", how="inner", memory_limit_mb=JOIN_MEMORY_MB,
+              partitions=SPILL_PARTITIONS, spill_dir=None):
+    """
+    Joins two iterables of DataFrame chunks on `on` and yields joined chunks.
+
+    `right` is the build side (buffered); `left` is streamed and sets the
+    output order. `how` is "inner" or "left". While the build side fits in
+    `memory_limit_mb` the output follows the left side's order; once it
+    spills, chunks come out per partition, each carrying ROW_COLUMN (the
+    left-side row number) so `join_tables` can restore the order.
+    """
+    if how not in ("inner", "left"):
+        raise ValueError(f"how must be 'inner' or 'left', not '{how}'")
+    right = iter(right)
+    build, build_mb, columns = [], 0.0, None
+    for chunk in right:
+        columns = list(chunk.columns)
+        build.append(chunk)
+        build_mb += frame_mb(chunk)
+        if build_mb > memory_limit_mb:
+            break
+    else:
+        # 1. In-memory hash join: stream the left side through the buffered right side
+        table = pd.concat(build, ignore_index=True) if build else None
+        for chunk in left:
+            if table is None:
+                if how == "left":
+                    yield chunk
+                continue
+            joined = chunk.merge(table, on=on, how=how)
+            if len(joined):
+                yield joined
+        return
+
+    # 2. Over the ceiling: partition both sides to disk, then join partition pairs
+    print(f"  Join build side exceeded {memory_limit_mb} MB; partitioning both sides into {partitions} files...")
+    directory = tempfile.mkdtemp(prefix="join-", dir=spill_dir)
+    try:
+        right_spill = _Spill(directory, "right", on, partitions)
+        for chunk in build:
+            right_spill.add(chunk)
+        del build
+        for chunk in right:
+            right_spill.add(chunk)
+
+        left_spill = _Spill(directory, "left", on, partitions)
+        left_columns = None
+        for chunk in left:
+            left_columns = list(chunk.columns) + [ROW_COLUMN]
+            left_spill.add(chunk.assign(**{ROW_COLUMN: range(left_spill.rows, left_spill.rows + len(chunk))}))
+        print(f"  Partitioned {right_spill.rows} build rows and {left_spill.rows} probe rows")
+        if left_columns is None:
+            return
+
+        for p in range(partitions):
+            probe = left_spill.load(p, left_columns)
+            if not len(probe):
+                continue
+            table = right_spill.load(p, columns)
+            if frame_mb(table) > memory_limit_mb:
+                print(f"  Warning: partition {p} holds {frame_mb(table):.0f} MB of build rows, over the "
+                      f"{memory_limit_mb} MB limit (raise `partitions`)")
+            joined = probe.merge(table, on=on, how=how)
+            if len(joined):
+                yield joined
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _record_columns(chunks, columns):
+    """Yields `chunks` unchanged, filling `columns` from the first one."""
+    for chunk in chunks:
+        if not columns:
+            columns.extend(chunk.columns)
+        yield chunk
+
+
+def join_tables(left, right, on="nct_id", how="inner", memory_limit_mb=JOIN_MEMORY_MB,
+                partitions=SPILL_PARTITIONS, spill_dir=None):
+    """
+    hash_join collected into one DataFrame, in left-side order. An empty
+    result keeps the joined columns, so callers can still select them.
+    """
+    left_columns, right_columns = [], []
+    chunks = list(hash_join(_record_columns(left, left_columns), _record_columns(right, right_columns),
+                            on=on, how=how, memory_limit_mb=memory_limit_mb,
+                            partitions=partitions, spill_dir=spill_dir))
+    if not chunks:
+        if on in left_columns and on in right_columns:
+            # Let merge name the columns (suffixes included) exactly as a non-empty join would
+            return pd.DataFrame(columns=left_columns).merge(pd.DataFrame(columns=right_columns), on=on, how=how)
+        return pd.DataFrame(columns=left_columns + [c for c in right_columns if c not in left_columns])
+    df = pd.concat(chunks, ignore_index=True)
+    if ROW_COLUMN in df.columns:
+        df = df.sort_values(ROW_COLUMN, kind="stable").drop(columns=ROW_COLUMN).reset_index(drop=True)
+    return df
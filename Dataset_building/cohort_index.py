@@ -0,0 +1,396 @@
+"""
+Cohort queries over precomputed categorical indexes.
+
+assign_taxonomy and analyze_reasons select interventional + terminated +
+treatment trials, and prepare_pilot_data selects Phase II/III trials of the
+unclear categories, by comparing whole string columns (and matching phases
+with `str.contains('PHASE2')`) on every run. This module encodes each
+COHORT_FIELDS column once as integer codes over its distinct values:
+
+    nct_ids                     one entry per trial (row order of the index)
+    codes[field]                int16/int32 per trial, -1 = missing
+    values[field]               code -> value
+
+A query turns each `field = value` test into a bitmap (numpy.packbits of the
+matching codes, cached per test) and combines them with bitwise and/or/not,
+so a filter over the whole snapshot takes milliseconds and returns `nct_id`s.
+
+Expressions:
+
+    study_type = INTERVENTIONAL and overall_status = TERMINATED and primary_purpose = TREATMENT
+    phase in (PHASE2, PHASE3) and termination_category in (Unknown, "Other/Unclear")
+    not (medical_field = Oncology or medical_field = null)
+
+- values are matched case-insensitively; quote values with spaces, commas or
+  parentheses ("Infectious Disease");
+- `phase` is multi-valued: `phase = PHASE2` also matches PHASE1/PHASE2 and
+  PHASE2/PHASE3;
+- `null` matches trials where the field is missing; `!=` and `not in` are the
+  plain negation, so they include missing values;
+- an unknown field is an error, a value that never occurs matches nothing.
+
+The snapshot index is built from the trial store (trial_store.py), which
+already holds every field, including the computed `termination_category`
+(null unless overall_status is TERMINATED) and `medical_field`. `CohortIndex.from_frame` indexes any DataFrame with these
+columns instead (e.g. the enriched ground truth).
+
+Usage:
+    python cohort_index.py --build
+    python cohort_index.py "phase in (PHASE2, PHASE3) and termination_category = Safety" --count
+    python cohort_index.py "overall_status = TERMINATED" --by termination_category
+    python cohort_index.py --values phase
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from trial_store import DATA_DIR, RECORD_VERSION, STORE_PATH, TrialStore, snapshot_signature
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+INDEX_PATH = os.path.join(BASE_DIR, "Indexes", "cohort_index.npz")
+
+# Configuration
+COHORT_FIELDS = ("study_type", "overall_status", "primary_purpose", "phase", "termination_category", "medical_field")
+MULTI_VALUE_FIELDS = {"phase": "/"} # Field -> separator of combined values (PHASE1/PHASE2)
+
+TOKEN_RE = re.compile(r'\s*(?:(?P<punct>[(),]|!=|=)|"(?P<quoted>(?:[^"]|"")*)"|(?P<word>[^\s(),=!"]+))')
+KEYWORDS = {"and", "or", "not", "in", "null"}
+
+
+def _code_dtype(n_values):
+    return np.int16 if n_values < np.iinfo(np.int16).max else np.int32
+
+
+def _clean(value):
+    """Stripped string, or None for missing / empty values."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+class CohortIndex:
+    """Integer-coded categorical columns with cached bitmaps. Read-only once built."""
+
+    def __init__(self, nct_ids, codes, values, meta=None):
+        self.nct_ids = np.asarray(nct_ids)
+        self.codes = codes
+        self.values = values
+        self.meta = meta or {}
+        self.size = len(self.nct_ids)
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        self._bitmaps = {}
+        self._ids = None
+
+    @classmethod
+    def from_columns(cls, nct_ids, columns, meta=None):
+        """Index from {field: sequence of values}, aligned with nct_ids."""
+        codes, values = {}, {}
+        for field, column in columns.items():
+            lookup = {}
+            encoded = [lookup.setdefault(v, len(lookup)) if v is not None else -1 for v in map(_clean, column)]
+            values[field] = list(lookup)
+            codes[field] = np.array(encoded, dtype=_code_dtype(len(lookup)))
+        return cls(np.array([str(i) for i in nct_ids], dtype=bytes), codes, values, meta)
+
+    @classmethod
+    def from_frame(cls, df, fields=COHORT_FIELDS, id_col="nct_id"):
+        """Index over the rows of a DataFrame (fields it lacks are skipped)."""
+        present = [f for f in fields if f in df.columns]
+        return cls.from_columns(df[id_col].tolist(), {f: df[f].tolist() for f in present})
+
+    @classmethod
+    def load(cls, index_path=INDEX_PATH):
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Cohort index not found: {index_path} (build it with cohort_index.py --build)")
+        with np.load(index_path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            codes = {f: data[f"codes__{f}"] for f in meta["fields"]}
+            values = {f: data[f"values__{f}"].tolist() for f in meta["fields"]}
+            return cls(data["nct_ids"], codes, values, meta)
+
+    def save(self, index_path=INDEX_PATH):
+        """Writes the index as one .npz file (renamed into place when complete)."""
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        meta = dict(self.meta, fields=list(self.codes), n_trials=self.size)
+        arrays = {"nct_ids": self.nct_ids, "meta": np.array(json.dumps(meta))}
+        for field in self.codes:
+            arrays[f"codes__{field}"] = self.codes[field]
+            arrays[f"values__{field}"] = np.array(self.values[field], dtype=str)
+        tmp_path = index_path + ".building"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, index_path)
+
+    def is_current(self, source=DATA_DIR):
+        """True if the index was built from the snapshot currently in `source` (and a current store)."""
+        snapshot = self.meta.get("snapshot", {})
+        if self.meta.get("record_version") != RECORD_VERSION:
+            return False
+        return bool(snapshot) and snapshot_signature(source, list(snapshot)) == snapshot
+
+    def __len__(self):
+        return self.size
+
+    def _check_field(self, field):
+        if field not in self.codes:
+            raise ValueError(f"Unknown field '{field}'; indexed fields are {list(self.codes)}")
+
+    def matching_codes(self, field, value):
+        """Codes of `field` that `field = value` matches (-1 for null)."""
+        self._check_field(field)
+        if value is None:
+            return [-1]
+        target = value.strip().upper()
+        sep = MULTI_VALUE_FIELDS.get(field)
+        return [code for code, v in enumerate(self.values[field])
+                if v.upper() == target or (sep and target in (t.strip() for t in v.upper().split(sep)))]
+
+    def bitmap(self, field, value):
+        """Packed bitmap of the trials where `field = value` (cached)."""
+        key = (field, None if value is None else value.strip().upper())
+        if key not in self._bitmaps:
+            codes = self.matching_codes(field, value)
+            column = self.codes[field]
+            if len(codes) == 1:
+                hits = column == codes[0]
+            else:
+                hits = np.isin(column, codes)
+            self._bitmaps[key] = np.packbits(hits)
+        return self._bitmaps[key]
+
+    def bits(self, expr):
+        """Packed bitmap of an expression (see module docstring)."""
+        return _Parser(self, expr).parse()
+
+    def mask(self, expr):
+        """Boolean array over the index rows."""
+        return np.unpackbits(self.bits(expr), count=self.size).astype(bool)
+
+    def ids(self, bits):
+        """Set of nct_ids whose bit is set."""
+        if self._ids is None:
+            # Decoded once: picking str objects is much faster than decoding each result
+            self._ids = self.nct_ids.astype(str).astype(object)
+        return set(self._ids[np.flatnonzero(np.unpackbits(bits, count=self.size))])
+
+    def query(self, expr):
+        """Set of nct_ids matching the expression."""
+        return self.ids(self.bits(expr))
+
+    def count(self, expr):
+        return int(np.unpackbits(self.bits(expr), count=self.size).sum())
+
+    def where(self, **criteria):
+        """query() from keyword criteria: a list means any of its values; all criteria must hold."""
+        bits = self._all
+        for field, value in criteria.items():
+            options = value if isinstance(value, (list, tuple, set)) else [value]
+            any_bits = np.zeros_like(self._all)
+            for option in options:
+                any_bits |= self.bitmap(field, option)
+            bits = bits & any_bits
+        return self.ids(bits)
+
+    def counts(self, field, expr=None):
+        """{value: trials} of `field` inside the cohort (all trials when expr is None), largest first."""
+        self._check_field(field)
+        column = self.codes[field]
+        if expr is not None:
+            column = column[self.mask(expr)]
+        tally = np.bincount(column.astype(np.int64) + 1, minlength=len(self.values[field]) + 1)
+        result = {value: int(n) for value, n in zip(self.values[field], tally[1:]) if n}
+        if tally[0]:
+            result[None] = int(tally[0])
+        return dict(sorted(result.items(), key=lambda item: -item[1]))
+
+
+class _Parser:
+    """
+    Recursive descent over the expression, evaluating bitmaps as it goes:
+
+        expr   := term ("or" term)*
+        term   := factor ("and" factor)*
+        factor := "not" factor | "(" expr ")" | field ("=" | "!=") value | field ["not"] "in" "(" value ("," value)* ")"
+        value  := word | "quoted" | null
+    """
+
+    def __init__(self, index, text):
+        self.index = index
+        self.text = text
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    def _tokenize(self, text):
+        tokens, pos = [], 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise ValueError(f"Cannot parse '{text[pos:]}' in cohort expression: {text}")
+            if match.group("punct"):
+                tokens.append(("punct", match.group("punct")))
+            elif match.group("quoted") is not None:
+                tokens.append(("value", match.group("quoted").replace('""', '"')))
+            else:
+                word = match.group("word")
+                tokens.append(("keyword", word.lower()) if word.lower() in KEYWORDS else ("word", word))
+            pos = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _take(self, kind=None, text=None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (text and token[1] != text):
+            expected = text or kind or "more input"
+            found = token[1] if token[0] else "end of expression"
+            raise ValueError(f"Expected {expected}, found {found} in cohort expression: {self.text}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        bits = self._expr()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos][1]}' in cohort expression: {self.text}")
+        return bits
+
+    def _expr(self):
+        bits = self._term()
+        while self._peek() == ("keyword", "or"):
+            self.pos += 1
+            bits = bits | self._term()
+        return bits
+
+    def _term(self):
+        bits = self._factor()
+        while self._peek() == ("keyword", "and"):
+            self.pos += 1
+            bits = bits & self._factor()
+        return bits
+
+    def _not(self, bits):
+        return ~bits & self.index._all # Padding bits stay clear
+
+    def _factor(self):
+        token = self._peek()
+        if token == ("keyword", "not"):
+            self.pos += 1
+            return self._not(self._factor())
+        if token == ("punct", "("):
+            self.pos += 1
+            bits = self._expr()
+            self._take("punct", ")")
+            return bits
+
+        field = self._take("word")[1]
+        op = self._peek()
+        if op in (("punct", "="), ("punct", "!=")):
+            self.pos += 1
+            bits = self.index.bitmap(field, self._value())
+            return self._not(bits) if op[1] == "!=" else bits
+        negate = op == ("keyword", "not")
+        if negate:
+            self.pos += 1
+        self._take("keyword", "in")
+        self._take("punct", "(")
+        bits = self.index.bitmap(field, self._value())
+        while self._peek() == ("punct", ","):
+            self.pos += 1
+            bits = bits | self.index.bitmap(field, self._value())
+        self._take("punct", ")")
+        return self._not(bits) if negate else bits
+
+    def _value(self):
+        kind, text = self._take()
+        if (kind, text) == ("keyword", "null"):
+            return None
+        if kind not in ("word", "value"):
+            raise ValueError(f"Expected a value, found {text} in cohort expression: {self.text}")
+        return text
+
+
+def build_index(store_path=STORE_PATH, index_path=INDEX_PATH, fields=COHORT_FIELDS):
+    """Indexes every trial of the trial store."""
+    start = time.time()
+    store = TrialStore(store_path)
+    nct_ids, columns = [], {f: [] for f in fields}
+    for record in store.iter_records():
+        nct_ids.append(record["nct_id"])
+        for field in fields:
+            columns[field].append(record.get(field))
+    meta = {
+        "snapshot": store.meta.get("snapshot", {}),
+        "store_built_at": store.meta.get("built_at"),
+        "record_version": store.meta.get("record_version"),
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    store.close()
+    index = CohortIndex.from_columns(nct_ids, columns, meta)
+    index.save(index_path)
+    sizes = ", ".join(f"{f} {len(index.values[f])}" for f in fields)
+    print(f"Indexed {len(index)} trials in {index_path} (distinct values: {sizes}; {time.time() - start:.0f}s)")
+    return index
+
+
+def open_cohort_index(source=DATA_DIR, index_path=INDEX_PATH):
+    """Loads the index if it exists and matches the current snapshot, else returns None."""
+    if not os.path.exists(index_path):
+        return None
+    index = CohortIndex.load(index_path)
+    if not index.is_current(source):
+        print(f"Cohort index {index_path} was built from a different snapshot or store; ignoring it (rebuild with --build).")
+        return None
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort queries over categorical trial fields")
+    parser.add_argument("expr", nargs="?", help="e.g. 'phase in (PHASE2, PHASE3) and termination_category = Safety'")
+    parser.add_argument("--build", action="store_true", help="Build (or rebuild) the index from the trial store")
+    parser.add_argument("--count", action="store_true", help="Only print the number of matching trials")
+    parser.add_argument("--by", metavar="FIELD", help="Print the cohort's counts per value of FIELD")
+    parser.add_argument("--values", metavar="FIELD", help="Print the distinct values of FIELD")
+    parser.add_argument("--output", help="Write the matching nct_ids to this file, one per line")
+    parser.add_argument("--store", default=STORE_PATH)
+    parser.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.build:
+        build_index(args.store, args.index)
+    if not (args.expr or args.values or args.by):
+        if not args.build:
+            parser.error("give an expression, --values, --by or --build")
+        return
+
+    index = CohortIndex.load(args.index)
+    start = time.perf_counter()
+    if args.values:
+        for value, n in index.counts(args.values).items():
+            print(f"{n:>9}  {'null' if value is None else value}")
+    elif args.by:
+        for value, n in index.counts(args.by, args.expr).items():
+            print(f"{n:>9}  {'null' if value is None else value}")
+    elif args.count:
+        print(f"{index.count(args.expr)} of {len(index)} trials match")
+    else:
+        ids = sorted(index.query(args.expr))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.writelines(f"{i}\n" for i in ids)
+            print(f"Wrote {len(ids)} nct_ids to {args.output}")
+        else:
+            print("\n".join(ids))
+            print(f"\n{len(ids)} trials match")
+    print(f"Query time: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
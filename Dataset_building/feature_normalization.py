@@ -0,0 +1,198 @@
+"""
+Vectorized normalization of the LLM input fields into a typed feature table.
+
+Driven by Prediction/Input_fields_for_LLM_prediction-Input.csv: each row's
+`Normalization` column (falling back to `Variable type`) picks the rule.
+
+    age_years  "18 Years", "45Years", "6 Months", "2 Weeks", "N/A"  -> float years
+    boolean    t/f, true/false, yes/no, 1/0                          -> pandas boolean
+    category   case, spacing and separator variants ("Phase 1/Phase 2",
+               "phase1/phase2") mapped onto the listed `Categories`  -> category
+    int        counts ("12", "12.0", " 12 ")                         -> nullable Int64
+    text       stripped string                                       -> string
+
+Every rule runs once per distinct value of a column and is broadcast back to
+the rows with `pd.factorize`, so millions of rows cost about as much as their
+handful of distinct strings; there is no per-row Python.
+
+Usage:
+    python feature_normalization.py --input pilot_prediction_dataset.csv --output features.csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+INPUT_FIELDS_PATH = os.path.join(BASE_DIR, "Prediction", "Input_fields_for_LLM_prediction-Input.csv")
+
+# Configuration
+CHUNK_SIZE = 200000 # Rows per chunk in normalize_csv
+
+# Unit -> years
+AGE_UNITS = {
+    "year": 1.0, "month": 1 / 12, "week": 7 / 365.25, "day": 1 / 365.25,
+    "hour": 1 / (365.25 * 24), "minute": 1 / (365.25 * 24 * 60),
+}
+AGE_RE = r'^\s*(\d+(?:\.\d+)?)\s*(year|month|week|day|hour|minute)s?\s*$'
+TRUE_VALUES = {"t", "true", "yes", "y", "1"}
+FALSE_VALUES = {"f", "false", "no", "n", "0"}
+TYPE_DEFAULTS = {"categorical": "category", "numeric": "int", "binary": "boolean", "text": "text"}
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def load_field_specs(mapping_csv):
+    """
+    Reads the input-field mapping into a list of specs:
+    {source, name, normalization, categories, aggregation}.
+    """
+    df_map = pd.read_csv(mapping_csv)
+    df_map.columns = [c.strip() for c in df_map.columns]
+    specs = []
+    for row in df_map.to_dict("records"):
+        source, name = _clean(row.get("Source file")), _clean(row.get("Variable name"))
+        if not source or not name:
+            continue
+        normalization = _clean(row.get("Normalization")).lower()
+        if not normalization:
+            normalization = TYPE_DEFAULTS.get(_clean(row.get("Variable type")).lower(), "text")
+        categories = [c.strip() for c in _clean(row.get("Categories")).splitlines() if c.strip()]
+        specs.append({"source": source, "name": name, "normalization": normalization, "categories": categories,
+                      "aggregation": _clean(row.get("Aggregation"))})
+    return specs
+
+
+def age_to_years(values):
+    """'18 Years' / '45Years' / '6 Months' / 'N/A' -> float years (NaN if unparseable)."""
+    parts = values.astype(str).str.lower().str.extract(AGE_RE)
+    return pd.to_numeric(parts[0], errors="coerce") * parts[1].map(AGE_UNITS)
+
+
+def to_boolean(values):
+    """t/f, true/false, yes/no, 1/0 -> True/False (None otherwise)."""
+    lowered = values.astype(str).str.strip().str.lower()
+    return lowered.map(lambda v: True if v in TRUE_VALUES else (False if v in FALSE_VALUES else None))
+
+
+def _category_key(values):
+    """Case/spacing/separator-insensitive key: 'Phase 1/Phase 2' -> 'PHASE1PHASE2'."""
+    return values.astype(str).str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+
+
+def canonicalize_category(values, categories=()):
+    """
+    Maps variants onto the canonical `categories`. Values that match none are
+    upper-cased with '_' separators and kept, so nothing is silently dropped.
+    """
+    categories = list(categories)
+    canonical = dict(zip(_category_key(pd.Series(categories, dtype=object)), categories))
+    fallback = values.astype(str).str.strip().str.upper().str.replace(r'[\s\-]+', '_', regex=True)
+    return _category_key(values).map(canonical).fillna(fallback)
+
+
+def to_int(values):
+    """Counts -> integers (non-integral or unparseable values become NaN)."""
+    numbers = pd.to_numeric(values.astype(str).str.strip(), errors="coerce")
+    return numbers.where(numbers == np.round(numbers))
+
+
+def to_text(values):
+    return values.astype(str).str.strip()
+
+
+CONVERTERS = {"age_years": age_to_years, "boolean": to_boolean, "int": to_int, "text": to_text}
+DTYPES = {"age_years": "float64", "boolean": "boolean", "int": "Int64", "text": "string"}
+
+
+def normalize_column(raw, spec):
+    """
+    Normalizes one column. Each rule runs once per distinct value (pd.factorize)
+    and the result is broadcast back to the rows.
+
+    Returns (typed Series, number of non-empty values that could not be converted).
+    """
+    rule = spec["normalization"]
+    codes, uniques = pd.factorize(raw)
+    uniques = pd.Series(uniques, dtype=object)
+    stripped = uniques.astype(str).str.strip()
+    present = (stripped != "").to_numpy(dtype=bool)
+    if rule == "age_years":
+        # AACT writes 'N/A' for "no limit"; that is missing, not a failure
+        present = present & (stripped.str.upper() != "N/A").to_numpy(dtype=bool)
+
+    if rule == "category":
+        converted = canonicalize_category(uniques, spec["categories"])
+        failed = present & ~converted.isin(spec["categories"]).to_numpy(dtype=bool) if spec["categories"] else np.zeros_like(present)
+        labels = np.append(converted.to_numpy(dtype=object), np.nan)[codes]
+        known = list(spec["categories"]) + sorted(set(converted) - set(spec["categories"]))
+        typed = pd.Series(pd.Categorical(labels, categories=known), index=raw.index)
+    else:
+        converted = CONVERTERS.get(rule, to_text)(uniques)
+        failed = present & converted.isna().to_numpy(dtype=bool)
+        if rule in ("age_years", "int"):
+            values = np.append(converted.to_numpy(dtype="float64"), np.nan)[codes]
+        else:
+            values = np.append(converted.to_numpy(dtype=object), None)[codes]
+        typed = pd.Series(values, index=raw.index).astype(DTYPES.get(rule, "string"))
+    # Rows whose value is a failed distinct value
+    n_failed = int(np.append(failed, False)[codes].sum())
+    return typed, n_failed
+
+
+def normalize_features(df, specs):
+    """
+    Returns (typed DataFrame, report). Ages are written to `<name>_years` and
+    the raw strings dropped; other fields are converted in place. The report
+    counts, per field, non-empty values that could not be converted (for
+    categories: values outside the listed `Categories`).
+    """
+    out = df.copy()
+    report = {}
+    for spec in specs:
+        name = spec["name"]
+        if name not in out.columns:
+            continue
+        typed, n_failed = normalize_column(out[name], spec)
+        if spec["normalization"] == "age_years":
+            out = out.drop(columns=[name])
+            name = f"{name}_years"
+        out[name] = typed
+        if n_failed:
+            report[name] = n_failed
+    return out, report
+
+
+def normalize_csv(input_csv, output_csv, mapping_csv, chunksize=CHUNK_SIZE):
+    """Streams a CSV through `normalize_features` chunk by chunk."""
+    specs = load_field_specs(mapping_csv)
+    totals, rows = {}, 0
+    for i, chunk in enumerate(pd.read_csv(input_csv, dtype=str, chunksize=chunksize)):
+        typed, report = normalize_features(chunk, specs)
+        typed.to_csv(output_csv, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+        rows += len(typed)
+        for key, count in report.items():
+            totals[key] = totals.get(key, 0) + count
+    print(f"Normalized {rows} rows -> {output_csv}")
+    for key, count in sorted(totals.items()):
+        print(f"  {key}: {count} values not converted")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize LLM input fields into a typed feature table")
+    parser.add_argument("--input", required=True, help="CSV with raw AACT field values (one row per trial)")
+    parser.add_argument("--output", required=True, help="Normalized CSV to write")
+    parser.add_argument("--mapping", default=INPUT_FIELDS_PATH, help="Input-field mapping CSV")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    normalize_csv(args.input, args.output, args.mapping, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,48 @@
 """
 Find specific examples where brief_summary contains termination reasons.
 Looking for cases where the brief_summary explicitly mentions why a trial was stopped.
+
+With --all, queries the full-text index (text_index.py) over every trial in
+CT.gov instead of scanning terminated_ground_truth_enriched.csv.
 """
 
-import pandas as pd
+import argparse
+import sys
 
-# Load data
-df = pd.read_csv('terminated_ground_truth_enriched.csv')
+from ground_truth_io import read_ground_truth, resolve_ground_truth
+from text_scan import TERMINATION_PATTERNS, scan_termination_mentions
 
-# Define patterns that indicate ACTUAL termination reasons in brief_summary
-# (not just study objectives like "assess safety" or "evaluate efficacy")
-termination_patterns = [
-    r'study was terminated',
-    r'trial was terminated',
-    r'study was stopped',
-    r'trial was stopped',
-    r'study was discontinued',
-    r'trial was discontinued',
-    r'study was closed',
-    r'study was halted',
-    r'terminated due to',
-    r'stopped due to',
-    r'discontinued due to',
-    r'closed due to',
-    r'terminated because',
-    r'stopped because',
-    r'terminated early',
-    r'stopped early',
-    r'discontinued early',
-    r'prematurely terminated',
-    r'prematurely stopped',
-    r'trial closed',
-    r'enrollment was stopped',
-    r'recruitment was stopped',
-    r'terminated for',
-    r'stopped for',
-]
+parser = argparse.ArgumentParser(description="Trials whose brief_summary states why they were stopped")
+parser.add_argument("--all", action="store_true", help="Search all of CT.gov via the full-text index")
+parser.add_argument("--limit", type=int, default=10, help="Examples to show with --all")
+args = parser.parse_args()
+
+if args.all:
+    from text_index import TextIndex, termination_query
 
-# Combine patterns
-combined_pattern = '|'.join(termination_patterns)
+    index = TextIndex()
+    query = termination_query()
+    n_matches = index.count(query, fields=["brief_summary"])
+    print(f"Found {n_matches} of {len(index)} trials where brief_summary contains termination reasons")
+    print("=" * 80)
+    for row in index.search(query, limit=args.limit, fields=["brief_summary"]):
+        print(f"\nNCT ID: {row['nct_id']}")
+        print(f"  >>> {row['snippet']}")
+    index.close()
+    sys.exit(0)
+
+# Load data (only the columns shown below; detailed_description is never read)
+df = read_ground_truth(resolve_ground_truth('terminated_ground_truth_enriched.csv'),
+                       columns=['nct_id', 'phase', 'medical_field', 'termination_category', 'why_stopped', 'brief_summary'])
+
+# Single pass over the column: pattern hit matrix + sentence spans (see text_scan.py)
+# Patterns indicate ACTUAL termination reasons in brief_summary
+# (not just study objectives like "assess safety" or "evaluate efficacy")
+termination_patterns = TERMINATION_PATTERNS
+scan = scan_termination_mentions(df['brief_summary'])
 
 # Find matches
-matches = df[df['brief_summary'].str.contains(combined_pattern, case=False, na=False, regex=True)]
+matches = df[scan.any_hit(termination_patterns)]
 
 print(f"Found {len(matches)} trials where brief_summary contains termination reasons")
 print("=" * 80)
@@ -59,13 +60,10 @@ for idx, row in matches.head(10).iterrows():
     
     # Find and highlight the termination-related part
     summary = str(row['brief_summary'])
-    # Try to extract the sentence containing the termination info
-    import re
-    for pattern in termination_patterns:
-        match = re.search(r'[^.]*' + pattern + r'[^.]*\.', summary, re.IGNORECASE)
-        if match:
-            print(f"  >>> {match.group(0).strip()}")
-            break
+    # Sentence containing the termination info (span recorded during the scan)
+    sentence = scan.first_sentence(idx, summary, termination_patterns)
+    if sentence:
+        print(f"  >>> {sentence}")
     else:
         # If no sentence match, show first 500 chars
         print(f"  {summary[:500]}...")
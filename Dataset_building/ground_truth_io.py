@@ -0,0 +1,195 @@
+"""
+Partitioned Parquet storage for the enriched ground truth.
+
+terminated_ground_truth_enriched.csv is one CSV, so every reader parses all
+of it, brief_summary and detailed_description included, only to keep a few
+phases or categories. `write_ground_truth_dataset` stores the same rows as a
+Parquet dataset next to the CSV (`terminated_ground_truth_enriched.parquet/`):
+
+    fields/medical_field=<value>/phase=<value>/*.parquet   every other column
+    text/medical_field=<value>/phase=<value>/*.parquet     nct_id + TEXT_COLUMNS
+    _dataset.json                                          column order, row count, content hash
+
+Both halves are hive-partitioned by PARTITION_COLS (values are URI-encoded in
+the folder names, so PHASE1/PHASE2 is `phase=PHASE1%2FPHASE2`; missing values
+go to `__HIVE_DEFAULT_PARTITION__`). A reader that filters on medical_field or
+phase opens only the matching folders, and the text files are opened only
+when a text column is requested.
+
+`read_ground_truth(path, columns, where)` reads either format, so readers do
+not care which one exists: with a CSV it reads `usecols` and filters in
+pandas; with a dataset it pushes `columns` and `where` into pyarrow and returns
+the rows in the original CSV order with the original column order.
+`resolve_ground_truth(csv_path)` returns the dataset when one has been written
+next to the CSV.
+
+pyarrow is imported on first use (only the Parquet paths need it).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+TEXT_COLUMNS = ["brief_summary", "detailed_description"] # Stored apart from the other columns
+PARTITION_COLS = ["medical_field", "phase"]
+ROW_COLUMN = "_row" # Original CSV row order
+FIELDS_DIR = "fields"
+TEXT_DIR = "text"
+META_FILE = "_dataset.json"
+# pd.read_csv's default NA strings: stored as nulls so both formats read back the same values
+CSV_NA_VALUES = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+                 "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+
+
+def dataset_path(csv_path):
+    """terminated_ground_truth_enriched.csv -> terminated_ground_truth_enriched.parquet"""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def is_dataset(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def resolve_ground_truth(csv_path):
+    """The Parquet dataset written next to `csv_path` if there is one, else `csv_path`."""
+    candidate = dataset_path(csv_path)
+    return candidate if is_dataset(candidate) else csv_path
+
+
+def _partitioning(partition_cols):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(pa.schema([(c, pa.string()) for c in partition_cols]), flavor="hive")
+
+
+def load_meta(path):
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_ground_truth_dataset(df, path, partition_cols=PARTITION_COLS, text_columns=TEXT_COLUMNS):
+    """Writes `df` as the partitioned dataset at `path` (replaced atomically when complete)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partition_cols = [c for c in partition_cols if c in df.columns]
+    text_columns = [c for c in text_columns if c in df.columns]
+    partitioning = _partitioning(partition_cols)
+
+    tmp_path = path + ".building"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    frame = df.reset_index(drop=True).assign(**{ROW_COLUMN: range(len(df))})
+    for col in frame.columns:
+        if not (pd.api.types.is_object_dtype(frame[col]) or pd.api.types.is_string_dtype(frame[col])):
+            continue
+        values = frame[col].astype(object)
+        frame[col] = values.where(values.notna() & ~values.isin(CSV_NA_VALUES), None)
+    # Partition values are strings in the folder names
+    for col in partition_cols:
+        frame[col] = frame[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+    halves = {
+        FIELDS_DIR: [c for c in frame.columns if c not in text_columns],
+        TEXT_DIR: ["nct_id", ROW_COLUMN] + text_columns + partition_cols,
+    }
+    for name, columns in halves.items():
+        if name == TEXT_DIR and not text_columns:
+            continue
+        table = pa.Table.from_pandas(frame[columns], preserve_index=False)
+        ds.write_dataset(table, os.path.join(tmp_path, name), format="parquet", partitioning=partitioning,
+                         basename_template="part-{i}.parquet")
+
+    meta = {
+        "columns": list(df.columns),
+        "text_columns": text_columns,
+        "partition_cols": partition_cols,
+        "n_rows": len(df),
+        # Changes whenever the data does, so run_pipeline can fingerprint this file alone
+        "content_sha256": hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest(),
+    }
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def remove_dataset(path):
+    """Deletes a dataset left from an earlier run (it would shadow a newer CSV)."""
+    if is_dataset(path):
+        shutil.rmtree(path)
+
+
+def ground_truth_columns(path):
+    """Column names, without reading any rows."""
+    if is_dataset(path):
+        return load_meta(path)["columns"]
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def _where_mask(df, where):
+    mask = pd.Series(True, index=df.index)
+    for column, allowed in where.items():
+        allowed = allowed if isinstance(allowed, (list, tuple, set)) else [allowed]
+        mask &= df[column].isin(allowed)
+    return mask
+
+
+def _where_expression(where):
+    import pyarrow.compute as pc
+
+    expression = None
+    for column, allowed in where.items():
+        allowed = list(allowed) if isinstance(allowed, (list, tuple, set)) else [allowed]
+        test = pc.field(column).isin([v for v in allowed if v is not None])
+        if None in allowed:
+            test = test | pc.field(column).is_null()
+        expression = test if expression is None else expression & test
+    return expression
+
+
+def read_ground_truth(path, columns=None, where=None):
+    """
+    Reads the enriched ground truth from a CSV or a Parquet dataset.
+
+    Args:
+        columns: columns to return (None = all); nct_id is always included.
+        where: {column: value or list of values} rows must match (None allowed
+            for missing values). Partition columns prune folders, others are
+            filtered by pyarrow while reading.
+    """
+    where = where or {}
+    if columns is not None:
+        columns = list(dict.fromkeys(["nct_id"] + list(columns)))
+    if not is_dataset(path):
+        usecols = None if columns is None else list(dict.fromkeys(columns + list(where)))
+        df = pd.read_csv(path, usecols=usecols)
+        if where:
+            df = df[_where_mask(df, where)].reset_index(drop=True)
+        return df if columns is None else df[columns]
+
+    import pyarrow.dataset as ds
+
+    meta = load_meta(path)
+    partitioning = _partitioning(meta["partition_cols"])
+    wanted = meta["columns"] if columns is None else columns
+    unknown = [c for c in list(wanted) + list(where) if c not in meta["columns"]]
+    if unknown:
+        raise KeyError(f"Columns {unknown} not in ground truth dataset {path}")
+    text_wanted = [c for c in wanted if c in meta["text_columns"]]
+    field_filter = _where_expression(where) if where else None
+
+    fields = ds.dataset(os.path.join(path, FIELDS_DIR), format="parquet", partitioning=partitioning)
+    field_cols = [c for c in wanted if c not in meta["text_columns"]] + [ROW_COLUMN]
+    df = fields.to_table(columns=field_cols, filter=field_filter).to_pandas()
+    if text_wanted:
+        # Text filter: partition columns only (the others live in the fields files), then align on the row number
+        text_where = {c: v for c, v in where.items() if c in meta["partition_cols"]}
+        text = ds.dataset(os.path.join(path, TEXT_DIR), format="parquet", partitioning=partitioning)
+        text_df = text.to_table(columns=[ROW_COLUMN] + text_wanted,
+                                filter=_where_expression(text_where) if text_where else None).to_pandas()
+        df = df.merge(text_df, on=ROW_COLUMN, how="left")
+    df = df.sort_values(ROW_COLUMN, kind="stable").reset_index(drop=True)
+    return df[list(wanted)]
@@ -0,0 +1,342 @@
+"""
+Cached pipeline runner for the ground-truth -> prediction chain.
+
+Declares every stage with its inputs, outputs, code and parameters:
+
+    taxonomy -> enrich -> promote -> pilot -> prompts -> predict
+
+Before running a stage its inputs are fingerprinted (data files, the stage's
+code files, prompt templates and CLI parameters). If the fingerprint matches
+the one recorded after the last successful run and all outputs still exist,
+the stage is skipped. Downstream stages see upstream outputs as inputs, so a
+change propagates only as far as it actually changes files: editing the
+prediction prompt reruns `predict` only, without re-reading AACT.
+
+Fingerprints:
+- Files up to HASH_SIZE_LIMIT bytes are hashed by content (SHA-256), cached by
+  (size, mtime) so unchanged files are never re-read.
+- Larger files (raw AACT tables) are fingerprinted by size + mtime.
+
+Usage:
+    python run_pipeline.py                 # run whatever is stale
+    python run_pipeline.py --dry-run       # show what would run
+    python run_pipeline.py --force enrich  # rerun a stage and everything after it
+    python run_pipeline.py --only prompts  # run a single stage (if stale)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from aact_source import table_path
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data") # Same AACT source as the Dataset_building scripts (folder, .zip, or compressed tables)
+STATE_FILE = os.path.join(BASE_DIR, ".pipeline_state.json")
+
+# Configuration
+HASH_SIZE_LIMIT = 256 * 1024 * 1024 # Content-hash files up to 256 MB; stat-fingerprint anything larger
+
+
+def code(*parts):
+    return os.path.join(REPO_DIR, *parts)
+
+
+def data(name):
+    # The file that actually backs an AACT table: plain .txt, .txt.gz/.zst, or the snapshot zip
+    return table_path(DATA_DIR, name) or os.path.join(DATA_DIR, name)
+
+
+def base(*parts):
+    return os.path.join(BASE_DIR, *parts)
+
+
+def promote_enriched(src, dst):
+    """Copies the enriched ground truth (and its Parquet dataset, if written) into Final_data_sets/."""
+    from ground_truth_io import dataset_path, is_dataset, remove_dataset
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+    src_dataset, dst_dataset = dataset_path(src), dataset_path(dst)
+    remove_dataset(dst_dataset)
+    if is_dataset(src_dataset):
+        shutil.copytree(src_dataset, dst_dataset)
+
+
+# Stage declarations, in execution order.
+#   script / func : what to run (script is run with its own directory as cwd)
+#   args          : CLI arguments (part of the fingerprint)
+#   inputs        : data files read by the stage
+#   code          : source files and templates whose edits should trigger a rerun
+#   outputs       : files the stage must produce
+#   reset_outputs : archive existing outputs before rerunning when they were started
+#                   under a different fingerprint (for resumable stages that would
+#                   otherwise skip already-processed trials); a rerun under the same
+#                   fingerprint, e.g. after a failed or interrupted run, resumes them
+STAGES = [
+    {
+        "name": "taxonomy",
+        "script": code("Dataset_building", "assign_taxonomy.py"),
+        "inputs": [data("studies.txt"), data("designs.txt"),
+                   data("brief_summaries.txt"), data("detailed_descriptions.txt")],
+        "code": [code("Dataset_building", "assign_taxonomy.py"), code("Dataset_building", "aact_source.py"),
+                 code("Dataset_building", "chunked_join.py")],
+        "outputs": [base("terminated_ground_truth.csv")],
+    },
+    {
+        "name": "enrich",
+        "script": code("Dataset_building", "add_medical_fields.py"),
+        "args": ["--full"],
+        "inputs": [base("terminated_ground_truth.csv"), data("studies.txt"),
+                   data("conditions.txt"), data("browse_conditions.txt")],
+        "code": [code("Dataset_building", "add_medical_fields.py"), code("Dataset_building", "aact_source.py"),
+                 code("Dataset_building", "chunked_join.py"), code("Dataset_building", "ground_truth_io.py")],
+        "outputs": [base("terminated_ground_truth_enriched.csv")],
+    },
+    {
+        "name": "promote",
+        "func": promote_enriched,
+        "args": [base("terminated_ground_truth_enriched.csv"),
+                 base("Final_data_sets", "terminated_ground_truth_enriched.csv")],
+        "inputs": [base("terminated_ground_truth_enriched.csv"),
+                   base("terminated_ground_truth_enriched.parquet", "_dataset.json")],
+        "code": [],
+        "outputs": [base("Final_data_sets", "terminated_ground_truth_enriched.csv")],
+    },
+    {
+        "name": "pilot",
+        "script": code("Dataset_building", "build_pilot_dataset.py"),
+        "inputs": [base("Final_data_sets", "terminated_ground_truth_enriched.csv"),
+                   base("Final_data_sets", "terminated_ground_truth_enriched.parquet", "_dataset.json"),
+                   base("output", "deepseek_extraction_results.csv"),
+                   base("Prediction", "Input_fields_for_LLM_prediction-Input.csv"),
+                   data("studies.txt"), data("designs.txt"), data("eligibilities.txt"),
+                   data("calculated_values.txt"), data("brief_summaries.txt"), data("design_groups.txt"),
+                   data("reported_events.txt"), data("drop_withdrawals.txt"), data("outcome_measurements.txt"),
+                   base("Indexes", "trial_store.sqlite")],
+        "code": [code("Dataset_building", "build_pilot_dataset.py"), code("Dataset_building", "sampling.py"),
+                 code("Dataset_building", "aact_source.py"), code("Dataset_building", "feature_normalization.py"),
+                 code("Dataset_building", "aggregation.py"), code("Dataset_building", "trial_store.py"),
+                 code("Dataset_building", "ground_truth_io.py")],
+        "outputs": [base("Pilot_datasets", "pilot_prediction_dataset.csv")],
+    },
+    {
+        "name": "prompts",
+        "script": code("Prediction", "prepare_llm_input.py"),
+        "inputs": [base("Pilot_datasets", "pilot_prediction_dataset.csv")],
+        "code": [code("Prediction", "prepare_llm_input.py"), code("Prediction", "jsonl_io.py"),
+                 code("Prediction", "fewshot_index.py")],
+        "outputs": [base("Prediction", "pilot_prompts.jsonl")],
+    },
+    {
+        "name": "predict",
+        "script": code("Prediction", "run_predictions.py"),
+        "inputs": [base("Prediction", "pilot_prompts.jsonl")],
+        "code": [code("Prediction", "run_predictions.py"), code("Prediction", "jsonl_io.py"),
+                 code("Prediction", "online_eval.py"), code("Prediction", "Prediction_prompts_instruct.txt"),
+                 code("Prediction", "Prediction_prompts_retrieval.txt"),
+                 code("LLM_client", "retry_policy.py"), code("LLM_client", "streaming.py"),
+                 code("LLM_client", "validation.py"), code("LLM_client", "hedging.py"),
+                 code("LLM_client", "rate_limiter.py"), code("LLM_client", "compact_schema.py")],
+        "outputs": [base("Prediction", "predicted_outcomes", "predictions.jsonl")],
+        "reset_outputs": True,
+    },
+]
+
+
+class Fingerprinter:
+    """Computes file fingerprints, reusing content hashes of unchanged files."""
+
+    def __init__(self, hash_cache):
+        # hash_cache: {path: {"size": int, "mtime_ns": int, "sha256": str}}
+        self.hash_cache = hash_cache
+
+    def file(self, path):
+        if not os.path.exists(path):
+            return "missing"
+        st = os.stat(path)
+        if st.st_size > HASH_SIZE_LIMIT:
+            return f"stat:{st.st_size}:{st.st_mtime_ns}"
+
+        cached = self.hash_cache.get(path)
+        if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return "sha256:" + cached["sha256"]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self.hash_cache[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+        return "sha256:" + digest
+
+    def stage(self, stage):
+        """Combined fingerprint of a stage's inputs, code and parameters."""
+        parts = {
+            "inputs": {p: self.file(p) for p in stage["inputs"]},
+            "code": {p: self.file(p) for p in stage["code"]},
+            "args": stage.get("args", []),
+        }
+        blob = json.dumps(parts, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest(), parts
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {"stages": {}, "hash_cache": {}}
+    with open(STATE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+
+def describe_changes(old_parts, new_parts):
+    """Lists which inputs/code/args changed since the last successful run."""
+    if not old_parts:
+        return ["never run"]
+    changes = []
+    for group in ("inputs", "code"):
+        for path, fp in new_parts[group].items():
+            if old_parts.get(group, {}).get(path) != fp:
+                changes.append(f"{group}: {os.path.basename(path)}")
+    if old_parts.get("args") != new_parts["args"]:
+        changes.append("args")
+    return changes or ["outputs missing"]
+
+
+def archive_outputs(stage):
+    """Moves existing outputs aside so a resumable stage starts fresh."""
+    for path in stage["outputs"]:
+        if os.path.exists(path):
+            root, ext = os.path.splitext(path)
+            archived = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+            os.replace(path, archived)
+            print(f"  Archived previous output to {archived}")
+
+
+def run_stage(stage):
+    if "func" in stage:
+        stage["func"](*stage.get("args", []))
+        return
+    cmd = [sys.executable, stage["script"]] + stage.get("args", [])
+    print(f"  $ {' '.join(cmd)}")
+    subprocess.run(cmd, cwd=os.path.dirname(stage["script"]), check=True)
+
+
+def select_stages(only=None, force=None):
+    names = [s["name"] for s in STAGES]
+    for name in filter(None, [only, force]):
+        if name not in names:
+            raise SystemExit(f"Unknown stage '{name}'. Stages: {', '.join(names)}")
+    forced = set(names[names.index(force):]) if force else set()
+    selected = [s for s in STAGES if only is None or s["name"] == only]
+    return selected, forced
+
+
+def run_pipeline(only=None, force=None, dry_run=False):
+    state = load_state()
+    fingerprinter = Fingerprinter(state.setdefault("hash_cache", {}))
+    stages, forced = select_stages(only, force)
+
+    for stage in stages:
+        name = stage["name"]
+        fingerprint, parts = fingerprinter.stage(stage)
+        previous = state["stages"].get(name, {})
+        outputs_exist = all(os.path.exists(p) for p in stage["outputs"])
+
+        if name not in forced and previous.get("fingerprint") == fingerprint and outputs_exist:
+            print(f"[skip] {name}: up to date")
+            continue
+
+        reasons = ["forced"] if name in forced else describe_changes(previous.get("parts"), parts)
+        print(f"[run]  {name}: {', '.join(reasons)}")
+        if dry_run:
+            continue
+
+        if stage.get("reset_outputs"):
+            # Outputs belong to the fingerprint they were started under (the last success for older state)
+            outputs_fingerprint = previous.get("outputs_fingerprint", previous.get("fingerprint"))
+            if outputs_fingerprint != fingerprint:
+                archive_outputs(stage)
+            else:
+                print("  Resuming existing outputs (same fingerprint)")
+            state["stages"][name] = dict(previous, outputs_fingerprint=fingerprint)
+            save_state(state)
+
+        start = time.time()
+        try:
+            run_stage(stage)
+        except (subprocess.CalledProcessError, OSError) as e:
+            save_state(state)
+            print(f"Stage '{name}' failed: {e}")
+            sys.exit(1)
+
+        missing = [p for p in stage["outputs"] if not os.path.exists(p)]
+        if missing:
+            save_state(state)
+            print(f"Stage '{name}' finished but did not produce: {missing}")
+            sys.exit(1)
+
+        # Record the pre-run fingerprint; outputs are fingerprinted lazily by the next stage.
+        state["stages"][name] = {
+            "fingerprint": fingerprint,
+            "outputs_fingerprint": fingerprint,
+            "parts": parts,
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_s": round(time.time() - start, 1),
+        }
+        save_state(state)
+
+    if not dry_run:
+        save_state(state)
+    print("Pipeline complete.")
+
+
+def pipeline_status(check=False):
+    """
+    One dict per stage: outputs present, last completion time and duration.
+    With `check`, also whether the stage is stale (fingerprints inputs/code;
+    unchanged files reuse cached hashes, so this stays cheap after a run).
+    """
+    state = load_state()
+    fingerprinter = Fingerprinter(state.setdefault("hash_cache", {})) if check else None
+    rows = []
+    for stage in STAGES:
+        previous = state["stages"].get(stage["name"], {})
+        row = {
+            "name": stage["name"],
+            "outputs_exist": all(os.path.exists(p) for p in stage["outputs"]),
+            "completed_at": previous.get("completed_at"),
+            "duration_s": previous.get("duration_s"),
+        }
+        if check:
+            fingerprint, parts = fingerprinter.stage(stage)
+            stale = previous.get("fingerprint") != fingerprint or not row["outputs_exist"]
+            row["changes"] = describe_changes(previous.get("parts"), parts) if stale else []
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached runner for the clinical trials pipeline")
+    parser.add_argument("--only", help="Run a single stage (still skipped if up to date)")
+    parser.add_argument("--force", help="Rerun this stage and all stages after it regardless of cache")
+    parser.add_argument("--dry-run", action="store_true", help="Show which stages would run")
+    args = parser.parse_args()
+    run_pipeline(only=args.only, force=args.force, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Reproducible stratified sampling for pilot dataset construction.
+
+Shared by build_pilot_dataset.py and Pilot_datasets/prepare_pilot_data.py.
+
+- Strata are any combination of columns (e.g. `termination_category`, `phase`,
+  `medical_field`); missing values form their own 'NA' stratum.
+- `allocate` turns stratum sizes into exact per-stratum counts that always sum
+  to the requested size (or the universe size if smaller):
+    * "proportional": largest-remainder (Hamilton) allocation by stratum size,
+    * "equal": as even as possible across strata,
+  optionally guaranteeing `min_per_stratum`, and redistributing whatever a
+  small stratum cannot supply.
+- Rows are ranked inside each stratum by a seeded hash of `nct_id`, and the
+  lowest-ranked rows are taken. The result depends only on the seed and the
+  data, never on file order or chunking, so the in-memory mode
+  (`stratified_sample`) and the streaming mode (`stream_stratified_sample`)
+  return the same trials.
+- The streaming mode makes two passes over a CSV: one reading only the strata
+  columns to count stratum sizes, one keeping only the lowest-ranked rows per
+  stratum. Memory is O(sample size + chunk), not O(universe).
+"""
+
+import hashlib
+
+import pandas as pd
+
+DEFAULT_SEED = 42
+CHUNK_SIZE = 100000
+
+
+def sample_key(nct_id, seed=DEFAULT_SEED):
+    """Deterministic pseudo-random rank of a trial for a given seed."""
+    digest = hashlib.blake2b(f"{seed}:{nct_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _stratum_labels(df, strata):
+    """One hashable stratum label per row (a tuple of column values)."""
+    if not strata:
+        return pd.Series([()] * len(df), index=df.index, dtype=object)
+    filled = df[list(strata)].astype(object).where(df[list(strata)].notna(), "NA").astype(str)
+    return pd.Series(list(filled.itertuples(index=False, name=None)), index=df.index, dtype=object)
+
+
+def allocate(stratum_sizes, n, method="proportional", min_per_stratum=0):
+    """
+    Exact per-stratum sample counts.
+
+    Args:
+        stratum_sizes: {stratum: number of rows available}
+        n: requested total; capped at the total number of rows.
+        method: "proportional" or "equal".
+        min_per_stratum: guaranteed rows per stratum (when the stratum and n allow).
+
+    Returns:
+        {stratum: count} summing to min(n, total rows).
+    """
+    if method not in ("proportional", "equal"):
+        raise ValueError(f"Unknown allocation method: {method}")
+    sizes = {s: int(c) for s, c in stratum_sizes.items() if c > 0}
+    n = min(int(n), sum(sizes.values()))
+    order = sorted(sizes, key=lambda s: (-sizes[s], str(s)))
+    alloc = {s: 0 for s in sizes}
+
+    # 1. Guaranteed minimum, largest strata first if n cannot cover every stratum
+    for _ in range(min_per_stratum):
+        for s in order:
+            if sum(alloc.values()) >= n:
+                break
+            if alloc[s] < sizes[s]:
+                alloc[s] += 1
+
+    # 2. Distribute the rest by largest remainder, redistributing capped strata
+    remaining = n - sum(alloc.values())
+    while remaining > 0:
+        open_strata = [s for s in order if alloc[s] < sizes[s]]
+        weights = {s: (sizes[s] if method == "proportional" else 1) for s in open_strata}
+        total_weight = sum(weights.values())
+        quotas = {s: remaining * weights[s] / total_weight for s in open_strata}
+
+        given = 0
+        for s in open_strata:
+            take = min(int(quotas[s]), sizes[s] - alloc[s])
+            alloc[s] += take
+            given += take
+        leftover = remaining - given
+        by_remainder = sorted(open_strata, key=lambda s: (-(quotas[s] - int(quotas[s])), str(s)))
+        for s in by_remainder:
+            if leftover == 0:
+                break
+            if alloc[s] < sizes[s]:
+                alloc[s] += 1
+                leftover -= 1
+        remaining = n - sum(alloc.values())
+    return alloc
+
+
+def stratified_sample(df, n, strata=(), method="proportional", min_per_stratum=0,
+                      seed=DEFAULT_SEED, id_col="nct_id"):
+    """Draws an exactly allocated, seeded stratified sample from a DataFrame."""
+    labels = _stratum_labels(df, strata)
+    alloc = allocate(labels.value_counts().to_dict(), n, method, min_per_stratum)
+
+    keys = df[id_col].astype(str).map(lambda x: sample_key(x, seed))
+    ranked = pd.DataFrame({"stratum": labels, "key": keys}, index=df.index).sort_values("key", kind="stable")
+    ranked["rank"] = ranked.groupby("stratum", sort=False).cumcount()
+    quota = ranked["stratum"].map(alloc).fillna(0)
+    selected = ranked.index[ranked["rank"] < quota]
+    return df.loc[selected]
+
+
+def stream_stratified_sample(csv_path, n, strata=(), method="proportional", min_per_stratum=0,
+                             seed=DEFAULT_SEED, id_col="nct_id", usecols=None, row_filter=None,
+                             filter_cols=(), chunksize=CHUNK_SIZE, **read_csv_kwargs):
+    """
+    Same sample as `stratified_sample`, drawn from a CSV without loading it.
+
+    Args:
+        usecols: columns to return (None = all; strata and id column are always read).
+        row_filter: optional function(chunk) -> boolean mask applied before sampling.
+        filter_cols: extra columns `row_filter` needs when `usecols` is given.
+        read_csv_kwargs: passed to pd.read_csv (e.g. sep="|" for AACT files).
+    """
+    strata = list(strata)
+    filter_cols = list(filter_cols)
+    base_cols = None if usecols is None else list(dict.fromkeys([id_col] + strata + filter_cols + list(usecols)))
+
+    def chunks(cols):
+        for chunk in pd.read_csv(csv_path, usecols=cols, chunksize=chunksize, **read_csv_kwargs):
+            if row_filter is not None:
+                chunk = chunk[row_filter(chunk)]
+            yield chunk
+
+    # Pass 1: stratum sizes (strata, id and filter columns only)
+    if row_filter is not None and usecols is None and not filter_cols:
+        count_cols = None
+    else:
+        count_cols = list(dict.fromkeys([id_col] + strata + filter_cols))
+    sizes = {}
+    for chunk in chunks(count_cols):
+        for stratum, count in _stratum_labels(chunk, strata).value_counts().items():
+            sizes[stratum] = sizes.get(stratum, 0) + int(count)
+    alloc = allocate(sizes, n, method, min_per_stratum)
+
+    # Pass 2: keep the lowest-keyed rows per stratum (at most n rows + one chunk in memory)
+    kept = None
+    for chunk in chunks(base_cols):
+        chunk = chunk.assign(
+            _stratum=_stratum_labels(chunk, strata),
+            _key=chunk[id_col].astype(str).map(lambda x: sample_key(x, seed)),
+        )
+        pool = chunk if kept is None else pd.concat([kept, chunk], ignore_index=True)
+        pool = pool.sort_values("_key", kind="stable")
+        rank = pool.groupby("_stratum", sort=False).cumcount()
+        kept = pool[rank < pool["_stratum"].map(alloc).fillna(0)]
+
+    if kept is None:
+        return pd.DataFrame(columns=base_cols)
+    return kept.drop(columns=["_stratum", "_key"]).reset_index(drop=True)
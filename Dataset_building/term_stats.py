@@ -0,0 +1,159 @@
+"""
+Streaming word and n-gram statistics for free-text fields such as `why_stopped`.
+
+Replaces the "join everything into one string, then re.findall + Counter"
+approach in analyze_reasons.py:
+
+- Text is tokenized row by row, chunk by chunk (`TermStats.update`), so the
+  corpus is never materialized as one string.
+- Unigrams, bigrams and trigrams are counted in the same pass. N-grams never
+  span two rows.
+- Counts can be broken down by any categorical column (e.g.
+  `termination_category`, `phase`) next to the overall totals.
+- `capacity=None` counts exactly (Counter). With `capacity=K` each counter is a
+  bounded heavy-hitters summary holding at most 2*K terms, so memory stays flat
+  on all of CT.gov. Reported counts are then upper bounds; `error` gives the
+  maximum overestimate (true count >= count - error).
+"""
+
+import heapq
+import re
+from collections import Counter
+from operator import itemgetter
+
+import pandas as pd
+
+TOKEN_RE = re.compile(r'\b[a-z]{3,}\b') # Ignore short words
+STOP_WORDS = {'the', 'was', 'and', 'for', 'due', 'not', 'study', 'with', 'this', 'were', 'from', 'that', 'are', 'have', 'been'}
+
+
+def tokenize(text, stop_words=STOP_WORDS):
+    """Lowercases and splits a single text into filtered word tokens."""
+    if not isinstance(text, str):
+        return []
+    return [w for w in TOKEN_RE.findall(text.lower()) if w not in stop_words]
+
+
+def ngrams(tokens, n):
+    """Space-joined n-grams of a token list."""
+    if n == 1:
+        return tokens
+    return [' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+
+class ExactCounter:
+    """Exact counts backed by collections.Counter."""
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def update(self, items):
+        self.counts.update(items)
+
+    def most_common(self, k):
+        return [(term, count, 0) for term, count in self.counts.most_common(k)]
+
+
+class HeavyHitters:
+    """
+    Bounded-memory top-k counter (Space-Saving style with batch pruning).
+
+    Holds at most 2*capacity terms. When full, it keeps the `capacity` largest
+    and raises `floor` to the largest count it dropped; terms seen afterwards
+    start from `floor`, so every estimate is an upper bound whose maximum
+    overestimate is stored as that term's error.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def update(self, items):
+        counts = self.counts
+        for item in items:
+            if item in counts:
+                counts[item] += 1
+            else:
+                counts[item] = self.floor + 1
+                self.errors[item] = self.floor
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counts.items(), key=itemgetter(1), reverse=True)
+        kept, dropped = ranked[:self.capacity], ranked[self.capacity:]
+        self.floor = max(self.floor, dropped[0][1])
+        self.counts = dict(kept)
+        self.errors = {term: self.errors[term] for term, _ in kept}
+
+    def most_common(self, k):
+        top = heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+        return [(term, count, self.errors[term]) for term, count in top]
+
+
+class TermStats:
+    """
+    Accumulates n-gram counts over a stream of DataFrame chunks.
+
+    Args:
+        ngram_sizes: n-gram orders to count, e.g. (1, 2, 3).
+        group_by: columns to break counts down by; each is tallied separately
+                  alongside the overall ('all') counts.
+        capacity: None for exact counts, or K for bounded top-K summaries.
+    """
+
+    def __init__(self, ngram_sizes=(1, 2, 3), group_by=(), capacity=None, stop_words=STOP_WORDS):
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.group_by = tuple(group_by)
+        self.capacity = capacity
+        self.stop_words = stop_words
+        self.rows_seen = 0
+        self._counters = {}
+
+    def _counter(self, key):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = ExactCounter() if self.capacity is None else HeavyHitters(self.capacity)
+            self._counters[key] = counter
+        return counter
+
+    def update(self, chunk, text_col='why_stopped'):
+        """Tokenizes one chunk row by row and updates all counters."""
+        cols = [text_col] + [c for c in self.group_by if c in chunk.columns]
+        for row in chunk[cols].itertuples(index=False, name=None):
+            tokens = tokenize(row[0], self.stop_words)
+            if not tokens:
+                continue
+            self.rows_seen += 1
+            groups = [('all', 'all')] + [
+                (col, 'NA' if pd.isna(value) else str(value))
+                for col, value in zip(cols[1:], row[1:])
+            ]
+            for n in self.ngram_sizes:
+                grams = ngrams(tokens, n)
+                if not grams:
+                    continue
+                for col, value in groups:
+                    self._counter((col, value, n)).update(grams)
+
+    def group_values(self, column):
+        """Values seen for a group_by column."""
+        return sorted({value for (col, value, _) in self._counters if col == column})
+
+    def top(self, n=1, k=20, column='all', value='all'):
+        """Top-k n-grams as [(term, count, error)] for one group."""
+        counter = self._counters.get((column, value, n))
+        return counter.most_common(k) if counter else []
+
+    def to_frame(self, k=20):
+        """Long-format table: group_column, group_value, n, rank, term, count, error."""
+        records = []
+        for (column, value, n), counter in sorted(self._counters.items()):
+            for rank, (term, count, error) in enumerate(counter.most_common(k), start=1):
+                records.append({
+                    'group_column': column, 'group_value': value, 'n': n,
+                    'rank': rank, 'term': term, 'count': count, 'error': error
+                })
+        return pd.DataFrame(records)
@@ -0,0 +1,218 @@
+"""
+Full-text index over trial summaries and descriptions (SQLite FTS5).
+
+find_termination_in_summary.py regex-scans `brief_summary` in one CSV; that
+takes minutes per pass and only covers the trials in that file. This module
+indexes brief_summaries.txt and detailed_descriptions.txt of the whole AACT
+snapshot once:
+
+    passages(nct_id UNINDEXED, brief_summary, detailed_description)   FTS5
+    meta(key TEXT PRIMARY KEY, value TEXT)                            snapshot signature
+
+and answers queries in milliseconds. Queries use the FTS5 syntax:
+
+    "terminated due to"                        exact phrase
+    "stopped early" OR "terminated early"      any of several phrases
+    NEAR("enrollment" "slow", 5)               terms within 5 tokens of each other
+    recruit*                                   prefix
+    brief_summary : "sponsor decision"         restrict to one column
+
+`phrase`, `any_of` and `near` build these strings from plain text;
+`termination_query()` is the TERMINATION_PATTERNS list of text_scan.py as one
+query. Matching is token-based and case-insensitive (unicode61 tokenizer), so
+"stopped for" no longer matches inside "stopped forever" as the regex did.
+
+Usage:
+    python text_index.py --build
+    python text_index.py '"terminated due to" OR "stopped early"' --limit 20
+    python text_index.py --termination --field brief_summary --count
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from aact_source import read_table, table_exists
+from text_scan import TERMINATION_PATTERNS
+from trial_store import READ_KWARGS, snapshot_signature
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data") # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
+INDEX_PATH = os.path.join(BASE_DIR, "Indexes", "text_index.sqlite")
+
+# Configuration
+CHUNK_SIZE = 100000
+SNIPPET_TOKENS = 24 # Tokens of context returned per snippet
+SNIPPET_MARKS = ("[", "]") # Around matched terms in snippets
+
+# Indexed column -> AACT table (column `description` in both)
+TEXT_TABLES = {
+    "brief_summary": "brief_summaries.txt",
+    "detailed_description": "detailed_descriptions.txt",
+}
+
+
+def phrase(text):
+    """Plain text -> FTS5 phrase (quotes escaped)."""
+    return '"' + str(text).replace('"', '""') + '"'
+
+
+def any_of(phrases):
+    return " OR ".join(phrase(p) for p in phrases)
+
+
+def near(*phrases, distance=10):
+    """All phrases within `distance` tokens of each other."""
+    return f"NEAR({' '.join(phrase(p) for p in phrases)}, {int(distance)})"
+
+
+def termination_query():
+    """text_scan.TERMINATION_PATTERNS as one FTS5 query."""
+    return any_of(TERMINATION_PATTERNS)
+
+
+def build_index(source=DATA_DIR, index_path=INDEX_PATH, chunksize=CHUNK_SIZE):
+    """Indexes every summary and description in the snapshot (one FTS row per trial)."""
+    start = time.time()
+    tables = {col: table for col, table in TEXT_TABLES.items() if table_exists(source, table)}
+    if not tables:
+        raise FileNotFoundError(f"None of {list(TEXT_TABLES.values())} found in {source}")
+
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp_path = index_path + ".building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    # 1. Stage each table (first row per trial), so both texts land in one FTS row
+    for col, table in tables.items():
+        print(f"Staging {table}...")
+        conn.execute(f"CREATE TABLE s_{col} (nct_id TEXT PRIMARY KEY, text TEXT)")
+        for chunk in read_table(source, table, usecols=["nct_id", "description"], chunksize=chunksize, **READ_KWARGS):
+            chunk = chunk.dropna(subset=["description"])
+            conn.executemany(f"INSERT OR IGNORE INTO s_{col} VALUES (?, ?)",
+                             chunk[["nct_id", "description"]].itertuples(index=False, name=None))
+        conn.commit()
+
+    # 2. Fill the index
+    columns = list(TEXT_TABLES)
+    conn.execute(f"CREATE VIRTUAL TABLE passages USING fts5(nct_id UNINDEXED, {', '.join(columns)}, tokenize='unicode61')")
+    ids = " UNION ".join(f"SELECT nct_id FROM s_{col}" for col in tables)
+    select = ", ".join(f"s_{col}.text" if col in tables else "NULL" for col in columns)
+    joins = " ".join(f"LEFT JOIN s_{col} ON s_{col}.nct_id = ids.nct_id" for col in tables)
+    print("Indexing...")
+    conn.execute(f"INSERT INTO passages SELECT ids.nct_id, {select} FROM ({ids}) AS ids {joins}")
+    n_trials = conn.execute("SELECT count(*) FROM passages").fetchone()[0]
+    conn.execute("INSERT INTO passages(passages) VALUES ('optimize')")
+    for col in tables:
+        conn.execute(f"DROP TABLE s_{col}")
+
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    meta = {
+        "snapshot": snapshot_signature(source, list(tables.values())),
+        "n_trials": n_trials,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, index_path)
+    print(f"Indexed {n_trials} trials in {index_path} ({os.path.getsize(index_path) / 1e6:.1f} MB, {time.time() - start:.0f}s)")
+
+
+class TextIndex:
+    """Read-only queries against a built index."""
+
+    def __init__(self, index_path=INDEX_PATH):
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Text index not found: {index_path} (build it with text_index.py --build)")
+        self.index_path = index_path
+        self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        self.meta = {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def is_current(self, source=DATA_DIR):
+        snapshot = self.meta.get("snapshot", {})
+        return bool(snapshot) and snapshot_signature(source, list(snapshot)) == snapshot
+
+    def __len__(self):
+        return self.meta.get("n_trials", 0)
+
+    @staticmethod
+    def _match(query, fields):
+        # Column filter: {brief_summary detailed_description} : (query)
+        if fields:
+            unknown = [f for f in fields if f not in TEXT_TABLES]
+            if unknown:
+                raise ValueError(f"Unknown field(s) {unknown}; indexed fields are {list(TEXT_TABLES)}")
+            return f"{{{' '.join(fields)}}} : ({query})"
+        return query
+
+    def search(self, query, limit=20, fields=None):
+        """
+        Best-ranked (bm25) matches: list of {nct_id, snippet, score}. The
+        snippet is taken from whichever column matches best, with matched
+        terms wrapped in SNIPPET_MARKS.
+        """
+        sql = ("SELECT nct_id, snippet(passages, -1, ?, ?, '...', ?), bm25(passages) "
+               "FROM passages WHERE passages MATCH ? ORDER BY rank")
+        params = [*SNIPPET_MARKS, SNIPPET_TOKENS, self._match(query, fields)]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [{"nct_id": nct_id, "snippet": snippet, "score": round(score, 3)}
+                for nct_id, snippet, score in self.conn.execute(sql, params)]
+
+    def count(self, query, fields=None):
+        return self.conn.execute("SELECT count(*) FROM passages WHERE passages MATCH ?",
+                                 (self._match(query, fields),)).fetchone()[0]
+
+    def matching_ids(self, query, fields=None):
+        """Set of nct_ids matching the query (no ranking or snippets)."""
+        return {row[0] for row in self.conn.execute("SELECT nct_id FROM passages WHERE passages MATCH ?",
+                                                    (self._match(query, fields),))}
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search over trial summaries and descriptions")
+    parser.add_argument("query", nargs="?", help="FTS5 query, e.g. '\"terminated due to\"' or 'NEAR(\"enrollment\" \"slow\", 5)'")
+    parser.add_argument("--build", action="store_true", help="Build (or rebuild) the index")
+    parser.add_argument("--termination", action="store_true", help="Query the text_scan TERMINATION_PATTERNS phrases")
+    parser.add_argument("--field", action="append", choices=list(TEXT_TABLES), help="Restrict to a column (repeatable)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--count", action="store_true", help="Only print the number of matching trials")
+    parser.add_argument("--source", default=DATA_DIR, help="AACT folder, .zip, or folder of compressed tables")
+    parser.add_argument("--index", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.build:
+        build_index(args.source, args.index)
+    query = termination_query() if args.termination else args.query
+    if not query:
+        if not args.build:
+            parser.error("give a query, --termination or --build")
+        return
+
+    index = TextIndex(args.index)
+    start = time.perf_counter()
+    if args.count:
+        print(f"{index.count(query, args.field)} of {len(index)} trials match")
+    else:
+        results = index.search(query, args.limit, args.field)
+        for row in results:
+            print(f"{row['nct_id']}  ({row['score']})  {row['snippet']}")
+        print(f"\n{len(results)} results shown")
+    print(f"Query time: {(time.perf_counter() - start) * 1000:.1f} ms")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Single-pass multi-keyword scanning of free-text columns.
+
+Used by analyze_brief_summary.py and find_termination_in_summary.py. Instead
+of one `str.contains` pass per keyword (plus a combined pass, plus a per-row
+loop of regexes to locate the sentence), every text is visited once:
+
+1. A single combined regex with a zero-width lookahead finds every position
+   where any keyword starts (overlapping matches included).
+2. Only at those candidate positions are the individual patterns tested, which
+   gives an exact trial x keyword hit matrix.
+3. The sentence around the first match of each keyword is recorded as a
+   (start, end) character span, so reports can print the excerpt without
+   re-scanning.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# Generic termination vocabulary (analyze_brief_summary.py)
+TERMINATION_KEYWORDS = [
+    'terminated', 'stopped', 'discontinued', 'closed', 'halted',
+    'enrollment', 'accrual', 'recruit', 'funding', 'sponsor',
+    'safety', 'adverse', 'efficacy', 'futility'
+]
+
+# Phrases that indicate an ACTUAL termination reason rather than a study
+# objective like "assess safety" (find_termination_in_summary.py)
+TERMINATION_PATTERNS = [
+    r'study was terminated',
+    r'trial was terminated',
+    r'study was stopped',
+    r'trial was stopped',
+    r'study was discontinued',
+    r'trial was discontinued',
+    r'study was closed',
+    r'study was halted',
+    r'terminated due to',
+    r'stopped due to',
+    r'discontinued due to',
+    r'closed due to',
+    r'terminated because',
+    r'stopped because',
+    r'terminated early',
+    r'stopped early',
+    r'discontinued early',
+    r'prematurely terminated',
+    r'prematurely stopped',
+    r'trial closed',
+    r'enrollment was stopped',
+    r'recruitment was stopped',
+    r'terminated for',
+    r'stopped for',
+]
+
+
+@dataclass
+class ScanResult:
+    """
+    hits:  boolean DataFrame (same index as the scanned Series, one column per keyword).
+    spans: {row_index: {keyword: (sentence_start, sentence_end)}} for rows with hits,
+           holding the sentence around the first match of each keyword.
+    """
+    hits: pd.DataFrame
+    spans: dict = field(default_factory=dict)
+
+    def any_hit(self, keywords=None):
+        """Boolean Series: row matches at least one of `keywords` (default: all)."""
+        cols = list(keywords) if keywords is not None else list(self.hits.columns)
+        return self.hits[cols].any(axis=1)
+
+    def first_sentence(self, row_index, text, keywords=None):
+        """
+        Returns the sentence for the first keyword (in `keywords` order) that
+        matched in this row, or None.
+        """
+        row_spans = self.spans.get(row_index, {})
+        for kw in (keywords if keywords is not None else self.hits.columns):
+            if kw in row_spans:
+                start, end = row_spans[kw]
+                return text[start:end].strip()
+        return None
+
+
+class KeywordScanner:
+    """
+    Scans texts for many keywords/regexes at once.
+
+    Args:
+        keywords: list of regex patterns (plain words work as-is).
+        case: case-sensitive matching if True (default: insensitive, like
+              `str.contains(..., case=False)`).
+    """
+
+    def __init__(self, keywords, case=False):
+        # dict.fromkeys keeps order and drops duplicates when keyword lists are combined
+        self.keywords = list(dict.fromkeys(keywords))
+        flags = 0 if case else re.IGNORECASE
+        self._patterns = [re.compile(kw, flags) for kw in self.keywords]
+        alternation = '|'.join(f'(?:{kw})' for kw in self.keywords)
+        self._combined = re.compile(f'(?=(?:{alternation}))', flags)
+
+    def scan_text(self, text):
+        """Returns {keyword_position: (match_start, match_end)} for the first match of each keyword."""
+        found = {}
+        if not isinstance(text, str) or not text:
+            return found
+        for candidate in self._combined.finditer(text):
+            pos = candidate.start()
+            for i, pattern in enumerate(self._patterns):
+                if i in found:
+                    continue
+                m = pattern.match(text, pos)
+                if m:
+                    found[i] = (m.start(), m.end())
+            if len(found) == len(self._patterns):
+                break
+        return found
+
+    def scan(self, series, with_spans=True):
+        """Scans a text Series once and returns a ScanResult."""
+        hits = np.zeros((len(series), len(self.keywords)), dtype=bool)
+        spans = {}
+        for row_pos, (row_index, text) in enumerate(series.items()):
+            found = self.scan_text(text)
+            if not found:
+                continue
+            hits[row_pos, list(found)] = True
+            if with_spans:
+                spans[row_index] = {
+                    self.keywords[i]: sentence_span(text, start, end)
+                    for i, (start, end) in found.items()
+                }
+        hits_df = pd.DataFrame(hits, index=series.index, columns=self.keywords)
+        return ScanResult(hits=hits_df, spans=spans)
+
+
+def sentence_span(text, start, end):
+    """Character span of the '.'-delimited sentence containing text[start:end]."""
+    sent_start = text.rfind('.', 0, start) + 1
+    sent_end = text.find('.', end)
+    sent_end = len(text) if sent_end == -1 else sent_end + 1
+    return (sent_start, sent_end)
+
+
+def scan_termination_mentions(series):
+    """
+    Scans a summary/description column for both TERMINATION_KEYWORDS and
+    TERMINATION_PATTERNS in a single pass.
+    """
+    return KeywordScanner(TERMINATION_KEYWORDS + TERMINATION_PATTERNS).scan(series)
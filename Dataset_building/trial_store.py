@@ -0,0 +1,358 @@
+"""
+Materialized per-trial document store (SQLite, keyed by nct_id).
+
+assign_taxonomy, add_medical_fields, build_pilot_dataset and
+prepare_llm_input each re-join studies, brief_summaries,
+detailed_descriptions, eligibilities, designs and the condition tables. This
+module does that join once per AACT snapshot and stores one fully assembled
+record per trial:
+
+    trials(nct_id TEXT PRIMARY KEY, doc BLOB)   doc = zlib-compressed JSON
+    meta(key TEXT PRIMARY KEY, value TEXT)      snapshot signature, field list
+    zdict(data BLOB)                            shared zlib dictionary
+
+Records are small and repeat the same keys and boilerplate, so each one is
+compressed against a preset dictionary sampled from the first records; that
+keeps per-record compression (any record can be read alone) at a ratio close
+to compressing the whole table.
+
+A record holds the STORE_FIELDS columns (plus any plain field of the
+input-field mapping), `conditions` and `mesh_terms` as lists, and the computed
+`termination_category` (assign_taxonomy's rules, for TERMINATED trials only;
+None for every other status, COVID terminations keep their "COVID" category),
+`medical_field`, `medical_subfield`, `field_source`. Literal 'N/A' / 'NA' fields are read as missing, like every
+other loader. RECORD_VERSION changes whenever the computed fields or the NA
+handling do, so stores built by older code are rebuilt.
+
+Building streams each table through SQLite staging tables (one row per trial
+for 1:1 tables, first row wins; (nct_id, value) rows for list tables), joins
+them in SQL and writes the compressed documents, so memory stays flat. The
+file is written next to the target and renamed into place when complete.
+
+Usage:
+    python trial_store.py --build              # (re)build for the current snapshot
+    python trial_store.py --get NCT00000102 NCT00000104
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+import pandas as pd
+
+from aact_source import read_table, table_columns, table_exists, table_path
+from add_medical_fields import classify_trial
+from assign_taxonomy import get_termination_category
+from feature_normalization import load_field_specs
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data") # Extracted folder, AACT .zip, or folder of .txt.gz/.txt.zst tables (see aact_source.py)
+STORE_PATH = os.path.join(BASE_DIR, "Indexes", "trial_store.sqlite")
+INPUT_FIELDS_PATH = os.path.join(BASE_DIR, "Prediction", "Input_fields_for_LLM_prediction-Input.csv")
+
+# Configuration
+CHUNK_SIZE = 200000
+WRITE_BATCH = 5000 # Documents compressed and inserted per transaction
+LOOKUP_BATCH = 900 # nct_ids per IN (...) query (SQLite parameter limit is 999 on older builds)
+COMPRESSION_LEVEL = 6
+ZDICT_SIZE = 32768 # zlib's maximum window
+RECORD_VERSION = 3 # Bump when assemble_record or READ_KWARGS change (older stores are then not current)
+# pandas' default NA strings ('', 'N/A', 'NA', ...) are missing, as on the raw-table path of
+# build_pilot_dataset and in ground_truth_io.CSV_NA_VALUES, so both paths give a trial the same values
+READ_KWARGS = {"dtype": str}
+
+# 1:1 tables -> columns kept
+STORE_FIELDS = {
+    "studies.txt": ["brief_title", "official_title", "overall_status", "study_type", "why_stopped", "phase",
+                    "enrollment", "enrollment_type", "has_dmc", "start_date", "completion_date"],
+    "brief_summaries.txt": ["description"],
+    "detailed_descriptions.txt": ["description"],
+    "eligibilities.txt": ["criteria", "gender", "minimum_age", "maximum_age", "healthy_volunteers"],
+    "designs.txt": ["allocation", "intervention_model", "masking", "primary_purpose"],
+    "calculated_values.txt": ["number_of_primary_outcomes_to_measure", "number_of_secondary_outcomes_to_measure",
+                              "number_of_other_outcomes_to_measure"],
+}
+# One-to-many tables stored as lists: table -> (column, record key)
+LIST_FIELDS = {
+    "conditions.txt": ("name", "conditions"),
+    "browse_conditions.txt": ("mesh_term", "mesh_terms"),
+}
+# Record keys for columns whose AACT name is ambiguous
+FIELD_ALIASES = {
+    ("brief_summaries.txt", "description"): "brief_summary",
+    ("detailed_descriptions.txt", "description"): "detailed_description",
+}
+LIST_SEPARATOR = "\x1f"
+
+
+def record_key(table, column):
+    return FIELD_ALIASES.get((table, column), column)
+
+
+def _staging_name(table):
+    return "s_" + os.path.splitext(table)[0]
+
+
+def snapshot_signature(source, tables):
+    signature = {}
+    for table in tables:
+        path = table_path(source, table)
+        if path is not None:
+            st = os.stat(path)
+            signature[table] = {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return signature
+
+
+def store_fields(mapping_csv=INPUT_FIELDS_PATH):
+    """STORE_FIELDS plus every plain (non-aggregated) field of the input-field mapping."""
+    fields = {table: list(cols) for table, cols in STORE_FIELDS.items()}
+    if mapping_csv and os.path.exists(mapping_csv):
+        for spec in load_field_specs(mapping_csv):
+            if spec["source"] in LIST_FIELDS or spec.get("aggregation"):
+                continue
+            cols = fields.setdefault(spec["source"], [])
+            if spec["name"] not in cols:
+                cols.append(spec["name"])
+    return fields
+
+
+def _stage_table(conn, source, table, columns, chunksize):
+    """Loads the first row per trial of a 1:1 table into a staging table."""
+    name = _staging_name(table)
+    conn.execute(f'CREATE TABLE {name} (nct_id TEXT PRIMARY KEY, {", ".join(f"[{c}] TEXT" for c in columns)})')
+    placeholders = ", ".join("?" * (len(columns) + 1))
+    for chunk in read_table(source, table, usecols=["nct_id"] + columns, chunksize=chunksize, **READ_KWARGS):
+        chunk = chunk[["nct_id"] + columns].astype(object).where(chunk.notna(), None)
+        conn.executemany(f"INSERT OR IGNORE INTO {name} VALUES ({placeholders})", chunk.itertuples(index=False, name=None))
+    conn.commit()
+
+
+def _stage_list(conn, source, table, column, chunksize):
+    """Loads (nct_id, value) rows of a one-to-many table into a staging table."""
+    name = _staging_name(table)
+    conn.execute(f"CREATE TABLE {name} (nct_id TEXT, value TEXT)")
+    for chunk in read_table(source, table, usecols=["nct_id", column], chunksize=chunksize, **READ_KWARGS):
+        chunk = chunk.dropna()
+        conn.executemany(f"INSERT INTO {name} VALUES (?, ?)", chunk[["nct_id", column]].itertuples(index=False, name=None))
+    conn.execute(f"CREATE INDEX {name}_id ON {name} (nct_id)")
+    conn.commit()
+
+
+def assemble_record(record):
+    """Adds the computed fields to a record (in place) and returns it."""
+    # Categorized like process_taxonomy: terminated trials only
+    terminated = record.get("overall_status") == "TERMINATED"
+    record["termination_category"] = get_termination_category(record.get("why_stopped")) if terminated else None
+    fallback = f"{record.get('brief_title') or ''} {record.get('brief_summary') or ''}"
+    record.update(classify_trial(" | ".join(record.get("mesh_terms") or []) or None,
+                                 " | ".join(record.get("conditions") or []) or None, fallback))
+    return record
+
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress_doc(data, zdict):
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=zdict)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_doc(doc, zdict):
+    return json.loads(zlib.decompressobj(zdict=zdict).decompress(doc))
+
+
+def build_zdict(encoded_records):
+    """Preset dictionary from sample records (most useful content goes last)."""
+    return b"".join(encoded_records)[-ZDICT_SIZE:]
+
+
+def build_store(source=DATA_DIR, store_path=STORE_PATH, mapping_csv=INPUT_FIELDS_PATH, chunksize=CHUNK_SIZE):
+    """Builds the document store for one AACT snapshot (all trials in studies.txt)."""
+    start = time.time()
+    fields = {t: c for t, c in store_fields(mapping_csv).items() if table_exists(source, t)}
+    if "studies.txt" not in fields:
+        raise FileNotFoundError(f"studies.txt not found in {source}")
+    lists = {t: spec for t, spec in LIST_FIELDS.items() if table_exists(source, t)}
+    for table, cols in fields.items():
+        header = set(table_columns(source, table))
+        missing = [c for c in cols if c not in header]
+        if missing:
+            print(f"Warning: {table} has no column(s) {missing}; skipping them.")
+        fields[table] = [c for c in cols if c in header]
+
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp_path = store_path + ".building"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    # 1. Staging tables
+    for table, cols in fields.items():
+        print(f"Staging {table} ({len(cols)} columns)...")
+        _stage_table(conn, source, table, cols, chunksize)
+    for table, (column, _) in lists.items():
+        print(f"Staging {table} ({column})...")
+        _stage_list(conn, source, table, column, chunksize)
+
+    # 2. One join, documents written in batches
+    select, joins, keys = ["s_studies.nct_id"], [], []
+    for table, cols in fields.items():
+        name = _staging_name(table)
+        if name != "s_studies":
+            joins.append(f"LEFT JOIN {name} ON {name}.nct_id = s_studies.nct_id")
+        for c in cols:
+            select.append(f"{name}.[{c}]")
+            keys.append(record_key(table, c))
+    list_keys = []
+    for table, (_, key) in lists.items():
+        name = _staging_name(table)
+        select.append(f"(SELECT group_concat(value, char(31)) FROM {name} WHERE {name}.nct_id = s_studies.nct_id)")
+        list_keys.append(key)
+
+    conn.execute("CREATE TABLE trials (nct_id TEXT PRIMARY KEY, doc BLOB NOT NULL)")
+    cursor = conn.execute(f"SELECT {', '.join(select)} FROM s_studies {' '.join(joins)}")
+    n_docs = 0
+    zdict = None
+    while True:
+        rows = cursor.fetchmany(WRITE_BATCH)
+        if not rows:
+            break
+        encoded = []
+        for row in rows:
+            record = {"nct_id": row[0]}
+            record.update(zip(keys, row[1:1 + len(keys)]))
+            for key, value in zip(list_keys, row[1 + len(keys):]):
+                record[key] = value.split(LIST_SEPARATOR) if value else []
+            encoded.append((record["nct_id"], _encode(assemble_record(record))))
+        if zdict is None:
+            zdict = build_zdict([data for _, data in encoded])
+        conn.executemany("INSERT OR REPLACE INTO trials VALUES (?, ?)",
+                         [(nct_id, compress_doc(data, zdict)) for nct_id, data in encoded])
+        n_docs += len(encoded)
+    conn.execute("CREATE TABLE zdict (data BLOB)")
+    conn.execute("INSERT INTO zdict VALUES (?)", (zdict or b"",))
+    conn.commit()
+
+    # 3. Drop staging data and record the snapshot
+    for table in list(fields) + list(lists):
+        conn.execute(f"DROP TABLE {_staging_name(table)}")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    meta = {
+        "snapshot": snapshot_signature(source, list(fields) + list(lists)),
+        "fields": {t: {c: record_key(t, c) for c in cols} for t, cols in fields.items()},
+        "lists": {t: key for t, (_, key) in lists.items()},
+        "n_trials": n_docs,
+        "record_version": RECORD_VERSION,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, store_path)
+    print(f"Stored {n_docs} trials in {store_path} ({os.path.getsize(store_path) / 1e6:.1f} MB, {time.time() - start:.0f}s)")
+
+
+class TrialStore:
+    """Read-only access to a built document store."""
+
+    def __init__(self, store_path=STORE_PATH):
+        if not os.path.exists(store_path):
+            raise FileNotFoundError(f"Trial store not found: {store_path} (build it with trial_store.py --build)")
+        self.store_path = store_path
+        self.conn = sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+        self.meta = {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+        self.zdict = self.conn.execute("SELECT data FROM zdict").fetchone()[0]
+
+    def is_current(self, source=DATA_DIR):
+        """True if the store was built from the snapshot currently in `source` by the current record code."""
+        snapshot = self.meta.get("snapshot", {})
+        if self.meta.get("record_version") != RECORD_VERSION:
+            return False
+        return bool(snapshot) and snapshot_signature(source, list(snapshot)) == snapshot
+
+    def fields(self):
+        """{table: {AACT column: record key}} of 1:1 fields held in every record."""
+        return self.meta.get("fields", {})
+
+    def __len__(self):
+        return self.meta.get("n_trials", 0)
+
+    def __contains__(self, nct_id):
+        return self.conn.execute("SELECT 1 FROM trials WHERE nct_id = ?", (nct_id,)).fetchone() is not None
+
+    def get(self, nct_id):
+        return self.get_many([nct_id]).get(nct_id)
+
+    def get_many(self, nct_ids):
+        """{nct_id: record} for the requested trials (unknown IDs are omitted)."""
+        ids = list(dict.fromkeys(str(i) for i in nct_ids))
+        records = {}
+        for start in range(0, len(ids), LOOKUP_BATCH):
+            batch = ids[start:start + LOOKUP_BATCH]
+            query = f"SELECT nct_id, doc FROM trials WHERE nct_id IN ({', '.join('?' * len(batch))})"
+            for nct_id, doc in self.conn.execute(query, batch):
+                records[nct_id] = decompress_doc(doc, self.zdict)
+        return records
+
+    def get_frame(self, nct_ids, columns=None):
+        """DataFrame with one row per requested trial (in request order); missing trials are NaN rows."""
+        records = self.get_many(nct_ids)
+        rows = [records.get(str(i), {"nct_id": str(i)}) for i in nct_ids]
+        df = pd.DataFrame(rows)
+        if columns is not None:
+            df = df.reindex(columns=["nct_id"] + [c for c in columns if c != "nct_id"])
+        return df
+
+    def iter_records(self, batch_size=WRITE_BATCH):
+        """Streams every record in nct_id order."""
+        cursor = self.conn.execute("SELECT doc FROM trials ORDER BY nct_id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for (doc,) in rows:
+                yield decompress_doc(doc, self.zdict)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_store(source=DATA_DIR, store_path=STORE_PATH):
+    """Opens the store if it exists and matches the current snapshot, else returns None."""
+    if not os.path.exists(store_path):
+        return None
+    store = TrialStore(store_path)
+    if not store.is_current(source):
+        print(f"Trial store {store_path} was built from a different snapshot or older code; ignoring it (rebuild with --build).")
+        store.close()
+        return None
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-trial document store over the AACT snapshot")
+    parser.add_argument("--build", action="store_true", help="Build (or rebuild) the store")
+    parser.add_argument("--get", nargs="+", metavar="NCT_ID", help="Print assembled records")
+    parser.add_argument("--source", default=DATA_DIR, help="AACT folder, .zip, or folder of compressed tables")
+    parser.add_argument("--store", default=STORE_PATH)
+    args = parser.parse_args()
+
+    if args.build:
+        build_store(args.source, args.store)
+    if args.get:
+        store = TrialStore(args.store)
+        for nct_id, record in store.get_many(args.get).items():
+            print(json.dumps(record, indent=2, ensure_ascii=False))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Compact output schema: category codes instead of prose.
+
+Completion tokens dominate request latency, and most of them go to prose
+that the pipeline only stores: the extraction schema asks for quoted
+`reasoning_traces` per category plus an `explanation`, the prediction
+template for a free-text `reason`. In compact mode (`--compact` in both
+clients) the model answers with codes only:
+
+    extraction   {"r": [3, 7], "c": "H"}        (+ "e": {"3": [["w", 0, 41]]} with evidence)
+    prediction   {"p": 2, "c": 1}               (+ "e": [[120, 168]] with evidence)
+
+Category codes are 1-based positions in the category list shown in the
+prompt; "c" is the confidence (H/M/L for extraction, 0/0.5/1 for
+prediction). With `evidence=True` the model may add evidence spans as
+[start, end) character offsets into the text it was given: for extraction
+into one field of the trial record (FIELD_CODES), for prediction into the
+trial description.
+
+`compact_extraction_prompt` / `compact_prediction_prompt` replace only the
+output block of the full prompts and rewrite the worked examples' answers in
+the compact form, so the task, taxonomy, rules and examples stay the same.
+
+`expand_extraction` / `expand_prediction` rebuild the full-schema dicts
+locally, so validation, `--repair` and the result columns are unchanged: the
+reasoning traces / reason quote the evidence spans (spans outside the text
+are dropped), or say that no evidence was requested; the extraction
+explanation is generated from the codes. Unknown codes become "code N", which
+validation rejects like any other unknown category.
+
+The compact output ceilings (`max_output_tokens`) count answer tokens only:
+streaming counts content deltas against them, and `server_max_tokens`
+(streaming.py) sends no server-side cap to reasoning models, whose trace
+would otherwise use it up before the answer starts.
+
+`OutputSavings` reports, per trial, the completion tokens saved and the
+latency gained against the mean of the full-schema results already in the
+same output file (both clients record `completion_tokens` and `latency_s`
+for every call). With no full-schema results yet there is nothing to compare
+against and the savings are left empty.
+"""
+
+import json
+import re
+
+from validation import canonical_choice
+
+EXTRACTION_CONFIDENCE_CODES = {"H": "High", "M": "Medium", "L": "Low"}
+FIELD_CODES = {"w": "why_stopped", "b": "brief_summary", "d": "detailed_description"}
+COMPACT_MAX_OUTPUT_TOKENS = 60 # Output ceiling for a compact reply
+COMPACT_EVIDENCE_MAX_OUTPUT_TOKENS = 200 # ... with evidence spans
+MAX_QUOTE_CHARS = 300 # Longest quote taken from one evidence span
+NO_EVIDENCE_TRACE = "Compact output: no evidence requested"
+
+# Full-schema output block and worked-example answers of the extraction template
+EXTRACTION_FORMAT_RE = re.compile(r'OUTPUT FORMAT:.*?\n\}\n', re.DOTALL)
+EXTRACTION_EXAMPLE_RE = re.compile(r'(// Analysis for [^\n]*\n)(\{\n.*?\n\})', re.DOTALL)
+# Full-schema output block and one-line answers of the prediction templates
+PREDICTION_FORMAT_RE = re.compile(r'Output must be valid JSON only.*?\n\}\n', re.DOTALL)
+PREDICTION_EXAMPLE_RE = re.compile(r'^\{"prediction".*\}[ \t]*$', re.MULTILINE)
+
+
+def category_codes(categories):
+    """'1 = Enrollment, 2 = Administrative, ...'"""
+    return ", ".join(f"{i} = {c}" for i, c in enumerate(categories, 1))
+
+
+def max_output_tokens(evidence=False):
+    """Answer-token ceiling of a compact reply (reasoning tokens are not counted)."""
+    return COMPACT_EVIDENCE_MAX_OUTPUT_TOKENS if evidence else COMPACT_MAX_OUTPUT_TOKENS
+
+
+def _category(code, categories):
+    """Category for a 1-based code (ints or numeric strings), else 'code <value>'."""
+    try:
+        index = int(code)
+    except (TypeError, ValueError):
+        return f"code {code}"
+    return categories[index - 1] if 1 <= index <= len(categories) else f"code {code}"
+
+
+def _quote(text, span):
+    """text[start:end] for a valid [start, end] span, else None."""
+    if not isinstance(text, str) or not isinstance(span, (list, tuple)) or len(span) != 2:
+        return None
+    try:
+        start, end = int(span[0]), int(span[1])
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= start < end <= len(text):
+        return None
+    return text[start:end][:MAX_QUOTE_CHARS].strip() or None
+
+
+def numbered_taxonomy(taxonomy_content, categories):
+    """The taxonomy text with each category line prefixed by its code ('3. Study Design: ...')."""
+    codes = {c: i for i, c in enumerate(categories, 1)}
+    lines = []
+    for line in taxonomy_content.splitlines():
+        name, sep, _ = line.partition(":")
+        code = codes.get(name.strip()) if sep else None
+        lines.append(f"{code}. {line}" if code else line)
+    return "\n".join(lines)
+
+
+def extraction_format(categories, evidence=False):
+    """Output instructions replacing the full extraction schema."""
+    lines = [
+        "OUTPUT FORMAT (compact): Do not write reasoning traces or an explanation. Output only a JSON object:",
+        '{"r": [<category codes>], "c": "H" | "M" | "L"}',
+        f"r: codes of the primary reasons ({category_codes(categories)}); c: confidence (High/Medium/Low).",
+    ]
+    if evidence:
+        codes = ", ".join(f"{k} = {v}" for k, v in FIELD_CODES.items())
+        lines += [
+            'Optionally add "e": {"<code>": [["<field>", start, end], ...]}, the evidence for each reason as',
+            f"character offsets [start, end) into a field of the trial record ({codes}).",
+        ]
+    return "\n".join(lines)
+
+
+def _code_for(name, categories):
+    """1-based code of a category name; a name that only abbreviates one ('SAFETY') matches by prefix."""
+    match = canonical_choice(name, categories)
+    if match is None:
+        key = re.sub(r'[^A-Z0-9]', '', str(name).upper())
+        match = next((c for c in categories if key and re.sub(r'[^A-Z0-9]', '', c.upper()).startswith(key)), None)
+    return categories.index(match) + 1 if match is not None else name
+
+
+def compact_extraction_prompt(template, categories, evidence=False):
+    """
+    The extraction template with its output block replaced by
+    `extraction_format` and each worked example's answer ("// Analysis for
+    ...") rewritten as a compact reply. Placeholders are left in place.
+    """
+    def example(match):
+        try:
+            answer = json.loads(match.group(2))
+        except json.JSONDecodeError:
+            return match.group(0)
+        compact = {"r": [_code_for(r, categories) for r in answer.get("primary_reasons", [])],
+                   "c": str(answer.get("confidence", ""))[:1].upper()}
+        return match.group(1) + json.dumps(compact)
+
+    block = extraction_format(categories, evidence) + "\n"
+    if EXTRACTION_FORMAT_RE.search(template):
+        template = EXTRACTION_FORMAT_RE.sub(lambda _: block, template, count=1)
+    else:
+        template = template.rstrip() + "\n\n" + block
+    return EXTRACTION_EXAMPLE_RE.sub(example, template)
+
+
+def expand_extraction(data, categories, trial_data=None):
+    """Compact extraction reply -> full-schema dict (primary_reasons, reasoning_traces, confidence, explanation)."""
+    if not isinstance(data, dict) or "error" in data:
+        return data
+    codes = data.get("r")
+    codes = codes if isinstance(codes, list) else [] if codes is None else [codes]
+    reasons = [_category(code, categories) for code in codes]
+    evidence = data.get("e") if isinstance(data.get("e"), dict) else {}
+    traces = {}
+    for code, reason in zip(codes, reasons):
+        quotes = []
+        spans = evidence.get(str(code))
+        for span in spans if isinstance(spans, list) else []:
+            field = FIELD_CODES.get(span[0]) if isinstance(span, (list, tuple)) and span else None
+            quote = _quote((trial_data or {}).get(field), span[1:]) if field else None
+            if quote:
+                quotes.append(f"Evidence: '{quote}' ({field})")
+        traces[reason] = quotes or [NO_EVIDENCE_TRACE]
+    confidence = data.get("c")
+    confidence = EXTRACTION_CONFIDENCE_CODES.get(str(confidence).strip().upper()[:1], confidence) if confidence else None
+    return {
+        "primary_reasons": reasons,
+        "reasoning_traces": traces,
+        "confidence": confidence,
+        "explanation": f"Compact output: {', '.join(reasons)} ({confidence} confidence)" if reasons else "",
+    }
+
+
+def compact_prediction_prompt(prompt, categories, evidence=False):
+    """
+    A filled prediction prompt (instruct or retrieval template, before
+    {input_text} is inserted) with the output block and every one-line example
+    answer rewritten in the compact schema.
+    """
+    codes = {c: i for i, c in enumerate(categories, 1)}
+
+    def example(match):
+        try:
+            answer = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return match.group(0)
+        return json.dumps({"p": codes.get(answer.get("prediction"), answer.get("prediction")),
+                           "c": answer.get("confidence")})
+
+    lines = [
+        "Output must be valid JSON only, in this compact form (no reason or explanation):",
+        '{"p": <category code>, "c": 0 | 0.5 | 1}',
+        f"Category codes: {category_codes(categories)}.",
+    ]
+    if evidence:
+        lines.append('Optionally add "e": [[start, end], ...], the evidence as character offsets [start, end) '
+                     'into the trial description you are asked about.')
+    block = "\n".join(lines) + "\n"
+    if PREDICTION_FORMAT_RE.search(prompt):
+        prompt = PREDICTION_FORMAT_RE.sub(lambda _: block, prompt, count=1)
+    else:
+        prompt = prompt.rstrip() + "\n\n" + block
+    return PREDICTION_EXAMPLE_RE.sub(example, prompt)
+
+
+def expand_prediction(data, categories, input_text=None):
+    """Compact prediction reply -> full-schema dict (prediction, reason, confidence)."""
+    if not isinstance(data, dict) or "error" in data:
+        return data
+    spans = data.get("e") if isinstance(data.get("e"), list) else []
+    quotes = [q for q in (_quote(input_text, span) for span in spans) if q]
+    return {
+        "prediction": _category(data.get("p"), categories) if data.get("p") is not None else None,
+        "reason": "Evidence: " + "; ".join(f"'{q}'" for q in quotes) if quotes else NO_EVIDENCE_TRACE,
+        "confidence": data.get("c"),
+    }
+
+
+def _number(value):
+    """float(value) for finite numbers (NaN and missing -> None)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value else None
+
+
+class OutputSavings:
+    """Per-trial completion tokens and latency saved by compact replies against full-schema results."""
+
+    def __init__(self, baseline_rows=()):
+        tokens, latency = [], []
+        for row in baseline_rows:
+            schema = row.get("output_schema")
+            if isinstance(schema, str) and schema != "full":
+                continue
+            t, s = _number(row.get("completion_tokens")), _number(row.get("latency_s"))
+            if t is not None:
+                tokens.append(t)
+            if s is not None:
+                latency.append(s)
+        self.baseline_tokens = sum(tokens) / len(tokens) if tokens else None
+        self.baseline_latency = sum(latency) / len(latency) if latency else None
+        self.n_baseline = len(tokens)
+        self.trials = 0
+        self.tokens_saved = 0.0
+        self.latency_gained = 0.0
+
+    def record(self, stats):
+        """{tokens_saved, latency_gained_s} for one compact call's stats (None without a baseline)."""
+        tokens, latency = _number(stats.get("completion_tokens")), _number(stats.get("latency_s"))
+        saved = round(self.baseline_tokens - tokens, 1) if None not in (self.baseline_tokens, tokens) else None
+        gained = round(self.baseline_latency - latency, 3) if None not in (self.baseline_latency, latency) else None
+        self.trials += 1
+        self.tokens_saved += saved or 0
+        self.latency_gained += gained or 0
+        return {"tokens_saved": saved, "latency_gained_s": gained}
+
+    def summary(self):
+        if self.baseline_tokens is None:
+            return (f"Compact schema: {self.trials} trials; no full-schema results with token counts in the output "
+                    f"yet, so savings are not measured (run some trials without --compact first).")
+        text = (f"Compact schema: {self.trials} trials, {self.tokens_saved:.0f} completion tokens saved "
+                f"({self.tokens_saved / max(self.trials, 1):.0f} per trial against a mean of "
+                f"{self.baseline_tokens:.0f} over {self.n_baseline} full-schema results)")
+        if self.baseline_latency is not None:
+            text += (f", {self.latency_gained:.1f}s latency gained "
+                     f"({self.latency_gained / max(self.trials, 1):.2f}s per trial)")
+        return text
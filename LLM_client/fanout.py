@@ -0,0 +1,121 @@
+"""
+Concurrent fan-out of prepared requests to several models.
+
+Comparing models (e.g. `deepseek-chat` vs `deepseek-reasoner`) used to mean
+one full run per model: the input was re-read and every prompt rebuilt each
+time, and the runs took the sum of their durations. `fan_out` takes each item
+(prompt) once and dispatches it to every model that still needs it:
+
+- each model has its own worker pool, so `concurrency` is a per-model limit
+  (the reasoner is slower and usually gets fewer slots than chat);
+- items are pulled lazily and at most WINDOW_FACTOR x concurrency requests are
+  in flight or waiting to be written per model, so memory stays bounded on
+  large inputs;
+- `on_result` runs in the caller's thread and, per model, in input order (a
+  small reorder buffer holds early finishers), so per-model outputs are
+  aligned row by row and checkpoint files never need locking.
+
+A run therefore takes about as long as its slowest model.
+
+Models are given as "name[:concurrency]" pairs, e.g.
+`deepseek-chat:8,deepseek-reasoner:2`.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_CONCURRENCY = 4
+WINDOW_FACTOR = 2 # In-flight requests per model, as a multiple of its concurrency
+
+
+def parse_models(spec, default_concurrency=DEFAULT_CONCURRENCY):
+    """'deepseek-chat:8,deepseek-reasoner:2' -> {'deepseek-chat': 8, 'deepseek-reasoner': 2}."""
+    models = {}
+    for part in spec.split(","):
+        name, _, limit = part.strip().partition(":")
+        if not name:
+            continue
+        try:
+            models[name] = int(limit) if limit else default_concurrency
+        except ValueError:
+            raise ValueError(f"Invalid concurrency for {name}: '{limit}' (expected e.g. {name}:4)") from None
+        if models[name] < 1:
+            raise ValueError(f"Concurrency for {name} must be at least 1")
+    if not models:
+        raise ValueError(f"No models in '{spec}'")
+    return models
+
+
+def model_output_path(output_file, model):
+    """output/results.csv + 'deepseek-chat' -> output/results.deepseek-chat.csv"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.{model}{ext}"
+
+
+def fan_out(items, models, call, on_result):
+    """
+    Dispatches every item to its target models concurrently.
+
+    Args:
+        items: iterable of (key, payload, targets); `targets` lists the models
+            that need this item (None = all).
+        models: {model: concurrency}.
+        call: call(model, payload) -> result, run in the model's worker threads.
+        on_result: on_result(model, key, payload, result), run in the calling
+            thread, per model in item order.
+
+    Returns {model: {"requests": n, "busy_s": summed request time}}.
+    """
+    executors = {m: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"fanout-{m}") for m, n in models.items()}
+    windows = {m: n * WINDOW_FACTOR for m, n in models.items()}
+    in_flight = {m: 0 for m in models}
+    next_seq = {m: 0 for m in models} # Next sequence number to assign
+    next_out = {m: 0 for m in models} # Next sequence number to hand to on_result
+    buffers = {m: {} for m in models} # seq -> (key, payload, result)
+    futures = {}
+    stats = {m: {"requests": 0, "busy_s": 0.0} for m in models}
+    stats_lock = threading.Lock()
+
+    def timed(model, payload):
+        start = time.monotonic()
+        try:
+            return call(model, payload)
+        finally:
+            with stats_lock:
+                stats[model]["busy_s"] += time.monotonic() - start
+
+    def drain(block):
+        if not futures:
+            return
+        done, _ = wait(list(futures), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            model, seq, key, payload = futures.pop(future)
+            in_flight[model] -= 1
+            stats[model]["requests"] += 1
+            buffers[model][seq] = (key, payload, future.result())
+            # Hand over the contiguous prefix, in input order
+            while next_out[model] in buffers[model]:
+                out_key, out_payload, result = buffers[model].pop(next_out[model])
+                next_out[model] += 1
+                on_result(model, out_key, out_payload, result)
+
+    try:
+        for key, payload, targets in items:
+            targets = [m for m in (targets if targets is not None else models) if m in models]
+            # Wait for room in every target model's window (results held for reordering count too)
+            while any(in_flight[m] + len(buffers[m]) >= windows[m] for m in targets):
+                drain(block=True)
+            for model in targets:
+                future = executors[model].submit(timed, model, payload)
+                futures[future] = (model, next_seq[model], key, payload)
+                next_seq[model] += 1
+                in_flight[model] += 1
+            drain(block=False)
+        while futures:
+            drain(block=True)
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+    return stats
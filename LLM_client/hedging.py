@@ -0,0 +1,154 @@
+"""
+Hedged requests: cut tail latency by racing a duplicate against stragglers.
+
+A small fraction of DeepSeek calls take many times the median; with bounded
+concurrency those stragglers hold a worker slot and stall the batch.
+`HedgePolicy.call` starts the request and, if it has not returned after the
+observed p95 latency, sends one duplicate and returns whichever copy succeeds
+first:
+
+1. The delay is the `percentile` of recent successful request latencies
+   (rolling window). Until `min_samples` latencies are known nothing is hedged.
+2. Hedges are capped at `max_hedge_rate` of all requests (default 5%), so a
+   slow provider cannot double the load; over the cap, requests just wait.
+3. The losing copy is cancelled: callables that accept a cancel event
+   (`cancel_kwarg`, e.g. `stream_completion(..., cancel_event=...)`) stop
+   reading and close their stream. A blocking non-streaming call cannot be
+   interrupted from another thread; it is abandoned and its result dropped.
+4. If one copy fails while the other is still running, the other one decides
+   the outcome; only when both fail is the first error raised.
+5. Telemetry: `stats()` (requests, hedges, hedge wins, requests that skipped
+   a hedge because of the cap, current delay) and `last_outcome()`, the
+   per-request `hedged` / `hedge_won` flags of the calling thread.
+
+Latencies are recorded per copy, losers included (not only the winner's), so
+hedging does not pull the p95 estimate down.
+
+Hedge inside the retry policy, so every retry attempt is hedged and backoff
+sleeps are never mistaken for slow requests:
+
+    hedge = HedgePolicy()
+    response = retry_policy.call(hedge.call, client.chat.completions.create, model=..., messages=...)
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+HEDGE_PERCENTILE = 95
+MAX_HEDGE_RATE = 0.05 # Hedges per request, at most
+MIN_SAMPLES = 20 # Latencies needed before hedging starts
+LATENCY_WINDOW = 500 # Recent latencies kept for the percentile
+
+
+class HedgePolicy:
+    """Wraps a callable with p95-triggered duplicate requests. Thread-safe; one per model."""
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, max_hedge_rate=MAX_HEDGE_RATE, min_samples=MIN_SAMPLES,
+                 window=LATENCY_WINDOW):
+        self.percentile = percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counts = {"requests": 0, "hedged": 0, "hedge_wins": 0, "capped": 0}
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[round(self.percentile / 100 * (len(ordered) - 1))]
+
+    def _start(self, fn, args, kwargs, cancel_kwarg):
+        """Runs one copy in a daemon thread; returns (future, cancel event)."""
+        future = Future()
+        cancel = threading.Event()
+        if cancel_kwarg:
+            kwargs = dict(kwargs, **{cancel_kwarg: cancel})
+
+        def run():
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            # Losers count too (a cancelled copy with the time it ran, at least the hedge delay)
+            self.record_latency(time.monotonic() - start)
+            future.set_result(result)
+
+        # Daemon: an abandoned blocking copy never keeps the process alive
+        threading.Thread(target=run, daemon=True, name="hedge").start()
+        return future, cancel
+
+    def call(self, fn, *args, cancel_kwarg=None, **kwargs):
+        """Calls `fn(*args, **kwargs)`, hedging it once if it outlives the p95 latency."""
+        outcome = {"hedged": False, "hedge_won": False}
+        self._local.outcome = outcome
+        delay = self.hedge_delay()
+        with self._lock:
+            self._counts["requests"] += 1
+
+        if delay is None:
+            start = time.monotonic()
+            result = fn(*args, **kwargs)
+            self.record_latency(time.monotonic() - start)
+            return result
+
+        primary, primary_cancel = self._start(fn, args, kwargs, cancel_kwarg)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            allowed = self._counts["hedged"] < self.max_hedge_rate * self._counts["requests"]
+            self._counts["hedged" if allowed else "capped"] += 1
+        if not allowed:
+            return primary.result()
+
+        outcome["hedged"] = True
+        hedge, hedge_cancel = self._start(fn, args, kwargs, cancel_kwarg)
+        copies = {primary: (primary_cancel, False), hedge: (hedge_cancel, True)}
+        pending = set(copies)
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                # Winner: cancel the other copy
+                for other in pending:
+                    copies[other][0].set()
+                if copies[future][1]:
+                    outcome["hedge_won"] = True
+                    with self._lock:
+                        self._counts["hedge_wins"] += 1
+                return future.result()
+        raise first_error
+
+    def last_outcome(self):
+        """{"hedged", "hedge_won"} of the last call made by this thread."""
+        return dict(getattr(self._local, "outcome", {"hedged": False, "hedge_won": False}))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        delay = self.hedge_delay()
+        counts["hedge_rate"] = round(counts["hedged"] / counts["requests"], 4) if counts["requests"] else 0.0
+        counts["hedge_delay_s"] = round(delay, 3) if delay is not None else None
+        return counts
+
+    def summary(self):
+        s = self.stats()
+        return (f"Hedging: {s['hedged']} of {s['requests']} requests hedged ({s['hedge_rate']:.1%}), "
+                f"{s['hedge_wins']} won by the hedge, {s['capped']} over the rate cap, "
+                f"current p{self.percentile} delay {s['hedge_delay_s']}s")
@@ -0,0 +1,226 @@
+"""
+Host-wide token-bucket rate limiter shared by every LLM-calling process.
+
+The extraction agent, run_predictions and any number of shards each pace
+themselves, so running them side by side adds their rates together and trips
+the provider's limits. `SharedRateLimiter` keeps one pair of buckets per
+provider (requests/min and tokens/min) in a small SQLite file that every
+process on the host opens:
+
+    buckets(name TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL, blocked_until REAL)
+
+1. `acquire(tokens)` refills both buckets for the elapsed wall-clock time and
+   takes one request plus the estimated tokens inside a `BEGIN IMMEDIATE`
+   transaction, so concurrent processes never double-spend. If either bucket
+   is short it sleeps for the computed deficit and tries again.
+2. Buckets hold BURST_SECONDS of capacity, so a full bucket releases a short
+   burst and aggregate throughput then settles at the configured rate.
+3. `settle(estimated, actual)` corrects the token bucket once the response
+   reports real usage (it may go negative: later callers wait off the debt).
+   Streamed calls (StreamResult) report no usage; they settle on the prompt
+   estimate plus the content and reasoning deltas actually streamed.
+4. `penalize(seconds)` is called on a 429: every process sharing the bucket
+   waits out the server's Retry-After, instead of each one retrying into it.
+
+Limits come from the environment (.env): `DEEPSEEK_RPM` and `DEEPSEEK_TPM`.
+Unset means no shared limit. `limited(limiter, fn, tokens)` wraps an API call
+so every attempt, including retries and hedged duplicates, acquires first.
+
+Usage:
+    limiter = SharedRateLimiter.from_env("deepseek")
+    response = retry_policy.call(limited(limiter, client.chat.completions.create, tokens), model=..., ...)
+
+    python rate_limiter.py            # show bucket levels
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from retry_policy import get_retry_after, get_status_code
+from streaming import StreamResult
+
+STATE_PATH = os.path.join(tempfile.gettempdir(), "llm_rate_limits.sqlite") # Host-wide; override with LLM_RATE_LIMIT_DB
+BURST_SECONDS = 10.0 # Bucket capacity, in seconds of the configured rate
+MAX_SLEEP = 5.0 # Re-check at least this often while waiting
+DEFAULT_PENALTY = 5.0 # Seconds all processes pause after a 429 without Retry-After
+CHARS_PER_TOKEN = 4 # Prompt token estimate when the exact count is unknown
+
+
+def estimate_tokens(prompt, max_output_tokens=None):
+    """Rough token cost of one request: prompt characters / 4 plus the output ceiling."""
+    return len(prompt) // CHARS_PER_TOKEN + (max_output_tokens or 0)
+
+
+def estimate_prompt_tokens(messages):
+    """estimate_tokens for the prompt alone, from a chat `messages` list."""
+    return sum(len(str(m.get("content") or "")) for m in messages or ()) // CHARS_PER_TOKEN
+
+
+class SharedRateLimiter:
+    """Requests/min and tokens/min buckets shared through a SQLite file. Thread- and process-safe."""
+
+    def __init__(self, name="deepseek", requests_per_minute=None, tokens_per_minute=None, path=None,
+                 burst_seconds=BURST_SECONDS):
+        self.name = name
+        self.request_rate = requests_per_minute / 60.0 if requests_per_minute else None
+        self.token_rate = tokens_per_minute / 60.0 if tokens_per_minute else None
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds) if self.request_rate else None
+        self.token_capacity = self.token_rate * burst_seconds if self.token_rate else None
+        self.path = path or os.environ.get("LLM_RATE_LIMIT_DB") or STATE_PATH
+        self.waited = 0.0
+        self.acquired = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, requests REAL, tokens REAL, "
+                          "updated REAL, blocked_until REAL)")
+
+    @classmethod
+    def from_env(cls, name="deepseek", **kwargs):
+        """Limiter configured by <NAME>_RPM / <NAME>_TPM, or None if neither is set."""
+        prefix = name.upper()
+        rpm = float(os.environ.get(f"{prefix}_RPM") or 0)
+        tpm = float(os.environ.get(f"{prefix}_TPM") or 0)
+        if not rpm and not tpm:
+            return None
+        return cls(name, requests_per_minute=rpm or None, tokens_per_minute=tpm or None, **kwargs)
+
+    def _transaction(self, update):
+        """Runs update(state, now) -> (new state or None, result) on this bucket's row under a write lock."""
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.conn.execute("SELECT requests, tokens, updated, blocked_until FROM buckets WHERE name = ?",
+                                        (self.name,)).fetchone()
+                if row is None:
+                    row = (self.request_capacity or 0.0, self.token_capacity or 0.0, now, 0.0)
+                requests, tokens, updated, blocked_until = row
+                # Refill for the time since the last update
+                elapsed = max(0.0, now - updated)
+                if self.request_rate:
+                    requests = min(self.request_capacity, requests + elapsed * self.request_rate)
+                if self.token_rate:
+                    tokens = min(self.token_capacity, tokens + elapsed * self.token_rate)
+                state, result = update([requests, tokens, blocked_until], now)
+                if state is not None:
+                    self.conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?)",
+                                      (self.name, state[0], state[1], now, state[2]))
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def acquire(self, tokens=0):
+        """Blocks until one request and `tokens` tokens are available, then takes them."""
+        start = time.monotonic()
+
+        def take(state, now):
+            requests, available, blocked_until = state
+            wait = max(0.0, blocked_until - now)
+            if self.request_rate and requests < 1.0:
+                wait = max(wait, (1.0 - requests) / self.request_rate)
+            # A request larger than the whole bucket only needs a full bucket
+            need = min(tokens, self.token_capacity) if self.token_rate else 0
+            if self.token_rate and available < need:
+                wait = max(wait, (need - available) / self.token_rate)
+            if wait > 0:
+                return state, wait
+            if self.request_rate:
+                requests -= 1.0
+            if self.token_rate:
+                available -= tokens
+            return [requests, available, blocked_until], 0.0
+
+        while True:
+            wait = self._transaction(take)
+            if wait <= 0:
+                break
+            time.sleep(min(wait, MAX_SLEEP))
+        with self._lock:
+            self.acquired += 1
+            self.waited += time.monotonic() - start
+
+    def settle(self, estimated, actual):
+        """Corrects the token bucket with the usage the response reported."""
+        if not self.token_rate or actual is None:
+            return
+
+        def correct(state, now):
+            state[1] -= actual - estimated
+            return state, None
+
+        self._transaction(correct)
+
+    def penalize(self, seconds=None):
+        """Pauses every process sharing this bucket (after a 429)."""
+        seconds = DEFAULT_PENALTY if seconds is None else seconds
+
+        def block(state, now):
+            state[2] = max(state[2], now + seconds)
+            return state, None
+
+        self._transaction(block)
+
+    def levels(self):
+        """Current (requests, tokens, blocked seconds remaining), refilled to now."""
+        return self._transaction(lambda state, now: (None, (state[0], state[1], max(0.0, state[2] - now))))
+
+    def summary(self):
+        return (f"Shared rate limit '{self.name}': {self.acquired} requests acquired, "
+                f"{self.waited:.1f}s spent waiting for capacity")
+
+    def close(self):
+        self.conn.close()
+
+
+def limited(limiter, fn, tokens=0):
+    """
+    Wraps `fn` so each call first acquires from `limiter` (no-op when it is
+    None) and a 429 pauses every process sharing the bucket.
+    """
+    if limiter is None:
+        return fn
+
+    def call(*args, **kwargs):
+        limiter.acquire(tokens)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if get_status_code(e) == 429:
+                limiter.penalize(get_retry_after(e))
+            raise
+        usage = getattr(result, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None) is not None:
+            limiter.settle(tokens, usage.total_tokens)
+        elif isinstance(result, StreamResult):
+            # No usage on a stream: prompt estimate plus the deltas actually streamed
+            limiter.settle(tokens, estimate_prompt_tokens(kwargs.get("messages"))
+                           + result.tokens + result.reasoning_tokens)
+        return result
+
+    return call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the host-wide LLM rate-limit buckets")
+    parser.add_argument("--name", default="deepseek")
+    parser.add_argument("--state", default=None, help=f"State file (default {STATE_PATH})")
+    args = parser.parse_args()
+    limiter = SharedRateLimiter.from_env(args.name, path=args.state)
+    if limiter is None:
+        print(f"No shared limit configured ({args.name.upper()}_RPM / {args.name.upper()}_TPM unset).")
+        return
+    requests, tokens, blocked = limiter.levels()
+    print(f"{args.name}: {requests:.1f} requests, {tokens:.0f} tokens available"
+          + (f", blocked for {blocked:.1f}s after a 429" if blocked else ""))
+    limiter.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Shared retry policy for DeepSeek (OpenAI-compatible) API calls.
+
+Used by both PhaseI_Endpoint_extraction/analyze_reasons_deepseek.py and
+Prediction/run_predictions.py so that every LLM call in the project backs off
+the same way:
+
+1. Exponential backoff with full jitter between attempts.
+2. `Retry-After` / `retry-after-ms` response headers are honoured when present.
+3. Retryable errors (429, 408, 5xx, timeouts, dropped connections) are retried;
+   fatal errors (400, 401, 403, 404, 409, 422, programming errors) are raised at once.
+4. A circuit breaker shared by all workers in the process: after a run of
+   consecutive retryable failures it opens and every caller pauses until the
+   cool-down expires, instead of each worker hammering a provider that is down.
+
+The OpenAI client has its own internal retries; create it with `max_retries=0`
+so that this policy is the only one in charge.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+try:
+    import openai
+    _TRANSIENT_EXCEPTIONS = (openai.APITimeoutError, openai.APIConnectionError, TimeoutError, ConnectionError)
+except ImportError:  # openai is only needed for the exception classes
+    _TRANSIENT_EXCEPTIONS = (TimeoutError, ConnectionError)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+
+
+class FatalAPIError(Exception):
+    """Raised when retries are exhausted or the error is not worth retrying."""
+
+    def __init__(self, message, last_exception=None):
+        super().__init__(message)
+        self.last_exception = last_exception
+
+
+def get_status_code(exc):
+    """Returns the HTTP status code carried by an API exception, if any."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable(exc):
+    """True for rate limits, server errors, timeouts and connection drops."""
+    if isinstance(exc, _TRANSIENT_EXCEPTIONS):
+        return True
+    status = get_status_code(exc)
+    if status is None:
+        return False
+    return status in RETRYABLE_STATUS_CODES or status >= 500
+
+
+def get_retry_after(exc):
+    """
+    Extracts the server-requested wait (seconds) from `retry-after-ms` or
+    `Retry-After` headers. Returns None when the header is absent or unparsable.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000.0, 0.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    # HTTP-date form, e.g. "Wed, 21 Oct 2015 07:28:00 GMT"
+    try:
+        when = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """
+    Process-wide breaker: opens after `failure_threshold` consecutive retryable
+    failures and makes every caller wait out `cooldown` seconds. The cool-down
+    doubles (up to `max_cooldown`) each time a probe after re-opening fails.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=300.0, sleep=time.sleep):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return time.monotonic() < self._open_until
+
+    def wait_until_closed(self):
+        """Blocks the calling worker while the breaker is open."""
+        while True:
+            with self._lock:
+                remaining = self._open_until - time.monotonic()
+            if remaining <= 0:
+                return
+            print(f"  Circuit open: pausing {remaining:.1f}s for provider recovery...")
+            self._sleep(remaining)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._cooldown = self.base_cooldown
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures < self.failure_threshold:
+                return
+            now = time.monotonic()
+            if now < self._open_until:
+                return  # already open, another worker tripped it
+            self._open_until = now + self._cooldown
+            print(f"  Circuit breaker opened after {self._consecutive_failures} consecutive failures "
+                  f"(cool-down {self._cooldown:.0f}s).")
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+
+
+# One breaker per process, shared by every client that uses the default policy.
+DEFAULT_BREAKER = CircuitBreaker()
+
+
+class RetryPolicy:
+    """
+    Wraps a callable with backoff, Retry-After handling and the circuit breaker.
+
+    Usage:
+        policy = RetryPolicy(max_retries=5)
+        response = policy.call(client.chat.completions.create, model=..., messages=...)
+    """
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, max_retry_after=300.0,
+                 breaker=None, sleep=time.sleep):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.breaker = breaker if breaker is not None else DEFAULT_BREAKER
+        self._sleep = sleep
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff for the given 0-based attempt."""
+        cap = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    def next_delay(self, exc, attempt):
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return self.backoff_delay(attempt)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls `fn(*args, **kwargs)` until it succeeds. Raises FatalAPIError when
+        the error is not retryable or `max_retries` retries have been used.
+        """
+        attempts = self.max_retries + 1
+        for attempt in range(attempts):
+            self.breaker.wait_until_closed()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise FatalAPIError(f"Non-retryable API error: {e}", last_exception=e) from e
+
+                self.breaker.record_failure()
+                if attempt == attempts - 1:
+                    raise FatalAPIError(f"Giving up after {attempts} attempts: {e}", last_exception=e) from e
+
+                delay = self.next_delay(e, attempt)
+                print(f"  API Error (Attempt {attempt+1}/{attempts}, status={get_status_code(e)}): {e} "
+                      f"-- retrying in {delay:.1f}s")
+                self._sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
@@ -0,0 +1,142 @@
+"""
+Coordination-free sharding for LLM extraction runs.
+
+Each machine runs the same command with `--shard i/N`. A trial belongs to
+shard `stable_hash(nct_id) % N`, so every node agrees on the partition without
+talking to the others, and re-running a shard never touches another shard's
+trials. Every shard writes its own output file (one per model in multi-model
+mode); `merge_shards` combines them afterwards, per model, and reports
+duplicates.
+
+Per-shard API keys and quotas come from a small JSON file:
+
+    {
+      "default": {"api_key_env": "DEEPSEEK_API_KEY", "requests_per_minute": 60},
+      "0": {"api_key_env": "DEEPSEEK_API_KEY_A", "max_requests": 5000},
+      "1": {"api_key_env": "DEEPSEEK_API_KEY_B", "requests_per_minute": 30}
+    }
+
+Keys are never stored in the file, only the name of the environment variable
+that holds them.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+
+import pandas as pd
+
+from fanout import model_output_path
+
+
+def stable_shard(nct_id, num_shards):
+    """Shard index of a trial; identical on every machine and Python version."""
+    digest = hashlib.md5(str(nct_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def parse_shard(spec):
+    """Parses 'i/N' into (i, N) with 0 <= i < N."""
+    try:
+        index, total = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{spec}', expected i/N (e.g. 0/4)")
+    if total < 1 or not 0 <= index < total:
+        raise ValueError(f"Invalid shard spec '{spec}': need 0 <= i < N")
+    return index, total
+
+
+def shard_mask(nct_ids, shard_index, num_shards):
+    """Boolean Series selecting the trials that belong to this shard."""
+    return nct_ids.map(lambda x: stable_shard(x, num_shards) == shard_index)
+
+
+def shard_output_path(output_file, shard_index, num_shards):
+    """output.csv -> output.shard-0-of-4.csv"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.shard-{shard_index}-of-{num_shards}{ext}"
+
+
+def load_shard_config(config_file, shard_index):
+    """Merged 'default' + per-shard settings, or {} if no config file is given."""
+    if not config_file:
+        return {}
+    with open(config_file, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    settings = dict(config.get("default", {}))
+    if shard_index is not None:
+        settings.update(config.get(str(shard_index), {}))
+    return settings
+
+
+def _shard_groups(output_file):
+    """
+    {merged output path: [shard files]} for the shards of `output_file`:
+    `<output>.shard-i-of-N.csv` merge into `output_file`, and the per-model
+    files of multi-model mode, `<output>.shard-i-of-N.<model>.csv`, into
+    `<output>.<model>.csv` (fanout.model_output_path).
+    """
+    root, ext = os.path.splitext(output_file)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.shard-(\d+)-of-(\d+)(?:\.(.+))?$")
+    groups = {}
+    for path in sorted(glob.glob(f"{root}.shard-*{ext}")):
+        match = pattern.match(os.path.splitext(os.path.basename(path))[0])
+        if not match:
+            continue
+        model = match.group(3)
+        target = model_output_path(output_file, model) if model else output_file
+        groups.setdefault(target, []).append(path)
+    return groups
+
+
+def _has_text(values):
+    """True where a column holds a non-empty value (NaN and "" count as empty)."""
+    return values.notna() & (values.astype(str).str.strip() != "")
+
+
+def merge_shards(output_file, id_col="nct_id"):
+    """
+    Combines the `<output>.shard-i-of-N.csv` files into `output_file`, and
+    each model's `<output>.shard-i-of-N.<model>.csv` files into its own
+    `<output>.<model>.csv`, so multi-model results are never mixed.
+
+    Duplicates (same id in several rows, e.g. after changing N mid-run) are
+    reported; rows without an `error` are preferred, then rows with empty
+    `validation_errors`, then the first seen.
+    Returns {merged output path: merged DataFrame}.
+    """
+    groups = _shard_groups(output_file)
+    if not groups:
+        root, ext = os.path.splitext(output_file)
+        raise FileNotFoundError(f"No shard files matching {root}.shard-<i>-of-<N>[.<model>]{ext}")
+    return {target: _merge_files(shard_files, target, id_col) for target, shard_files in groups.items()}
+
+
+def _merge_files(shard_files, output_file, id_col):
+    frames = []
+    for path in shard_files:
+        df = pd.read_csv(path)
+        df["source_shard"] = os.path.basename(path)
+        print(f"  {os.path.basename(path)}: {len(df)} rows")
+        frames.append(df)
+    merged = pd.concat(frames, ignore_index=True)
+
+    dup_mask = merged.duplicated(subset=[id_col], keep=False)
+    if dup_mask.any():
+        dups = merged[dup_mask]
+        print(f"Warning: {dups[id_col].nunique()} {id_col}s appear in more than one row of {os.path.basename(output_file)}:")
+        print(dups.groupby(id_col)["source_shard"].apply(lambda s: ", ".join(s)).head(20).to_string())
+        none = pd.Series(False, index=merged.index)
+        has_error = _has_text(merged["error"]) if "error" in merged.columns else none
+        invalid = _has_text(merged["validation_errors"]) if "validation_errors" in merged.columns else none
+        merged = (merged.assign(_has_error=has_error, _invalid=invalid)
+                  .sort_values(["_has_error", "_invalid"], kind="stable")
+                  .drop_duplicates(subset=[id_col], keep="first")
+                  .drop(columns=["_has_error", "_invalid"])
+                  .sort_index())
+
+    merged.to_csv(output_file, index=False)
+    print(f"Merged {len(shard_files)} shards -> {len(merged)} unique rows in {output_file}")
+    return merged
@@ -0,0 +1,198 @@
+"""
+Streaming chat completions with early termination.
+
+Both LLM clients (analyze_reasons_deepseek.py and run_predictions.py) ask for
+a single JSON object, but a non-streaming call waits for the whole completion,
+including anything the model writes after the object closes and, for
+`deepseek-reasoner`, its full reasoning trace. `stream_completion` instead:
+
+1. Requests `stream=True` and consumes deltas as they arrive.
+2. Records time-to-first-token (any delta, reasoning or content) and total time.
+3. Watches the content for the first complete top-level JSON object (brace
+   matching that respects strings and escapes) and closes the stream as soon
+   as it is complete, so no further output tokens are read.
+4. Enforces per-request ceilings: `max_output_tokens` (streamed content
+   deltas only, so a reasoning trace cannot use up the answer's budget),
+   an optional separate `max_reasoning_tokens` (reasoning deltas), and
+   `max_seconds` (wall clock, also used as the HTTP timeout so a stalled
+   first token cannot hang the run).
+
+DeepSeek counts the reasoning trace of reasoning models against the
+server-side `max_tokens`, so for those (`is_reasoning_model`) `max_tokens` is
+only sent when a reasoning ceiling is given, as the sum of both ceilings
+(`server_max_tokens`, also used by the clients' non-streaming calls).
+
+The result carries `stop_reason`: "json_complete", "finished" (the model ended
+on its own), "token_limit", "reasoning_limit", "time_limit" or "cancelled" (`cancel_event` was
+set, e.g. by HedgePolicy when the other copy of a hedged request won). When a ceiling is hit the partial
+content is returned as-is; callers treat it like any other unparseable reply.
+
+Wrap the call in `RetryPolicy.call(stream_completion, client, ...)` so dropped
+connections mid-stream are retried like any other transient error.
+"""
+
+import time
+
+REASONING_MODEL_MARKERS = ("reasoner",) # Model names containing these stream a reasoning trace
+
+
+def is_reasoning_model(model):
+    """True for models whose output starts with a reasoning trace (e.g. deepseek-reasoner)."""
+    return any(marker in str(model or "").lower() for marker in REASONING_MODEL_MARKERS)
+
+
+def server_max_tokens(model, max_output_tokens=None, max_reasoning_tokens=None):
+    """
+    `max_tokens` to send for these ceilings, or None to send none. Reasoning
+    models count their trace against it, so they get the sum of both
+    ceilings, and none at all without a reasoning ceiling.
+    """
+    if max_output_tokens is None:
+        return None
+    if not is_reasoning_model(model):
+        return max_output_tokens
+    return max_output_tokens + max_reasoning_tokens if max_reasoning_tokens is not None else None
+
+
+class JsonObjectDetector:
+    """Incrementally finds the end of the first top-level JSON object in a text stream."""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.consumed = 0
+
+    def feed(self, text):
+        """
+        Consumes the next piece of text. Returns the number of characters of
+        this piece that belong to the stream up to and including the closing
+        brace of the object, or -1 if the object is not complete yet.
+        """
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                if self.started:
+                    self.in_string = True
+            elif ch == '{':
+                self.depth += 1
+                self.started = True
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.consumed += i + 1
+                    return i + 1
+        self.consumed += len(text)
+        return -1
+
+
+class StreamResult:
+    """Text and timing of one streamed completion."""
+
+    def __init__(self):
+        self.content = ""
+        self.reasoning_content = ""
+        self.ttft = None # Seconds until the first token (reasoning or content)
+        self.elapsed = None
+        self.tokens = 0 # Streamed content deltas (approximately one token each)
+        self.reasoning_tokens = 0 # Streamed reasoning deltas
+        self.stop_reason = None
+        self.system_fingerprint = None
+
+    def as_dict(self):
+        """Telemetry fields for result rows."""
+        return {
+            "ttft_s": round(self.ttft, 3) if self.ttft is not None else None,
+            "latency_s": round(self.elapsed, 3) if self.elapsed is not None else None,
+            "streamed_tokens": self.tokens,
+            "reasoning_tokens": self.reasoning_tokens,
+            "stop_reason": self.stop_reason,
+        }
+
+
+def stream_completion(client, max_output_tokens=None, max_seconds=None, stop_at_json=True, cancel_event=None,
+                      max_reasoning_tokens=None, **create_kwargs):
+    """
+    Streams one chat completion and returns a StreamResult.
+
+    Args:
+        client: OpenAI-compatible client (DeepSeek).
+        max_output_tokens: client-side ceiling on streamed content tokens
+            (also sent as `max_tokens` unless the caller set one; for reasoning
+            models only together with `max_reasoning_tokens`).
+        max_reasoning_tokens: client-side ceiling on streamed reasoning tokens.
+        max_seconds: wall-clock ceiling for the whole request.
+        stop_at_json: close the stream once a complete JSON object was received.
+        cancel_event: threading.Event; when set, the stream is closed at the next chunk.
+        create_kwargs: passed to `client.chat.completions.create` (model, messages, ...).
+    """
+    max_tokens = server_max_tokens(create_kwargs.get("model"), max_output_tokens, max_reasoning_tokens)
+    if max_tokens is not None:
+        create_kwargs.setdefault("max_tokens", max_tokens)
+    if max_seconds is not None:
+        create_kwargs.setdefault("timeout", max_seconds)
+
+    result = StreamResult()
+    detector = JsonObjectDetector() if stop_at_json else None
+    start = time.monotonic()
+    stream = client.chat.completions.create(stream=True, **create_kwargs)
+    parts = []
+    reasoning_parts = []
+    try:
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                result.stop_reason = "cancelled"
+                break
+            if result.system_fingerprint is None:
+                result.system_fingerprint = getattr(chunk, "system_fingerprint", None)
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta
+            reasoning = getattr(delta, "reasoning_content", None)
+            text = delta.content if delta is not None else None
+
+            if (reasoning or text) and result.ttft is None:
+                result.ttft = time.monotonic() - start
+            if reasoning:
+                result.reasoning_tokens += 1
+                reasoning_parts.append(reasoning)
+            if text:
+                result.tokens += 1
+                if detector is not None:
+                    end = detector.feed(text)
+                    if end >= 0:
+                        parts.append(text[:end])
+                        result.stop_reason = "json_complete"
+                        break
+                parts.append(text)
+
+            if choice.finish_reason is not None:
+                result.stop_reason = "finished"
+                break
+            if max_output_tokens is not None and result.tokens >= max_output_tokens:
+                result.stop_reason = "token_limit"
+                break
+            if max_reasoning_tokens is not None and result.reasoning_tokens >= max_reasoning_tokens:
+                result.stop_reason = "reasoning_limit"
+                break
+            if max_seconds is not None and time.monotonic() - start >= max_seconds:
+                result.stop_reason = "time_limit"
+                break
+        else:
+            result.stop_reason = "finished"
+    finally:
+        # Closing the response stops the server from sending the remaining tokens
+        stream.close()
+
+    result.elapsed = time.monotonic() - start
+    result.content = "".join(parts)
+    result.reasoning_content = "".join(reasoning_parts)
+    return result
@@ -0,0 +1,140 @@
+"""
+Schema validation of LLM responses and the stricter prompt used to repair them.
+
+A reply that parses as JSON is not necessarily usable: the model may invent a
+category ("UNKNOWN_INSUFFICIENT_INFO"), drop a required key or answer with a
+confidence outside the allowed values. Both clients validate every response:
+
+- `validate_extraction` (analyze_reasons_deepseek.py): `primary_reasons` is a
+  non-empty list of taxonomy categories, every reason has a
+  `reasoning_traces` entry, `confidence` is High/Medium/Low, `explanation` is
+  present and `nct_id` (if given) is the trial that was asked about.
+- `validate_prediction` (run_predictions.py): `prediction` is one of
+  PREDICTION_CATEGORIES, `reason` is non-empty, `confidence` is 0, 0.5 or 1.
+
+Values that only differ in case or separators ("negative", "0.5") are
+canonicalized instead of rejected. Each validator returns (cleaned dict,
+list of error strings); an empty list means the response is valid.
+
+Invalid and failed trials are kept in the output with their errors, and each
+client's `--repair` mode re-issues only those trials with `repair_prompt`,
+which appends the errors and the previous output to the original prompt.
+"""
+
+import re
+
+EXTRACTION_CONFIDENCE = ("High", "Medium", "Low")
+PREDICTION_CATEGORIES = ("Enrollment", "Administrative", "Safety", "Efficacy")
+PREDICTION_CONFIDENCE = (0, 0.5, 1)
+MAX_PREVIOUS_OUTPUT = 2000 # Characters of the invalid reply quoted back to the model
+
+
+def _key(value):
+    """Case/spacing/separator-insensitive key: 'Safety and side-effects' -> 'SAFETYANDSIDEEFFECTS'."""
+    return re.sub(r'[^A-Z0-9]', '', str(value).upper())
+
+
+def canonical_choice(value, allowed):
+    """The entry of `allowed` that `value` matches (ignoring case and separators), or None."""
+    lookup = {_key(a): a for a in allowed}
+    return lookup.get(_key(value)) if isinstance(value, str) else None
+
+
+def load_taxonomy_categories(path):
+    """Category names of the taxonomy file ('Name: description' lines after the title)."""
+    categories = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name, sep, _ = line.partition(":")
+            if sep and name.strip():
+                categories.append(name.strip())
+    return categories
+
+
+def _parse_error(data):
+    if not isinstance(data, dict):
+        return ["response is not a JSON object"]
+    if data.get("error") == "json_parse_error":
+        return ["response is not valid JSON"]
+    return []
+
+
+def validate_extraction(data, categories, nct_id=None):
+    """Validates one termination-reason extraction. Returns (cleaned, errors)."""
+    errors = _parse_error(data)
+    if errors:
+        return data, errors
+    cleaned = dict(data)
+
+    reasons = data.get("primary_reasons")
+    if not isinstance(reasons, list) or not reasons:
+        errors.append("primary_reasons must be a non-empty list of taxonomy categories")
+        reasons = []
+    canonical_reasons = []
+    for reason in reasons:
+        canonical = canonical_choice(reason, categories)
+        if canonical is None:
+            errors.append(f"unknown category '{reason}'")
+        else:
+            canonical_reasons.append(canonical)
+    if canonical_reasons:
+        cleaned["primary_reasons"] = canonical_reasons
+
+    traces = data.get("reasoning_traces")
+    if not isinstance(traces, dict):
+        errors.append("reasoning_traces must be an object keyed by category")
+    else:
+        traced = {canonical_choice(k, categories) for k in traces}
+        missing = [r for r in canonical_reasons if r not in traced]
+        if missing:
+            errors.append(f"reasoning_traces has no entry for {missing}")
+
+    confidence = canonical_choice(data.get("confidence"), EXTRACTION_CONFIDENCE)
+    if confidence is None:
+        errors.append(f"confidence must be one of {list(EXTRACTION_CONFIDENCE)}, got {data.get('confidence')!r}")
+    else:
+        cleaned["confidence"] = confidence
+
+    if not str(data.get("explanation") or "").strip():
+        errors.append("explanation is missing")
+    if nct_id is not None and data.get("nct_id") not in (None, "", nct_id):
+        errors.append(f"nct_id is {data.get('nct_id')!r}, expected {nct_id!r}")
+    return cleaned, errors
+
+
+def validate_prediction(data):
+    """Validates one termination-category prediction. Returns (cleaned, errors)."""
+    errors = _parse_error(data)
+    if errors:
+        return data, errors
+    cleaned = dict(data)
+
+    prediction = canonical_choice(data.get("prediction"), PREDICTION_CATEGORIES)
+    if prediction is None:
+        errors.append(f"prediction must be one of {list(PREDICTION_CATEGORIES)}, got {data.get('prediction')!r}")
+    else:
+        cleaned["prediction"] = prediction
+
+    if not str(data.get("reason") or "").strip():
+        errors.append("reason is missing")
+
+    try:
+        confidence = float(data.get("confidence"))
+    except (TypeError, ValueError):
+        confidence = None
+    if confidence not in PREDICTION_CONFIDENCE:
+        errors.append(f"confidence must be one of {list(PREDICTION_CONFIDENCE)}, got {data.get('confidence')!r}")
+    else:
+        cleaned["confidence"] = int(confidence) if confidence.is_integer() else confidence
+    return cleaned, errors
+
+
+def repair_prompt(prompt, errors, previous_output=None):
+    """The original prompt plus the validation errors of the previous attempt."""
+    lines = [prompt.rstrip(), "", "IMPORTANT: your previous answer for this trial was rejected:"]
+    lines += [f"- {error}" for error in errors]
+    if previous_output:
+        lines += ["", "Previous answer:", str(previous_output)[:MAX_PREVIOUS_OUTPUT]]
+    lines += ["", "Answer again. Return ONLY one JSON object with exactly the required keys, "
+                  "using only the allowed category names and confidence values listed above."]
+    return "\n".join(lines)
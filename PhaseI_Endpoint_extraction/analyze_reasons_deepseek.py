@@ -5,23 +5,72 @@ import pandas as pd
 from openai import OpenAI
 import json
 import time
+import threading
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "LLM_client"))
+from retry_policy import RetryPolicy, FatalAPIError
+from sharding import parse_shard, shard_mask, shard_output_path, load_shard_config, merge_shards
+from streaming import server_max_tokens, stream_completion
+from validation import load_taxonomy_categories, validate_extraction, repair_prompt
+from fanout import parse_models, model_output_path, fan_out
+from hedging import HedgePolicy
+from rate_limiter import SharedRateLimiter, estimate_tokens, limited
+from compact_schema import (OutputSavings, compact_extraction_prompt, expand_extraction, numbered_taxonomy,
+                            max_output_tokens as compact_max_output_tokens)
+
 # Load environment variables
 load_dotenv()
 
 class DeepSeekAnalysisAgent:
-    def __init__(self, input_file, output_file, taxonomy_file, model="deepseek-chat"):
+    def __init__(self, input_file, output_file, taxonomy_file, model="deepseek-chat", max_retries=5,
+                 shard=None, api_key_env="DEEPSEEK_API_KEY", max_requests=None, requests_per_minute=None,
+                 stream=False, max_output_tokens=None, max_seconds=None, max_repair_attempts=2, hedge=False,
+                 compact=False, compact_evidence=False, max_reasoning_tokens=None):
         self.input_file = input_file
         self.output_file = output_file
         self.taxonomy_file = taxonomy_file
         self.model = model
+        self.retry_policy = RetryPolicy(max_retries=max_retries)
+        
+        # Sharding / quota (see LLM_client/sharding.py)
+        self.shard = shard # (index, total) or None
+        self.max_requests = max_requests
+        self.min_interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._last_request_at = 0.0
+        self._pace_lock = threading.Lock() # Worker threads share the pacing slot in multi-model runs
+        
+        # Compact output schema: category codes instead of traces (see LLM_client/compact_schema.py)
+        self.compact = compact or compact_evidence
+        self.compact_evidence = compact_evidence
+        self.savings = None
+        if self.compact and max_output_tokens is None:
+            # Answer tokens only: reasoning models get no server-side cap (see server_max_tokens)
+            max_output_tokens = compact_max_output_tokens(compact_evidence)
+        
+        # Streaming / per-request ceilings (see LLM_client/streaming.py)
+        self.stream = stream
+        self.max_output_tokens = max_output_tokens
+        self.max_reasoning_tokens = max_reasoning_tokens
+        self.max_tokens = server_max_tokens(model, max_output_tokens, max_reasoning_tokens) # Sent to the API
+        self.max_seconds = max_seconds
+        self.last_call_stats = {}
         
-        self.api_key = os.environ.get("DEEPSEEK_API_KEY")
+        # Hedged requests against stragglers (see LLM_client/hedging.py); one policy per model
+        self.hedge_policy = HedgePolicy() if hedge else None
+        
+        # Host-wide RPM/TPM buckets shared with every other LLM process (DEEPSEEK_RPM / DEEPSEEK_TPM)
+        self.rate_limiter = SharedRateLimiter.from_env("deepseek")
+        
+        # Schema validation / repair queue (see LLM_client/validation.py)
+        self.max_repair_attempts = max_repair_attempts
+        
+        self.api_key = os.environ.get(api_key_env)
         if not self.api_key:
-            raise ValueError("DEEPSEEK_API_KEY environment variable not set.")
+            raise ValueError(f"{api_key_env} environment variable not set.")
             
-        self.client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
+        # Retries are handled by the shared RetryPolicy, not by the client
+        self.client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com", max_retries=0)
         
         # Hardcoded System Prompt Template
         self.system_template = r"""You are a precise and methodical clinical research analyst. Your task is to extract and categorize the primary reasons for clinical trial termination from provided data. You must always output a valid JSON object and include clear reasoning based on explicit text evidence.
@@ -84,6 +133,11 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
             
         with open(self.taxonomy_file, 'r', encoding='utf-8') as f:
             self.taxonomy_content = f.read()
+        self.categories = load_taxonomy_categories(self.taxonomy_file)
+        if self.compact:
+            # Same task, rules and worked example; only the output block and the example's answer change
+            self.compact_template = compact_extraction_prompt(self.system_template, self.categories, self.compact_evidence)
+            self.savings = self._output_savings()
             
     def _get_processed_ids(self):
         """Builds Preference Index from existing output file."""
@@ -91,26 +145,42 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
             return set()
             
         try:
-            df = pd.read_csv(self.output_file)
+            # Only the ID column is parsed (raw responses make the file large)
+            df = pd.read_csv(self.output_file, usecols=lambda c: c == 'nct_id', dtype=str)
             if 'nct_id' in df.columns:
-                return set(df['nct_id'].astype(str).unique())
+                return set(df['nct_id'].unique())
         except Exception as e:
             print(f"Warning: Could not read existing output file to build index: {e}")
             
         return set()
 
-    def construct_prompt(self, row):
-        """Constructs the prompt by injecting taxonomy and trial data."""
-        # Inject Taxonomy
-        prompt = self.system_template.replace("{TAXONOMY_BLOCK}", self.taxonomy_content)
-        
-        # Format Trial Data
-        trial_data = {
+    def _output_savings(self):
+        """OutputSavings against the full-schema rows already in the output file."""
+        rows = []
+        if os.path.exists(self.output_file):
+            columns = ("output_schema", "completion_tokens", "latency_s")
+            rows = pd.read_csv(self.output_file, usecols=lambda c: c in columns).to_dict('records')
+        return OutputSavings(rows)
+
+    @staticmethod
+    def _trial_data(row):
+        return {
             "nct_id": row.get('nct_id', 'N/A'),
             "why_stopped": row.get('why_stopped', 'N/A'),
             "brief_summary": row.get('brief_summary', 'N/A'),
             "detailed_description": row.get('detailed_description', 'N/A')
         }
+
+    def construct_prompt(self, row):
+        """Constructs the prompt by injecting taxonomy and trial data."""
+        # Inject Taxonomy (numbered, with the codes-only output block, in compact mode)
+        if self.compact:
+            prompt = self.compact_template.replace("{TAXONOMY_BLOCK}", numbered_taxonomy(self.taxonomy_content, self.categories))
+        else:
+            prompt = self.system_template.replace("{TAXONOMY_BLOCK}", self.taxonomy_content)
+        
+        # Format Trial Data
+        trial_data = self._trial_data(row)
         trial_json_str = json.dumps(trial_data, indent=2)
         
         # Inject Trial Data
@@ -118,21 +188,78 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
         
         return prompt, trial_data['nct_id']
 
+    def _pace(self):
+        """Keeps this shard under its configured requests_per_minute."""
+        with self._pace_lock:
+            # Reserve the next slot, then sleep outside the lock
+            slot = max(time.monotonic(), self._last_request_at + self.min_interval)
+            self._last_request_at = slot
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
     def call_api(self, prompt):
-        """Calls DeepSeek API with retries."""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = self.client.chat.completions.create(
+        """Calls DeepSeek API with backoff/circuit-breaker retries (see LLM_client/retry_policy.py)."""
+        content, self.last_call_stats = self.request(prompt)
+        return content
+
+    def _send(self, fn, *args, token_estimate=0, **kwargs):
+        """
+        RetryPolicy.call, with each attempt (and each hedged copy) taken from the
+        shared rate limit first, and hedged when hedging is enabled.
+        """
+        cancel_kwarg = "cancel_event" if fn is stream_completion else None
+        fn = limited(self.rate_limiter, fn, token_estimate)
+        if self.hedge_policy is None:
+            return self.retry_policy.call(fn, *args, **kwargs)
+        return self.retry_policy.call(self.hedge_policy.call, fn, *args, cancel_kwarg=cancel_kwarg, **kwargs)
+
+    def _hedge_stats(self):
+        return self.hedge_policy.last_outcome() if self.hedge_policy is not None else {}
+
+    def request(self, prompt):
+        """
+        One API call; returns (content or None, streaming stats). Keeps no
+        per-call state on the agent, so worker threads can share it.
+        """
+        self._pace()
+        token_estimate = estimate_tokens(prompt, self.max_tokens)
+        try:
+            if self.stream:
+                # Stops reading at the first complete JSON object or a ceiling
+                result = self._send(
+                    stream_completion,
+                    self.client,
+                    token_estimate=token_estimate,
+                    max_output_tokens=self.max_output_tokens,
+                    max_reasoning_tokens=self.max_reasoning_tokens,
+                    max_seconds=self.max_seconds,
                     model=self.model,
                     messages=[{"role": "user", "content": prompt}],
                     response_format={'type': 'json_object'}
                 )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"  API Error (Attempt {attempt+1}/{max_retries}): {e}")
-                time.sleep(2)
-        return None
+                stats = {**result.as_dict(), "completion_tokens": result.tokens + result.reasoning_tokens,
+                         **self._hedge_stats()}
+                print(f"  TTFT {stats['ttft_s']}s, total {stats['latency_s']}s, "
+                      f"{result.tokens} tokens + {result.reasoning_tokens} reasoning ({result.stop_reason})")
+                return result.content, stats
+            start = time.monotonic()
+            response = self._send(
+                self.client.chat.completions.create,
+                token_estimate=token_estimate,
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format={'type': 'json_object'},
+                **({"max_tokens": self.max_tokens} if self.max_tokens else {}),
+                **({"timeout": self.max_seconds} if self.max_seconds else {})
+            )
+            usage = getattr(response, "usage", None)
+            stats = {"latency_s": round(time.monotonic() - start, 3),
+                     "completion_tokens": getattr(usage, "completion_tokens", None), **self._hedge_stats()}
+            return response.choices[0].message.content, stats
+        except FatalAPIError as e:
+            print(f"  API Error: {e}")
+        return None, {}
 
     def parse_response(self, response_text):
         """Parses JSON response."""
@@ -148,11 +275,120 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
         except json.JSONDecodeError as e:
             return {"error": "json_parse_error", "raw_output": response_text}
 
+    def build_result_row(self, row, response_text, repair_attempts=0, call_stats=None):
+        """Parses and validates one response into an output row."""
+        nct_id = row.get('nct_id', 'Unknown')
+        parsed_data = self.parse_response(response_text)
+        if self.compact:
+            parsed_data = expand_extraction(parsed_data, self.categories, self._trial_data(row))
+        cleaned, errors = validate_extraction(parsed_data, self.categories, nct_id=nct_id)
+        
+        result_row = {
+            "nct_id": nct_id,
+            "input_why_stopped": row.get('why_stopped'),
+            "model": self.model,
+            "raw_response": response_text
+        }
+        call_stats = self.last_call_stats if call_stats is None else call_stats
+        result_row.update(call_stats)
+        result_row["output_schema"] = "compact" if self.compact else "full"
+        if self.compact and self.savings is not None:
+            result_row.update(self.savings.record(call_stats))
+        if isinstance(cleaned, dict):
+            # The requested nct_id is kept even if the model echoed another one
+            result_row.update({k: v for k, v in cleaned.items() if k != "nct_id"})
+        # Empty when the response passed validation
+        result_row["validation_errors"] = "; ".join(errors)
+        result_row["repair_attempts"] = repair_attempts
+        if errors:
+            print(f"  Invalid response for {nct_id}: {'; '.join(errors)}")
+        return result_row
+
     def save_result(self, result_row):
         """Appends a single result to the output CSV (Checkpoint)."""
         df = pd.DataFrame([result_row])
-        header = not os.path.exists(self.output_file)
-        df.to_csv(self.output_file, mode='a', header=header, index=False)
+        if not os.path.exists(self.output_file):
+            df.to_csv(self.output_file, index=False)
+            return
+        header = pd.read_csv(self.output_file, nrows=0).columns.tolist()
+        if set(df.columns) - set(header):
+            # New columns (e.g. validation fields on an older file): rewrite with the union
+            existing = pd.read_csv(self.output_file)
+            self._write_results(pd.concat([existing, df], ignore_index=True))
+            return
+        df.reindex(columns=header).to_csv(self.output_file, mode='a', header=False, index=False)
+
+    def _write_results(self, df):
+        tmp_path = self.output_file + ".tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.output_file)
+
+    def _row_errors(self, result):
+        """Validation errors of a saved row (re-validated from raw_response for rows written before validation)."""
+        stored = result.get('validation_errors')
+        if 'validation_errors' in result and isinstance(stored, str):
+            return [e for e in stored.split("; ") if e]
+        if 'validation_errors' in result and pd.isna(stored) and not pd.isna(result.get('repair_attempts')):
+            return []
+        raw = result.get('raw_response')
+        if not isinstance(raw, str) or not raw.strip():
+            return ["no response recorded"]
+        parsed = self.parse_response(raw)
+        if result.get('output_schema') == "compact":
+            parsed = expand_extraction(parsed, self.categories)
+        _, errors = validate_extraction(parsed, self.categories, nct_id=str(result.get('nct_id')))
+        return errors
+
+    def repair(self, limit=None):
+        """
+        Re-queries only trials whose saved result failed validation, with the
+        errors appended to the prompt. Repaired rows replace the old ones in
+        place; trials are retried at most max_repair_attempts times.
+        """
+        self.load_resources()
+        if not os.path.exists(self.output_file):
+            print(f"No results at {self.output_file}; nothing to repair.")
+            return
+        results = pd.read_csv(self.output_file)
+        input_df = pd.read_csv(self.input_file)
+        inputs = {str(r['nct_id']): r for r in input_df.to_dict('records')}
+
+        queue = []
+        for position, result in enumerate(results.to_dict('records')):
+            errors = self._row_errors(result)
+            attempts = result.get('repair_attempts')
+            attempts = 0 if pd.isna(attempts) else int(attempts)
+            if errors and attempts < self.max_repair_attempts and str(result['nct_id']) in inputs:
+                queue.append((position, result, errors, attempts))
+        print(f"Repair queue: {len(queue)} invalid results (of {len(results)}) in {self.output_file}")
+        if limit:
+            queue = queue[:limit]
+
+        repaired = {}
+        fixed = 0
+        try:
+            for position, result, errors, attempts in queue:
+                nct_id = str(result['nct_id'])
+                print(f"Repairing {nct_id} (attempt {attempts + 1}): {'; '.join(errors)}")
+                prompt, _ = self.construct_prompt(inputs[nct_id])
+                response_text = self.call_api(repair_prompt(prompt, errors, result.get('raw_response')))
+                if not response_text:
+                    print(f"  Failed to get response for {nct_id}")
+                    continue
+                new_row = self.build_result_row(inputs[nct_id], response_text, repair_attempts=attempts + 1)
+                repaired[position] = new_row
+                fixed += not new_row["validation_errors"]
+        finally:
+            # Written even if interrupted, so completed repairs are never lost
+            if repaired:
+                columns = list(dict.fromkeys(list(results.columns) + [k for r in repaired.values() for k in r]))
+                results = results.reindex(columns=columns).astype(object)
+                for position, new_row in repaired.items():
+                    results.loc[position] = pd.Series(new_row).reindex(columns)
+                self._write_results(results)
+        print(f"Repair completed. {fixed} of {len(repaired)} re-queried trials are now valid.")
+        if self.savings is not None:
+            print(self.savings.summary())
 
     def run(self, limit=None):
         """Main execution loop with Preference Index."""
@@ -160,6 +396,8 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
         print(f"Input: {self.input_file}")
         print(f"Output: {self.output_file}")
         print(f"Model: {self.model}")
+        if self.shard:
+            print(f"Shard: {self.shard[0]}/{self.shard[1]}")
         
         self.load_resources()
         
@@ -170,6 +408,11 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
             print(f"Error reading input file: {e}")
             return
 
+        # Keep only this shard's trials (stable hash of nct_id)
+        if self.shard:
+            input_df = input_df[shard_mask(input_df['nct_id'].astype(str), *self.shard)]
+            print(f"Shard {self.shard[0]}/{self.shard[1]} owns {len(input_df)} studies.")
+
         # Preference Index: Filter out already processed IDs
         processed_ids = self._get_processed_ids()
         print(f"Preference Index: Found {len(processed_ids)} already processed studies.")
@@ -181,7 +424,9 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
             print("All studies in input have been processed. Nothing to do.")
             return
 
-        # Limit
+        # Limit (the per-shard quota caps it further)
+        if self.max_requests is not None:
+            limit = min(limit, self.max_requests) if limit else self.max_requests
         if limit:
             pending_df = pending_df.head(limit)
             print(f"Limit applied: Processing next {limit} studies.")
@@ -198,17 +443,7 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
             response_text = self.call_api(prompt)
             
             if response_text:
-                parsed_data = self.parse_response(response_text)
-                
-                result_row = {
-                    "nct_id": nct_id,
-                    "input_why_stopped": row.get('why_stopped'),
-                    "model": self.model,
-                    "raw_response": response_text
-                }
-                
-                if isinstance(parsed_data, dict):
-                    result_row.update(parsed_data)
+                result_row = self.build_result_row(row, response_text)
                 
                 # Check point save
                 self.save_result(result_row)
@@ -217,28 +452,185 @@ OUTPUT FORMAT: You must output a valid JSON object with this exact structure:
                 print(f"  Failed to get response for {nct_id}")
 
         print(f"Batch completed. Processed {success_count} new studies.")
+        if self.savings is not None:
+            print(self.savings.summary())
+        if self.hedge_policy is not None:
+            print(self.hedge_policy.summary())
+        if self.rate_limiter is not None:
+            print(self.rate_limiter.summary())
+
+def run_multi_model(agents, models, limit=None):
+    """
+    Multi-model mode: reads the input and builds each trial's prompt once, then
+    sends it concurrently to every model (one agent per model, each with its
+    own output file) that has not processed the trial yet. Per-model
+    concurrency comes from `models` ({model: limit}, see LLM_client/fanout.py);
+    each output is written in input order.
+    """
+    lead = agents[0]
+    by_model = {agent.model: agent for agent in agents}
+    for agent in agents:
+        agent.load_resources()
+        print(f"Model: {agent.model} (concurrency {models[agent.model]}) -> {agent.output_file}")
+
+    try:
+        input_df = pd.read_csv(lead.input_file)
+    except Exception as e:
+        print(f"Error reading input file: {e}")
+        return
+    if lead.shard:
+        input_df = input_df[shard_mask(input_df['nct_id'].astype(str), *lead.shard)]
+        print(f"Shard {lead.shard[0]}/{lead.shard[1]} owns {len(input_df)} studies.")
+
+    # Per-model Preference Index: a trial is pending while any model lacks it
+    processed = {agent.model: agent._get_processed_ids() for agent in agents}
+    missing = pd.Series(False, index=input_df.index)
+    for ids in processed.values():
+        missing |= ~input_df['nct_id'].astype(str).isin(ids)
+    pending_df = input_df[missing]
+    print(f"Pending studies: {len(pending_df)} (out of {len(input_df)} total)")
+    if limit:
+        pending_df = pending_df.head(limit)
+
+    def items():
+        for _, row in pending_df.iterrows():
+            # Prompt built once, shared by every model
+            prompt, nct_id = lead.construct_prompt(row)
+            targets = [m for m in by_model if str(nct_id) not in processed[m]]
+            yield nct_id, (row, prompt), targets
+
+    def call(model, payload):
+        return by_model[model].request(payload[1])
+
+    counts = {model: 0 for model in by_model}
+
+    def on_result(model, nct_id, payload, result):
+        content, stats = result
+        if not content:
+            print(f"  [{model}] Failed to get response for {nct_id}")
+            return
+        agent = by_model[model]
+        agent.save_result(agent.build_result_row(payload[0], content, call_stats=stats))
+        counts[model] += 1
+        print(f"  [{model}] {nct_id} saved")
+
+    start = time.monotonic()
+    stats = fan_out(items(), models, call, on_result)
+    elapsed = time.monotonic() - start
+    for model, model_stats in stats.items():
+        print(f"{model}: {counts[model]} new results from {model_stats['requests']} requests "
+              f"({model_stats['busy_s']:.1f}s of request time)")
+        if by_model[model].hedge_policy is not None:
+            print(f"  {by_model[model].hedge_policy.summary()}")
+        if by_model[model].rate_limiter is not None:
+            print(f"  {by_model[model].rate_limiter.summary()}")
+        if by_model[model].savings is not None:
+            print(f"  {by_model[model].savings.summary()}")
+    print(f"Multi-model batch completed in {elapsed:.1f}s wall time.")
 
 def main():
     parser = argparse.ArgumentParser(description="DeepSeek Clinical Trial Analysis Agent")
-    parser.add_argument("--input", required=True, help="Path to input CSV")
+    parser.add_argument("--input", help="Path to input CSV (required unless --merge)")
     parser.add_argument("--output", default="output/deepseek_extraction_results.csv", help="Path to output CSV")
     parser.add_argument("--taxonomy", default="Clinical trials endpoint taxonomy.txt", help="Path to taxonomy file")
     parser.add_argument("--model", default="deepseek-chat", help="DeepSeek model name")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of trials to process")
+    parser.add_argument("--max-retries", type=int, default=5, help="Max retries per API call (backoff + jitter)")
+    parser.add_argument("--shard", default=None, help="Process only shard i of N (e.g. 0/4); output goes to <output>.shard-i-of-N.csv")
+    parser.add_argument("--shard-config", default=None, help="JSON with per-shard api_key_env / max_requests / requests_per_minute")
+    parser.add_argument("--merge", action="store_true", help="Merge the <output>.shard-i-of-N.csv files into --output (per-model shards into <output>.<model>.csv) and exit")
+    parser.add_argument("--stream", action="store_true", help="Stream responses, record TTFT and stop at the first complete JSON object")
+    parser.add_argument("--max-output-tokens", type=int, default=None, help="Per-request ceiling on answer tokens (reasoning not counted; see --max-reasoning-tokens)")
+    parser.add_argument("--max-reasoning-tokens", type=int, default=None, help="Per-request ceiling on reasoning tokens of reasoning models")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Per-request wall-clock ceiling in seconds")
+    parser.add_argument("--models", default=None, help="Multi-model mode, e.g. 'deepseek-chat:8,deepseek-reasoner:2' (model:concurrency); writes <output>.<model>.csv per model")
+    parser.add_argument("--hedge", action="store_true", help="Duplicate requests still running after the observed p95 latency (capped at 5%% of requests)")
+    parser.add_argument("--repair", action="store_true", help="Re-query only trials whose saved result failed schema validation")
+    parser.add_argument("--max-repair-attempts", type=int, default=2, help="Repair re-queries per trial before giving up")
+    parser.add_argument("--compact", action="store_true", help="Ask for category codes and confidence only; traces and explanation are filled in locally")
+    parser.add_argument("--compact-evidence", action="store_true", help="--compact plus evidence spans (character offsets into the trial fields)")
     
     args = parser.parse_args()
     
+    if args.merge:
+        try:
+            merge_shards(args.output)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+    if not args.input:
+        parser.error("--input is required unless --merge is given")
+    
+    shard = parse_shard(args.shard) if args.shard else None
+    shard_settings = load_shard_config(args.shard_config, shard[0] if shard else None)
+    output_file = shard_output_path(args.output, *shard) if shard else args.output
+    
     # Ensure output directory exists
-    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    
+    if args.models:
+        try:
+            models = parse_models(args.models)
+            agents = [
+                DeepSeekAnalysisAgent(
+                    input_file=args.input,
+                    output_file=model_output_path(output_file, model),
+                    taxonomy_file=args.taxonomy,
+                    model=model,
+                    max_retries=args.max_retries,
+                    shard=shard,
+                    api_key_env=shard_settings.get("api_key_env", "DEEPSEEK_API_KEY"),
+                    max_requests=shard_settings.get("max_requests"),
+                    requests_per_minute=shard_settings.get("requests_per_minute"),
+                    stream=args.stream,
+                    max_output_tokens=args.max_output_tokens,
+                    max_reasoning_tokens=args.max_reasoning_tokens,
+                    max_seconds=args.max_seconds,
+                    max_repair_attempts=args.max_repair_attempts,
+                    hedge=args.hedge,
+                    compact=args.compact,
+                    compact_evidence=args.compact_evidence
+                )
+                for model in models
+            ]
+            if args.repair:
+                for agent in agents:
+                    agent.repair(limit=args.limit)
+            else:
+                limit = args.limit
+                if shard_settings.get("max_requests") is not None:
+                    limit = min(limit, shard_settings["max_requests"]) if limit else shard_settings["max_requests"]
+                run_multi_model(agents, models, limit=limit)
+        except Exception as e:
+            print(f"Critical Error: {e}")
+            sys.exit(1)
+        return
     
     try:
         agent = DeepSeekAnalysisAgent(
             input_file=args.input, 
-            output_file=args.output, 
+            output_file=output_file, 
             taxonomy_file=args.taxonomy,
-            model=args.model
+            model=shard_settings.get("model", args.model),
+            max_retries=args.max_retries,
+            shard=shard,
+            api_key_env=shard_settings.get("api_key_env", "DEEPSEEK_API_KEY"),
+            max_requests=shard_settings.get("max_requests"),
+            requests_per_minute=shard_settings.get("requests_per_minute"),
+            stream=args.stream,
+            max_output_tokens=args.max_output_tokens,
+            max_reasoning_tokens=args.max_reasoning_tokens,
+            max_seconds=args.max_seconds,
+            max_repair_attempts=args.max_repair_attempts,
+            hedge=args.hedge,
+            compact=args.compact,
+            compact_evidence=args.compact_evidence
         )
-        agent.run(limit=args.limit)
+        if args.repair:
+            agent.repair(limit=args.limit)
+        else:
+            agent.run(limit=args.limit)
     except Exception as e:
         print(f"Critical Error: {e}")
         sys.exit(1)
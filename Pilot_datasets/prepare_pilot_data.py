@@ -1,86 +1,88 @@
-import pandas as pd
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dataset_building"))
+from cohort_index import CohortIndex
+from ground_truth_io import ground_truth_columns, is_dataset, read_ground_truth, resolve_ground_truth
+from sampling import stratified_sample, stream_stratified_sample
+
 # Configuration
-INPUT_FILE = "terminated_ground_truth_enriched.csv"
+INPUT_FILE = resolve_ground_truth("terminated_ground_truth_enriched.csv") # Partitioned Parquet dataset if add_medical_fields wrote one
 OUTPUT_FILE = "pilot_unclear_reasons.csv"
 TARGET_SAMPLE_SIZE = 50
 TARGET_CATEGORIES = ["Unknown", "Other/Unclear"]
 FALLBACK_CATEGORIES = ["Administrative"]
+SAMPLING_STRATA = ["termination_category"] # Proportional allocation across these columns
+SAMPLING_SEED = 42
+
+PHASES = ["PHASE2", "PHASE3"] # Also matches combined phases like PHASE1/PHASE2
+PHASE_FILTER = f"phase in ({', '.join(PHASES)})"
+
+def load_cohort_index():
+    """Cohort index over the input's phase / termination_category (read once, three columns)."""
+    return CohortIndex.from_frame(read_ground_truth(INPUT_FILE, columns=['phase', 'termination_category']))
+
+def cohort_filter(cohort, categories):
+    """Row filter: Phase II/III trials whose termination_category is in `categories`."""
+    ids = cohort.where(termination_category=categories) & cohort.query(PHASE_FILTER)
+    return lambda chunk: chunk['nct_id'].isin(ids)
+
+def phase_partitions(cohort):
+    """Stored phase values matching PHASES (e.g. PHASE2, PHASE1/PHASE2, PHASE2/PHASE3)."""
+    codes = {c for phase in PHASES for c in cohort.matching_codes('phase', phase)}
+    return [cohort.values['phase'][c] for c in sorted(codes)]
+
+def sample_pool(cohort, categories):
+    """
+    Dataset input: reads only the Phase II/III partitions. CSV input: streams
+    the file once per pass; only the sample is held in memory.
+    """
+    if is_dataset(INPUT_FILE):
+        df = read_ground_truth(INPUT_FILE, where={'phase': phase_partitions(cohort)})
+        return stratified_sample(df[cohort_filter(cohort, categories)(df)], TARGET_SAMPLE_SIZE,
+                                 strata=SAMPLING_STRATA, seed=SAMPLING_SEED).reset_index(drop=True)
+    return stream_stratified_sample(
+        INPUT_FILE, TARGET_SAMPLE_SIZE, strata=SAMPLING_STRATA,
+        row_filter=cohort_filter(cohort, categories), filter_cols=['nct_id'], seed=SAMPLING_SEED
+    )
 
 def main():
     if not os.path.exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found.")
         sys.exit(1)
 
-    print(f"Reading {INPUT_FILE}...")
-    df = pd.read_csv(INPUT_FILE)
-    print(f"Total rows in input: {len(df)}")
-
-    # Normalize phase for filtering
-    # Expected values: PHASE2, PHASE3, PHASE1/PHASE2, etc.
-    if 'phase' not in df.columns:
+    header = ground_truth_columns(INPUT_FILE)
+    # Expected phase values: PHASE2, PHASE3, PHASE1/PHASE2, etc.
+    if 'phase' not in header:
          print("Error: 'phase' column not found.")
          sys.exit(1)
-         
-    df['phase_upper'] = df['phase'].astype(str).str.upper()
-    
-    # Filter for Phase 2 or Phase 3 (including combined phases like PHASE1/PHASE2)
-    # logic: contains "PHASE2" or "PHASE3"
-    phase_mask = df['phase_upper'].str.contains('PHASE2', na=False) | \
-                 df['phase_upper'].str.contains('PHASE3', na=False)
-    
-    phase_df = df[phase_mask].copy()
-    print(f"Rows after Phase II/III filter: {len(phase_df)}")
-
-    if 'termination_category' not in df.columns:
+    if 'termination_category' not in header:
         print("Error: 'termination_category' column missing.")
         sys.exit(1)
 
-    # Clean termination category
-    phase_df['termination_category'] = phase_df['termination_category'].astype(str).str.strip()
-
     # Filter by Reason
-    # We want trials where the reason is not immediately obvious (Unknown, Other/Unclear)
-    target_mask = phase_df['termination_category'].isin(TARGET_CATEGORIES)
-    target_df = phase_df[target_mask]
-    
-    count_target = len(target_df)
-    print(f"Rows with Primary Unclear Categories {TARGET_CATEGORIES}: {count_target}")
+    # We want Phase II/III trials where the reason is not immediately obvious (Unknown, Other/Unclear)
+    print(f"Reading {INPUT_FILE}...")
+    cohort = load_cohort_index()
+    sampled_df = sample_pool(cohort, TARGET_CATEGORIES)
+    count_target = len(sampled_df)
     
-    if count_target == 0:
-        print("\nDEBUG INFO:")
-        print("Unique phases found:", df['phase'].unique()[:10])
-        print("Unique categories found in filtered phases:", phase_df['termination_category'].unique())
-
-    final_pool = target_df
-
     # Fallback to Administrative if we don't have enough
     if count_target < TARGET_SAMPLE_SIZE:
-        print(f"Warning: Found only {count_target} rows. Adding 'Administrative' category.")
-        fallback_mask = phase_df['termination_category'].isin(FALLBACK_CATEGORIES)
-        fallback_df = phase_df[fallback_mask]
-        print(f"Rows with Fallback Categories {FALLBACK_CATEGORIES}: {len(fallback_df)}")
-        
-        final_pool = pd.concat([target_df, fallback_df]).drop_duplicates()
-        
-    print(f"Total available for sampling: {len(final_pool)}")
+        print(f"Warning: Found only {count_target} Phase II/III rows with {TARGET_CATEGORIES}. Adding 'Administrative' category.")
+        sampled_df = sample_pool(cohort, TARGET_CATEGORIES + FALLBACK_CATEGORIES)
+    
+    if len(sampled_df) == 0:
+        print("\nDEBUG INFO: no Phase II/III rows matched the target or fallback categories.")
 
-    # Sampling
-    if len(final_pool) > TARGET_SAMPLE_SIZE:
-        print(f"Sampling {TARGET_SAMPLE_SIZE} random rows...")
-        sampled_df = final_pool.sample(n=TARGET_SAMPLE_SIZE, random_state=42)
-    else:
-        print(f"Taking all {len(final_pool)} available rows.")
-        sampled_df = final_pool
+    print(f"Sampled {len(sampled_df)} rows (target {TARGET_SAMPLE_SIZE}, strata {SAMPLING_STRATA}, seed {SAMPLING_SEED}).")
+    print(sampled_df['termination_category'].value_counts().to_string())
     
+    # Clean termination category
+    sampled_df['termination_category'] = sampled_df['termination_category'].astype(str).str.strip()
+
     # Save
     print(f"Saving to {OUTPUT_FILE}...")
-    # Drop the helper column
-    if 'phase_upper' in sampled_df.columns:
-        sampled_df = sampled_df.drop(columns=['phase_upper'])
-        
     sampled_df.to_csv(OUTPUT_FILE, index=False)
     print("Done.")
 
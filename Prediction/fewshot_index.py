@@ -0,0 +1,267 @@
+"""
+Local vector index over labeled ground-truth trials for dynamic few-shot selection.
+
+Instead of the four hard-coded examples in Prediction_prompts_instruct.txt,
+prepare_llm_input.py (`--prompt-mode retrieval`) asks this index for the k
+most similar labeled trials and renders them as the few-shot block, so prompts
+get fewer but more relevant examples.
+
+Representation (NumPy only, no extra dependencies):
+- Each trial's title + medical field + brief summary is tokenized and weighted
+  by TF-IDF (document frequencies kept in hashed buckets).
+- Every token is projected onto EMBED_DIM dimensions with signed feature
+  hashing (TOKEN_NNZ +/-1 entries per token), giving a dense L2-normalized
+  float32 vector whose dot products approximate TF-IDF cosine similarity.
+
+On disk (INDEX_DIR):
+    vectors.npy     float32 [n_trials, EMBED_DIM]   (memory-mapped at query time)
+    idf.npy         float32 [IDF_BUCKETS]
+    ids.npy         nct_id per row
+    labels.npy      termination_category per row
+    examples.jsonl  rendered example per row; offsets.npy holds byte offsets so
+                    only the retrieved examples are ever read
+    manifest.json   source file signature and parameters (stale index -> rebuild)
+
+Queries take the IDs of the whole prompt set as `shared_exclude`, so no trial
+being evaluated is ever shown (with its label) as another trial's example.
+Rendered examples only cite what the prediction input contains (title, phase,
+brief summary), never why_stopped.
+
+Usage:
+    python fewshot_index.py --build      # build / refresh the index
+    python fewshot_index.py --query "slow accrual in metastatic breast cancer"
+"""
+
+import argparse
+import json
+import os
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+GROUND_TRUTH_PATH = os.path.join(BASE_DIR, "Final_data_sets", "terminated_ground_truth_enriched.csv")
+INDEX_DIR = os.path.join(BASE_DIR, "Prediction", "models", "fewshot_index")
+
+# Configuration
+CATEGORIES = ["Enrollment", "Administrative", "Safety", "Efficacy"]
+EMBED_DIM = 512
+TOKEN_NNZ = 4 # Signed hash positions per token
+IDF_BUCKETS = 2 ** 20
+CHUNK_SIZE = 20000
+SUMMARY_CHARS = 400 # Brief summary length shown in a rendered example
+REASON_CHARS = 150 # Brief summary excerpt quoted in an example's reason
+EXAMPLE_FORMAT = 2 # Bump when render_example changes, so cached indexes are rebuilt
+QUERY_BATCH = 256
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+INDEX_COLUMNS = ["nct_id", "brief_title", "phase", "medical_field", "medical_subfield",
+                 "brief_summary", "termination_category"]
+
+
+def retrieval_text(row):
+    """Text used for similarity: title, medical field and brief summary."""
+    parts = [row.get('brief_title'), row.get('medical_field'), row.get('medical_subfield'), row.get('brief_summary')]
+    return ' '.join(str(p) for p in parts if isinstance(p, str))
+
+
+def _excerpt(text, limit):
+    """`text` cut at a word boundary to at most `limit` characters (plus '...')."""
+    return text if len(text) <= limit else text[:limit].rsplit(' ', 1)[0] + '...'
+
+
+def render_example(row):
+    """Formats a labeled trial like the examples in Prediction_prompts_instruct.txt."""
+    summary = _excerpt(str(row.get('brief_summary', '')), SUMMARY_CHARS)
+    # The reason cites only the rendered input; the recorded why_stopped is never part of a prompt
+    answer = {
+        "prediction": row['termination_category'],
+        "reason": f"Title '{row.get('brief_title', '')}' and brief summary: '{_excerpt(summary, REASON_CHARS)}'",
+        "confidence": 1
+    }
+    return (
+        f"Input: Trial ID: {row['nct_id']}  \n"
+        f"Title: {row.get('brief_title', '')}  \n"
+        f"Phase: {row.get('phase', '')}  \n"
+        f"Brief Summary: {summary}  \n"
+        f"{json.dumps(answer, ensure_ascii=False)}"
+    )
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if isinstance(text, str) else []
+
+
+@lru_cache(maxsize=500000)
+def _token_projection(token):
+    """(idf bucket, dims, signs) for one token; deterministic across runs."""
+    encoded = token.encode('utf-8')
+    bucket = zlib.crc32(encoded) % IDF_BUCKETS
+    dims, signs = [], []
+    for j in range(TOKEN_NNZ):
+        h = zlib.crc32(encoded, j + 1)
+        dims.append(h % EMBED_DIM)
+        signs.append(1.0 if (h >> 31) & 1 else -1.0)
+    return bucket, np.array(dims), np.array(signs, dtype=np.float32)
+
+
+def embed(texts, idf):
+    """Dense, L2-normalized signed-hash TF-IDF embeddings for a list of texts."""
+    out = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+    for i, text in enumerate(texts):
+        tokens, counts = np.unique(tokenize(text), return_counts=True)
+        vec = out[i]
+        for token, tf in zip(tokens, counts):
+            bucket, dims, signs = _token_projection(token)
+            np.add.at(vec, dims, signs * ((1.0 + np.log(tf)) * idf[bucket]))
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+    return out
+
+
+def _source_signature(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "embed_dim": EMBED_DIM, "token_nnz": TOKEN_NNZ, "idf_buckets": IDF_BUCKETS,
+            "summary_chars": SUMMARY_CHARS, "reason_chars": REASON_CHARS, "example_format": EXAMPLE_FORMAT}
+
+
+def _labeled_chunks(ground_truth_csv):
+    header = pd.read_csv(ground_truth_csv, nrows=0).columns
+    usecols = [c for c in INDEX_COLUMNS if c in header]
+    for chunk in pd.read_csv(ground_truth_csv, usecols=usecols, chunksize=CHUNK_SIZE):
+        yield chunk[chunk['termination_category'].isin(CATEGORIES)]
+
+
+def build_index(ground_truth_csv=GROUND_TRUTH_PATH, index_dir=INDEX_DIR):
+    """Two streaming passes over the ground truth: document frequencies, then vectors."""
+    os.makedirs(index_dir, exist_ok=True)
+    print(f"Building few-shot index from {ground_truth_csv}...")
+
+    # Pass 1: hashed document frequencies
+    df_counts = np.zeros(IDF_BUCKETS, dtype=np.int64)
+    n_docs = 0
+    for chunk in _labeled_chunks(ground_truth_csv):
+        for row in chunk.to_dict('records'):
+            buckets = {_token_projection(t)[0] for t in set(tokenize(retrieval_text(row)))}
+            df_counts[list(buckets)] += 1
+            n_docs += 1
+    if n_docs == 0:
+        raise ValueError(f"No labeled trials in {CATEGORIES} found in {ground_truth_csv}")
+    idf = (np.log((1 + n_docs) / (1 + df_counts)) + 1).astype(np.float32)
+
+    # Pass 2: vectors (written straight into a memory-mapped file) + examples
+    vectors = np.lib.format.open_memmap(os.path.join(index_dir, 'vectors.npy'), mode='w+',
+                                        dtype=np.float32, shape=(n_docs, EMBED_DIM))
+    ids, labels, offsets = [], [], []
+    row_pos = 0
+    with open(os.path.join(index_dir, 'examples.jsonl'), 'wb') as f:
+        for chunk in _labeled_chunks(ground_truth_csv):
+            rows = chunk.to_dict('records')
+            vectors[row_pos:row_pos + len(rows)] = embed([retrieval_text(r) for r in rows], idf)
+            row_pos += len(rows)
+            for row in rows:
+                offsets.append(f.tell())
+                f.write((json.dumps({"nct_id": str(row['nct_id']), "text": render_example(row)},
+                                    ensure_ascii=False) + '\n').encode('utf-8'))
+                ids.append(str(row['nct_id']))
+                labels.append(row['termination_category'])
+    vectors.flush()
+    del vectors
+
+    np.save(os.path.join(index_dir, 'idf.npy'), idf)
+    np.save(os.path.join(index_dir, 'ids.npy'), np.array(ids))
+    np.save(os.path.join(index_dir, 'labels.npy'), np.array(labels))
+    np.save(os.path.join(index_dir, 'offsets.npy'), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(index_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({"source": _source_signature(ground_truth_csv), "n_trials": n_docs}, f, indent=2)
+    print(f"Indexed {n_docs} labeled trials into {index_dir}")
+
+
+class FewShotIndex:
+    """Read-only, memory-mapped view of a built index."""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self.vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        self.idf = np.load(os.path.join(index_dir, 'idf.npy'))
+        self.ids = np.load(os.path.join(index_dir, 'ids.npy'))
+        self.labels = np.load(os.path.join(index_dir, 'labels.npy'))
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'))
+        self._examples = open(os.path.join(index_dir, 'examples.jsonl'), 'rb')
+
+    @classmethod
+    def load_or_build(cls, ground_truth_csv=GROUND_TRUTH_PATH, index_dir=INDEX_DIR):
+        """Opens the cached index, rebuilding it first if the ground truth changed."""
+        manifest_path = os.path.join(index_dir, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('source') == _source_signature(ground_truth_csv):
+                return cls(index_dir)
+            print("Ground truth changed; rebuilding few-shot index.")
+        build_index(ground_truth_csv, index_dir)
+        return cls(index_dir)
+
+    def example(self, row_pos):
+        self._examples.seek(int(self.offsets[row_pos]))
+        return json.loads(self._examples.readline())['text']
+
+    def query_batch(self, texts, k=3, exclude_ids=None, shared_exclude=None):
+        """
+        Returns, for each text, a list of (nct_id, label, score, rendered_example)
+        for its k nearest labeled trials. `exclude_ids[i]` (if given) is never
+        returned for text i, so a trial is never its own example; IDs in
+        `shared_exclude` (e.g. the whole prompt set) are never returned at all.
+        """
+        shared_exclude = set(shared_exclude or ())
+        # Only excluded IDs that are actually indexed can displace a candidate
+        n_shared = int(np.isin(self.ids, list(shared_exclude)).sum()) if shared_exclude else 0
+        results = []
+        for start in range(0, len(texts), QUERY_BATCH):
+            batch = texts[start:start + QUERY_BATCH]
+            scores = embed(batch, self.idf) @ self.vectors.T
+            for i, row_scores in enumerate(scores):
+                exclude = exclude_ids[start + i] if exclude_ids is not None else None
+                # One extra candidate per possible exclusion, so exclusions never leave us short
+                n_candidates = min(k + 1 + n_shared, len(row_scores))
+                top = np.argpartition(-row_scores, n_candidates - 1)[:n_candidates]
+                top = top[np.argsort(-row_scores[top])]
+                hits = [
+                    (str(self.ids[j]), str(self.labels[j]), float(row_scores[j]), self.example(j))
+                    for j in top if str(self.ids[j]) != exclude and str(self.ids[j]) not in shared_exclude
+                ][:k]
+                results.append(hits)
+        return results
+
+    def close(self):
+        self._examples.close()
+
+
+def format_few_shot_block(hits):
+    """Renders retrieved examples as the template's few-shot section."""
+    return "\n\n".join(f"Example {i}  \n{text}" for i, (_, _, _, text) in enumerate(hits, start=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Few-shot retrieval index over labeled ground truth")
+    parser.add_argument("--build", action="store_true", help="Build (or rebuild) the index")
+    parser.add_argument("--query", help="Print the nearest labeled trials for a free-text query")
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.build:
+        build_index()
+    if args.query:
+        index = FewShotIndex.load_or_build()
+        for nct_id, label, score, _ in index.query_batch([args.query], k=args.k)[0]:
+            print(f"{score:.3f}  {nct_id}  {label}")
+
+
+if __name__ == "__main__":
+    main()
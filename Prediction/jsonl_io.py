@@ -0,0 +1,77 @@
+"""
+JSON Lines helpers for the prediction stage.
+
+Prompts (`prepare_llm_input.py`) and predictions (`run_predictions.py`) are
+stored one JSON object per line so both sides can stream: records are produced
+and consumed lazily and results are appended as soon as they exist, keeping
+memory flat regardless of how many trials are processed.
+
+Legacy `.json` files (a single indented list) are still readable through
+`iter_records`, which picks the reader from the file extension.
+"""
+
+import json
+import os
+
+
+def iter_jsonl(path):
+    """Yields one dict per non-empty line of a JSONL file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                # A truncated last line is expected if a previous run was killed mid-write
+                print(f"Warning: Skipping malformed line {line_no} in {path}: {e}")
+
+
+def iter_records(path):
+    """Yields records from a `.jsonl` file (streamed) or a legacy `.json` list."""
+    if path.endswith('.jsonl'):
+        yield from iter_jsonl(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def read_ids(path, key='nct_id'):
+    """Returns the set of `key` values already present in a JSONL file."""
+    if not os.path.exists(path):
+        return set()
+    return {str(rec[key]) for rec in iter_jsonl(path) if key in rec}
+
+
+class JsonlWriter:
+    """
+    Appends records to a JSONL file, one line per `write()`, flushed
+    immediately so a crash never loses more than the record in flight.
+
+    Usage:
+        with JsonlWriter(path) as writer:
+            writer.write({"nct_id": ..., ...})
+    """
+
+    def __init__(self, path, mode='a'):
+        self.path = path
+        self.mode = mode
+        self.count = 0
+        self._f = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._f = open(self.path, self.mode, encoding='utf-8')
+        return self
+
+    def write(self, record):
+        self._f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._f.flush()
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._f.close()
+        return False
@@ -0,0 +1,193 @@
+"""
+CPU-only baseline predictor for termination categories.
+
+Sparse TF-IDF over the same `input_text` that prepare_llm_input.py builds for
+the LLM, followed by a multinomial logistic regression trained on the
+`termination_category` labels of terminated_ground_truth_enriched.csv.
+Training rows go through the same normalize_chunk / build_prompt_entry as the
+prompts. The ground truth has no eligibility criteria, so `criteria` is
+streamed from the AACT eligibilities table for the training trials; without
+it the model would learn from texts that lack the criteria block it is then
+scored on.
+Predicts thousands of trials per second and returns the same
+`prediction` / `reason` / `confidence` shape as the LLM, so it can be used as:
+
+- a comparison baseline (`run_predictions.py --mode local`), or
+- a triage tier (`--mode triage`): confident local predictions are kept and
+  only the remaining trials are sent to DeepSeek.
+
+Requires scikit-learn, which is imported only when this module is used.
+The fitted model is pickled next to the predictions and retrained only when
+the ground-truth file, the eligibilities table or the excluded trial IDs change.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+from prepare_llm_input import build_prompt_entry, normalize_chunk
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dataset_building"))
+from aact_source import read_table, table_path
+
+CATEGORIES = ["Enrollment", "Administrative", "Safety", "Efficacy"]
+TRAINING_COLUMNS = ["nct_id", "brief_title", "phase", "medical_field", "medical_subfield",
+                    "brief_summary", "criteria", "termination_category"]
+TOP_TERMS_IN_REASON = 3
+ELIGIBILITIES_TABLE = "eligibilities.txt"
+CHUNK_SIZE = 500000 # Rows per chunk when streaming the eligibilities table
+
+
+def _ids_digest(ids):
+    return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def confidence_from_probability(prob):
+    """Maps a class probability onto the prompt template's 0 / 0.5 / 1 scale."""
+    if prob >= 0.7:
+        return 1
+    if prob >= 0.45:
+        return 0.5
+    return 0
+
+
+def _eligibilities_signature(data_dir):
+    path = table_path(data_dir, ELIGIBILITIES_TABLE) if data_dir else None
+    return _file_signature(path) if path else None
+
+
+def load_criteria(data_dir, nct_ids):
+    """nct_id -> criteria for `nct_ids`, streamed from the AACT eligibilities table (first row per trial)."""
+    ids = set(nct_ids)
+    chunks = [chunk[chunk["nct_id"].isin(ids)]
+              for chunk in read_table(data_dir, ELIGIBILITIES_TABLE, usecols=["nct_id", "criteria"],
+                                      dtype=str, chunksize=CHUNK_SIZE)]
+    criteria = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=["nct_id", "criteria"])
+    return criteria.drop_duplicates(subset=["nct_id"])
+
+
+def load_training_texts(ground_truth_csv, exclude_ids=(), data_dir=None):
+    """Builds (texts, labels) from the ground truth exactly as prepare_llm_input builds prompt input_text."""
+    header = pd.read_csv(ground_truth_csv, nrows=0).columns
+    usecols = [c for c in TRAINING_COLUMNS if c in header]
+    df = pd.read_csv(ground_truth_csv, usecols=usecols)
+    df = df[df["termination_category"].isin(CATEGORIES)]
+    # Never train on trials we are about to predict
+    df = df[~df["nct_id"].astype(str).isin(set(exclude_ids))]
+
+    if "criteria" not in df.columns:
+        if _eligibilities_signature(data_dir):
+            print(f"Adding eligibility criteria for {len(df)} training trials from {ELIGIBILITIES_TABLE}...")
+            df = df.merge(load_criteria(data_dir, df["nct_id"].astype(str)), on="nct_id", how="left")
+        else:
+            print(f"Warning: {ELIGIBILITIES_TABLE} not found in {data_dir}; training texts have no eligibility "
+                  f"criteria, unlike the prompts they are scored on.")
+    df = normalize_chunk(df, {"rows_in": 0, "rows_dropped": 0})
+
+    texts, labels = [], []
+    for row in df.to_dict("records"):
+        texts.append(build_prompt_entry(row)["input_text"])
+        labels.append(row["termination_category"])
+    return texts, labels
+
+
+class LocalBaseline:
+    """TF-IDF + logistic regression over prompt input_text."""
+
+    def __init__(self, vectorizer, classifier, metadata=None):
+        self.vectorizer = vectorizer
+        self.classifier = classifier
+        self.metadata = metadata or {}
+        self._feature_names = np.asarray(vectorizer.get_feature_names_out())
+
+    @classmethod
+    def train(cls, ground_truth_csv, exclude_ids=(), data_dir=None):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        texts, labels = load_training_texts(ground_truth_csv, exclude_ids, data_dir)
+        if not texts:
+            raise ValueError(f"No labeled trials in {CATEGORIES} found in {ground_truth_csv}")
+        print(f"Training local baseline on {len(texts)} labeled trials...")
+
+        vectorizer = TfidfVectorizer(sublinear_tf=True, ngram_range=(1, 2), min_df=2,
+                                     max_features=200000, stop_words="english", dtype=np.float32)
+        X = vectorizer.fit_transform(texts)
+        classifier = LogisticRegression(max_iter=1000, class_weight="balanced")
+        classifier.fit(X, labels)
+
+        metadata = {"source": _file_signature(ground_truth_csv), "excluded": _ids_digest(exclude_ids),
+                    "eligibilities": _eligibilities_signature(data_dir), "n_train": len(texts)}
+        return cls(vectorizer, classifier, metadata)
+
+    @classmethod
+    def load_or_train(cls, model_path, ground_truth_csv, exclude_ids=(), data_dir=None):
+        """Loads the cached model if it was trained on the same data, else retrains and saves."""
+        if os.path.exists(model_path):
+            with open(model_path, "rb") as f:
+                model = pickle.load(f)
+            if (model.metadata.get("source") == _file_signature(ground_truth_csv)
+                    and model.metadata.get("excluded") == _ids_digest(exclude_ids)
+                    and model.metadata.get("eligibilities", False) == _eligibilities_signature(data_dir)):
+                print(f"Loaded local baseline from {model_path} ({model.metadata.get('n_train')} training trials)")
+                return model
+            print("Ground truth, eligibilities or excluded IDs changed; retraining local baseline.")
+
+        model = cls.train(ground_truth_csv, exclude_ids, data_dir)
+        model.save(model_path)
+        return model
+
+    def save(self, model_path):
+        os.makedirs(os.path.dirname(model_path), exist_ok=True)
+        with open(model_path, "wb") as f:
+            pickle.dump(self, f)
+        print(f"Saved local baseline to {model_path}")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_feature_names"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._feature_names = np.asarray(self.vectorizer.get_feature_names_out())
+
+    def predict_batch(self, texts):
+        """
+        Returns one dict per text: prediction, reason, confidence (template
+        scale) and probability (raw class probability, used for triage).
+        """
+        X = self.vectorizer.transform(texts)
+        proba = self.classifier.predict_proba(X)
+        classes = self.classifier.classes_
+        best = proba.argmax(axis=1)
+        class_index = {c: i for i, c in enumerate(classes)}
+        coef = self.classifier.coef_
+        # Binary problems have a single coefficient row (for classes_[1])
+        if coef.shape[0] == 1:
+            coef = np.vstack([-coef[0], coef[0]])
+
+        results = []
+        for i, k in enumerate(best):
+            label = classes[k]
+            row = X.getrow(i)
+            contributions = row.data * coef[class_index[label], row.indices]
+            order = np.argsort(contributions)[::-1][:TOP_TERMS_IN_REASON]
+            terms = [self._feature_names[row.indices[j]] for j in order if contributions[j] > 0]
+            prob = float(proba[i, k])
+            results.append({
+                "prediction": label,
+                "reason": "Local TF-IDF baseline; strongest terms: " + (", ".join(f"'{t}'" for t in terms) or "none"),
+                "confidence": confidence_from_probability(prob),
+                "probability": round(prob, 4),
+            })
+        return results
@@ -0,0 +1,346 @@
+"""
+Online evaluation of prediction runs, with sequential early stopping.
+
+Comparing two prompts or models used to mean running every trial with both
+and computing accuracy by hand from predictions.json afterwards. This module
+scores results as they are written:
+
+- `OnlineEvaluator.update(result)` adds one result entry of run_predictions.py
+  to a confusion matrix (true category x predicted category, plus an
+  "Invalid" column for failed requests and predictions that did not pass
+  validation). Accuracy, per-category recall / precision / F1 and macro-F1
+  are read from the matrix at any point. Results whose `true_outcome` is not
+  one of PREDICTION_CATEGORIES (e.g. "Other/Unclear", "['No Context']") are
+  counted as unscored.
+- `bootstrap_ci` resamples the scored trials BOOTSTRAP_SAMPLES times. The
+  resamples are an index matrix [n_boot, n] and every metric is computed on
+  all of them at once with NumPy (blocks of BOOTSTRAP_BLOCK resamples bound
+  the memory).
+- `SequentialComparison` pairs the results of the running configuration (B)
+  with a finished run of another configuration (A) on the same trials, and
+  bootstraps the difference B - A with the same resamples for both sides
+  (paired). Once at least MIN_PAIRS trials are paired, the interval is
+  re-checked every CHECK_EVERY pairs; when it excludes zero the comparison is
+  decisive and `run_predictions.py --compare-with` stops the run, so the
+  remaining trials are never sent to the API.
+
+Every check is another look at the data, which inflates the chance of a
+false "decisive" verdict over a fixed-sample test; STOP_LEVEL is therefore
+stricter than the CI_LEVEL used for reporting. Early stopping also assumes
+that the prompt file is not ordered by category.
+
+Usage:
+    python online_eval.py predicted_outcomes/predictions.jsonl
+    python online_eval.py predictions_retrieval.jsonl --compare-with predictions.jsonl --metric macro_f1
+"""
+
+import argparse
+import ast
+import os
+import sys
+
+import numpy as np
+
+from jsonl_io import iter_records
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "LLM_client"))
+from validation import PREDICTION_CATEGORIES, canonical_choice, validate_prediction
+
+# Configuration
+BOOTSTRAP_SAMPLES = 2000 # Resamples per confidence interval
+BOOTSTRAP_BLOCK = 500 # Resamples held in memory at once
+CI_LEVEL = 0.95 # Reported intervals
+STOP_LEVEL = 0.99 # Interval that must exclude zero to stop a comparison early (repeated looks)
+MIN_PAIRS = 30 # Paired trials before the first early-stopping check
+CHECK_EVERY = 10 # Paired trials between checks
+SEED = 42
+METRICS = ("accuracy", "macro_f1")
+INVALID = "Invalid" # Predicted column for failed or invalid results
+
+
+def true_category(value, categories=PREDICTION_CATEGORIES):
+    """Scored category of a `true_outcome` ("Safety", "['Safety']"), or None if it has none."""
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return None
+    if isinstance(value, (list, tuple)):
+        # A single category only; multi-label truths are not scored
+        value = value[0] if len(value) == 1 else None
+    return canonical_choice(value, categories)
+
+
+def predicted_category(result, categories=PREDICTION_CATEGORIES):
+    """Predicted category of a result entry, or None if the request failed or the prediction is invalid."""
+    if "error" in result:
+        return None
+    prediction = result.get("model_prediction")
+    if result.get("validation_errors") or not isinstance(prediction, dict):
+        return None
+    if "validation_errors" not in result:
+        # Older entries were saved before validation
+        prediction, errors = validate_prediction(prediction)
+        if errors:
+            return None
+    return canonical_choice(prediction.get("prediction"), categories)
+
+
+def _f1(tp, n_true, n_pred):
+    """Per-category F1 (NaN where the category neither occurs nor is predicted)."""
+    denominator = (n_true + n_pred).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, 2 * tp / denominator, np.nan)
+
+
+def metric_samples(truth, pred, idx, metric, n_categories):
+    """
+    `metric` for every row of the resample index matrix `idx` [n_boot, n].
+
+    `truth` and `pred` are category codes (pred == n_categories means invalid,
+    which is always wrong). Macro-F1 averages over the categories that occur
+    or are predicted in each resample, as scikit-learn does.
+    """
+    t = truth[idx]
+    p = pred[idx]
+    if metric == "accuracy":
+        return (t == p).mean(axis=1)
+    if metric != "macro_f1":
+        raise ValueError(f"Unknown metric '{metric}'; choose from {METRICS}")
+    f1 = np.empty((idx.shape[0], n_categories))
+    for k in range(n_categories):
+        is_true, is_pred = t == k, p == k
+        f1[:, k] = _f1((is_true & is_pred).sum(axis=1), is_true.sum(axis=1), is_pred.sum(axis=1))
+    with np.errstate(invalid="ignore"):
+        return np.nanmean(f1, axis=1)
+
+
+def _resample_blocks(n, n_boot, seed):
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_boot, BOOTSTRAP_BLOCK):
+        yield rng.integers(0, n, size=(min(BOOTSTRAP_BLOCK, n_boot - start), n), dtype=np.int32)
+
+
+def _interval(samples, level):
+    alpha = (1 - level) / 2
+    low, high = np.nanquantile(samples, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+class OnlineEvaluator:
+    """Running confusion matrix and metrics of one prediction run."""
+
+    def __init__(self, categories=PREDICTION_CATEGORIES):
+        self.categories = list(categories)
+        self.codes = {c: i for i, c in enumerate(self.categories)}
+        # Rows: true category; columns: predicted category + INVALID
+        self.confusion = np.zeros((len(self.categories), len(self.categories) + 1), dtype=np.int64)
+        self.truth, self.pred, self.ids = [], [], []
+        self.unscored = 0
+
+    def update(self, result):
+        """Adds one result entry; returns True if it was scored."""
+        truth = true_category(result.get("true_outcome"), self.categories)
+        if truth is None:
+            self.unscored += 1
+            return False
+        pred = predicted_category(result, self.categories)
+        t, p = self.codes[truth], self.codes.get(pred, len(self.categories))
+        self.confusion[t, p] += 1
+        self.truth.append(t)
+        self.pred.append(p)
+        self.ids.append(str(result.get("nct_id")))
+        return True
+
+    def __len__(self):
+        return len(self.truth)
+
+    def accuracy(self):
+        n = len(self)
+        return float(np.trace(self.confusion[:, :-1]) / n) if n else float("nan")
+
+    def per_category(self):
+        """{category: {n, recall, precision, f1}} from the confusion matrix (recall = per-category accuracy)."""
+        k = len(self.categories)
+        tp = np.diag(self.confusion[:, :k])
+        n_true = self.confusion.sum(axis=1)
+        n_pred = self.confusion[:, :k].sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            recall = np.where(n_true > 0, tp / n_true, np.nan)
+            precision = np.where(n_pred > 0, tp / n_pred, np.nan)
+        f1 = _f1(tp, n_true, n_pred)
+        return {c: {"n": int(n_true[i]), "recall": float(recall[i]), "precision": float(precision[i]),
+                    "f1": float(f1[i])} for i, c in enumerate(self.categories)}
+
+    def macro_f1(self):
+        f1 = [m["f1"] for m in self.per_category().values() if not np.isnan(m["f1"])]
+        return float(np.mean(f1)) if f1 else float("nan")
+
+    def metric(self, name):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'; choose from {METRICS}")
+        return self.accuracy() if name == "accuracy" else self.macro_f1()
+
+    def bootstrap_ci(self, metric="accuracy", n_boot=BOOTSTRAP_SAMPLES, level=CI_LEVEL, seed=SEED):
+        """(low, high) percentile bootstrap interval of `metric` over the scored trials."""
+        n = len(self)
+        if n < 2:
+            return float("nan"), float("nan")
+        truth, pred = np.asarray(self.truth, dtype=np.int8), np.asarray(self.pred, dtype=np.int8)
+        samples = np.concatenate([metric_samples(truth, pred, idx, metric, len(self.categories))
+                                  for idx in _resample_blocks(n, n_boot, seed)])
+        return _interval(samples, level)
+
+    def confusion_table(self):
+        """The confusion matrix as text (rows: true, columns: predicted)."""
+        columns = self.categories + [INVALID]
+        width = max(len(c) for c in columns) + 2
+        lines = ["true \\ predicted".ljust(width) + "".join(c.rjust(width) for c in columns)]
+        for category, row in zip(self.categories, self.confusion):
+            lines.append(category.ljust(width) + "".join(str(v).rjust(width) for v in row))
+        return "\n".join(lines)
+
+    def progress(self):
+        """One-line running score."""
+        return (f"{len(self)} scored ({self.unscored} unscored): accuracy {self.accuracy():.3f}, "
+                f"macro-F1 {self.macro_f1():.3f}")
+
+    def summary(self, n_boot=BOOTSTRAP_SAMPLES, level=CI_LEVEL):
+        lines = [f"Scored {len(self)} trials ({self.unscored} without a scored true category)"]
+        if not len(self):
+            return lines[0]
+        for name in METRICS:
+            low, high = self.bootstrap_ci(name, n_boot=n_boot, level=level)
+            lines.append(f"  {name}: {self.metric(name):.3f}  ({level:.0%} CI {low:.3f} to {high:.3f})")
+        lines.append("  per category (n, recall, precision, F1):")
+        for category, m in self.per_category().items():
+            lines.append(f"    {category:<15} {m['n']:>5}  {m['recall']:.3f}  {m['precision']:.3f}  {m['f1']:.3f}")
+        lines.append(self.confusion_table())
+        return "\n".join(lines)
+
+
+class SequentialComparison:
+    """
+    Paired comparison of a running configuration (B) against a finished run (A).
+
+    `update(result)` takes each new B result; it is paired with A's result for
+    the same trial. `check()` returns the current verdict and is cheap to call
+    after every result (it only bootstraps every CHECK_EVERY pairs).
+    """
+
+    def __init__(self, reference_results, metric="accuracy", categories=PREDICTION_CATEGORIES,
+                 stop_level=STOP_LEVEL, min_pairs=MIN_PAIRS, check_every=CHECK_EVERY,
+                 n_boot=BOOTSTRAP_SAMPLES, seed=SEED):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; choose from {METRICS}")
+        self.metric = metric
+        self.categories = list(categories)
+        self.stop_level = stop_level
+        self.min_pairs = min_pairs
+        self.check_every = check_every
+        self.n_boot = n_boot
+        self.seed = seed
+        self.invalid = len(self.categories)
+        codes = {c: i for i, c in enumerate(self.categories)}
+        # Reference (A): nct_id -> (true code, predicted code), scored trials only
+        self.reference = {}
+        for result in reference_results:
+            truth = true_category(result.get("true_outcome"), self.categories)
+            if truth is not None:
+                pred = predicted_category(result, self.categories)
+                self.reference[str(result.get("nct_id"))] = (codes[truth], codes.get(pred, self.invalid))
+        self.codes = codes
+        self.truth, self.pred_a, self.pred_b = [], [], []
+        self.paired_ids = set()
+        self.last = None
+
+    def __len__(self):
+        return len(self.truth)
+
+    def update(self, result):
+        """Pairs one B result with the reference; returns True if it was paired."""
+        nct_id = str(result.get("nct_id"))
+        if nct_id not in self.reference or nct_id in self.paired_ids:
+            return False
+        truth, pred_a = self.reference[nct_id]
+        pred = predicted_category(result, self.categories)
+        self.truth.append(truth)
+        self.pred_a.append(pred_a)
+        self.pred_b.append(self.codes.get(pred, self.invalid))
+        self.paired_ids.add(nct_id)
+        return True
+
+    def difference_ci(self, level=CI_LEVEL):
+        """(B - A, low, high): the metric difference and its paired bootstrap interval."""
+        n = len(self)
+        if not n:
+            return float("nan"), float("nan"), float("nan")
+        truth = np.asarray(self.truth, dtype=np.int8)
+        pred_a, pred_b = np.asarray(self.pred_a, dtype=np.int8), np.asarray(self.pred_b, dtype=np.int8)
+        idx_all = np.arange(n)[None, :]
+        k = len(self.categories)
+        diff = float(metric_samples(truth, pred_b, idx_all, self.metric, k)[0]
+                     - metric_samples(truth, pred_a, idx_all, self.metric, k)[0])
+        if n < 2:
+            return diff, float("nan"), float("nan")
+        # Same resamples for both sides: the interval is on the paired difference
+        samples = np.concatenate([metric_samples(truth, pred_b, idx, self.metric, k)
+                                  - metric_samples(truth, pred_a, idx, self.metric, k)
+                                  for idx in _resample_blocks(n, self.n_boot, self.seed)])
+        low, high = _interval(samples, level)
+        return diff, low, high
+
+    def check(self, force=False):
+        """
+        None between checks, else {pairs, difference, low, high, decisive, better}.
+        `better` is "B", "A" or None (interval still includes zero).
+        """
+        n = len(self)
+        if not force and (n < self.min_pairs or (n - self.min_pairs) % self.check_every):
+            return None
+        diff, low, high = self.difference_ci(self.stop_level)
+        decisive = n >= self.min_pairs and (low > 0 or high < 0)
+        self.last = {"pairs": n, "difference": diff, "low": low, "high": high, "decisive": decisive,
+                     "better": ("B" if low > 0 else "A") if decisive else None}
+        return self.last
+
+    def describe(self, verdict=None):
+        verdict = verdict or self.last
+        if verdict is None:
+            return f"{len(self)} paired trials (of {len(self.reference)} scored in the reference); not checked yet"
+        text = (f"{verdict['pairs']} paired trials: {self.metric} B - A = {verdict['difference']:+.3f} "
+                f"({self.stop_level:.0%} CI {verdict['low']:+.3f} to {verdict['high']:+.3f})")
+        if verdict["decisive"]:
+            return text + f" -> decisive, {verdict['better']} is better"
+        return text + " -> not decisive"
+
+
+def evaluate_file(path):
+    evaluator = OnlineEvaluator()
+    for result in iter_records(path):
+        evaluator.update(result)
+    return evaluator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a predictions file, or compare it with another run")
+    parser.add_argument("predictions", help="Predictions .jsonl (or legacy .json) file")
+    parser.add_argument("--compare-with", help="Finished run of another configuration (A); `predictions` is B")
+    parser.add_argument("--metric", choices=METRICS, default="accuracy", help="Metric compared with --compare-with")
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP_SAMPLES, help="Bootstrap resamples")
+    parser.add_argument("--level", type=float, default=CI_LEVEL, help="Confidence level of the intervals")
+    args = parser.parse_args()
+
+    evaluator = evaluate_file(args.predictions)
+    print(f"{args.predictions}\n{evaluator.summary(n_boot=args.bootstrap, level=args.level)}")
+    if args.compare_with:
+        comparison = SequentialComparison(iter_records(args.compare_with), metric=args.metric,
+                                          stop_level=args.level, n_boot=args.bootstrap)
+        for result in iter_records(args.predictions):
+            comparison.update(result)
+        print(f"\nB = {args.predictions}\nA = {args.compare_with}")
+        print(comparison.describe(comparison.check(force=True)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,43 @@
 import pandas as pd
 import json
 import os
+import argparse
 import numpy as np
+from itertools import islice
+
+from jsonl_io import JsonlWriter
+from fewshot_index import FewShotIndex, retrieval_text, format_few_shot_block
 
 # Define paths
 BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
 INPUT_CSV_PATH = os.path.join(BASE_DIR, "Pilot_datasets", "pilot_prediction_dataset.csv")
-OUTPUT_JSON_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.json")
+OUTPUT_JSONL_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.jsonl")
 
-def preprocess_data():
-    print(f"Loading dataset from {INPUT_CSV_PATH}...")
-    try:
-        df = pd.read_csv(INPUT_CSV_PATH)
-    except FileNotFoundError:
-        print(f"Error: File not found at {INPUT_CSV_PATH}")
-        return
+# Configuration
+CHUNK_SIZE = 5000 # Rows read from the CSV at a time; memory stays flat for any dataset size
+PROMPT_LIMIT = 100 # Pilot cap (we expect 80); None for no limit
+PROMPT_MODE = "static" # "static": template's fixed few-shot examples | "retrieval": k nearest labeled trials per prompt (fewshot_index.py)
+FEW_SHOT_K = 3 # Retrieved examples per prompt in retrieval mode
+
+def coalesce_columns(df, target, left, right):
+    """Combines `left`/`right` merge suffix columns into a single `target` column."""
+    if left in df.columns and right in df.columns:
+        df[target] = df[left].combine_first(df[right])
+        df.drop(columns=[left, right], inplace=True)
+    elif left in df.columns:
+        df.rename(columns={left: target}, inplace=True)
+    elif right in df.columns:
+        df.rename(columns={right: target}, inplace=True)
+    return df
 
-    print(f"Initial rows: {len(df)}")
+def normalize_chunk(df, stats):
+    """Applies redundancy handling, outcome consolidation and filtering to one chunk."""
+    stats['rows_in'] += len(df)
 
     # 1. Redundancy Handling
-    # Combine brief_title_x and brief_title_y
-    if 'brief_title_x' in df.columns and 'brief_title_y' in df.columns:
-        df['brief_title'] = df['brief_title_x'].combine_first(df['brief_title_y'])
-        df.drop(columns=['brief_title_x', 'brief_title_y'], inplace=True)
-    elif 'brief_title_x' in df.columns:
-        df.rename(columns={'brief_title_x': 'brief_title'}, inplace=True)
-    elif 'brief_title_y' in df.columns:
-        df.rename(columns={'brief_title_y': 'brief_title'}, inplace=True)
-
-    # Combine phase_x and phase_y
-    if 'phase_x' in df.columns and 'phase_y' in df.columns:
-        df['phase'] = df['phase_x'].combine_first(df['phase_y'])
-        df.drop(columns=['phase_x', 'phase_y'], inplace=True)
-    elif 'phase_x' in df.columns:
-        df.rename(columns={'phase_x': 'phase'}, inplace=True)
-    elif 'phase_y' in df.columns:
-        df.rename(columns={'phase_y': 'phase'}, inplace=True)
+    # Combine brief_title_x/brief_title_y and phase_x/phase_y
+    coalesce_columns(df, 'brief_title', 'brief_title_x', 'brief_title_y')
+    coalesce_columns(df, 'phase', 'phase_x', 'phase_y')
 
     # 2. Outcome Consolidation
     # We want a single 'true_outcome' column.
@@ -54,64 +56,115 @@ def preprocess_data():
     # 3. Filtering
     # Critical columns: nct_id, brief_title, brief_summary, true_outcome
     critical_cols = ['nct_id', 'brief_title', 'brief_summary', 'true_outcome']
+    for col in critical_cols:
+        if col not in df.columns:
+            df[col] = np.nan
     
     # Check for missing
     missing_mask = df[critical_cols].isnull().any(axis=1)
-    if missing_mask.any():
-        print(f"Dropping {missing_mask.sum()} rows with missing critical data.")
-        # Optional: Print IDs of dropped rows for debugging
-        # print(df[missing_mask]['nct_id'].tolist())
-        df = df[~missing_mask]
-    
-    print(f"Rows after filtering: {len(df)}")
+    stats['rows_dropped'] += int(missing_mask.sum())
+    return df[~missing_mask]
 
-    # 4. Prompt Engineering
-    prompts = []
+def build_prompt_entry(row):
+    """Formats one trial row into a prompt entry."""
+    # Construct manageable input text
+    # We exclude outcome related fields from the input text!
+    
+    nct_id = str(row.get('nct_id', ''))
+    title = str(row.get('brief_title', ''))
+    phase = str(row.get('phase', ''))
+    med_field = str(row.get('medical_field', ''))
+    med_subfield = str(row.get('medical_subfield', ''))
+    summary = str(row.get('brief_summary', ''))
+    criteria = str(row.get('criteria', ''))
     
-    for _, row in df.iterrows():
-        # Construct manageable input text
-        # We exclude outcome related fields from the input text!
-        
-        nct_id = str(row.get('nct_id', ''))
-        title = str(row.get('brief_title', ''))
-        phase = str(row.get('phase', ''))
-        med_field = str(row.get('medical_field', ''))
-        med_subfield = str(row.get('medical_subfield', ''))
-        summary = str(row.get('brief_summary', ''))
-        criteria = str(row.get('criteria', ''))
-        
-        # Format the input string
-        # Using a structured format
-        input_text = (
-            f"Trial ID: {nct_id}\n"
-            f"Title: {title}\n"
-            f"Phase: {phase}\n"
-            f"Medical Field: {med_field} - {med_subfield}\n\n"
-            f"Brief Summary:\n{summary}\n\n"
-            f"Eligibility Criteria:\n{criteria}"
-        )
-        
-        entry = {
-            "nct_id": nct_id,
-            "input_text": input_text,
-            "true_outcome": str(row['true_outcome'])
-        }
-        prompts.append(entry)
-
-    # Limit to 100 (though we expect 80)
-    prompts = prompts[:100]
+    # Format the input string
+    # Using a structured format
+    input_text = (
+        f"Trial ID: {nct_id}\n"
+        f"Title: {title}\n"
+        f"Phase: {phase}\n"
+        f"Medical Field: {med_field} - {med_subfield}\n\n"
+        f"Brief Summary:\n{summary}\n\n"
+        f"Eligibility Criteria:\n{criteria}"
+    )
     
-    # 5. Output
-    os.makedirs(os.path.dirname(OUTPUT_JSON_PATH), exist_ok=True)
-    with open(OUTPUT_JSON_PATH, 'w', encoding='utf-8') as f:
-        json.dump(prompts, f, indent=2)
-        
-    print(f"Saved {len(prompts)} prompts to {OUTPUT_JSON_PATH}")
+    return {
+        "nct_id": nct_id,
+        "input_text": input_text,
+        "true_outcome": str(row['true_outcome'])
+    }
+
+def prompt_set_ids(csv_path, chunk_size=CHUNK_SIZE):
+    """Every nct_id in the dataset CSV (read in chunks, nct_id column only)."""
+    ids = set()
+    for chunk in pd.read_csv(csv_path, usecols=['nct_id'], chunksize=chunk_size):
+        ids.update(chunk['nct_id'].dropna().astype(str))
+    return ids
+
+def iter_prompts(csv_path, stats, chunk_size=CHUNK_SIZE, example_index=None):
+    """
+    Streams prompt entries from the dataset CSV chunk by chunk. With an
+    `example_index` (FewShotIndex), each entry also gets `few_shot_examples` rendered from
+    its FEW_SHOT_K nearest labeled trials. No trial of the prompt set is ever
+    retrieved as an example, so labels never leak between evaluated trials.
+    """
+    prompt_ids = prompt_set_ids(csv_path, chunk_size) if example_index is not None else None
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        chunk = normalize_chunk(chunk, stats)
+        rows = chunk.to_dict('records')
+        if example_index is not None and rows:
+            neighbours = example_index.query_batch(
+                [retrieval_text(row) for row in rows], k=FEW_SHOT_K,
+                exclude_ids=[str(row.get('nct_id', '')) for row in rows],
+                shared_exclude=prompt_ids
+            )
+        else:
+            neighbours = [None] * len(rows)
+        for row, hits in zip(rows, neighbours):
+            entry = build_prompt_entry(row)
+            if hits is not None:
+                entry["few_shot_examples"] = format_few_shot_block(hits)
+                entry["few_shot_ids"] = [nct_id for nct_id, _, _, _ in hits]
+            yield entry
+
+def preprocess_data(prompt_mode=PROMPT_MODE):
+    print(f"Streaming dataset from {INPUT_CSV_PATH}...")
+    if not os.path.exists(INPUT_CSV_PATH):
+        print(f"Error: File not found at {INPUT_CSV_PATH}")
+        return
+
+    example_index = None
+    if prompt_mode == "retrieval":
+        example_index = FewShotIndex.load_or_build()
+        print(f"Retrieval prompt mode: {FEW_SHOT_K} nearest labeled examples per trial")
+
+    stats = {'rows_in': 0, 'rows_dropped': 0}
+    prompts = iter_prompts(INPUT_CSV_PATH, stats, example_index=example_index)
+    if PROMPT_LIMIT is not None:
+        prompts = islice(prompts, PROMPT_LIMIT)
+
+    # 4. Output (one prompt per line, written as it is generated)
+    first_entry = None
+    with JsonlWriter(OUTPUT_JSONL_PATH, mode='w') as writer:
+        for entry in prompts:
+            if first_entry is None:
+                first_entry = entry
+            writer.write(entry)
+
+    print(f"Rows read: {stats['rows_in']}")
+    if stats['rows_dropped']:
+        print(f"Dropped {stats['rows_dropped']} rows with missing critical data.")
+    print(f"Saved {writer.count} prompts to {OUTPUT_JSONL_PATH}")
     
     # Verify
-    if len(prompts) > 0:
+    if first_entry is not None:
         print("Sample Entry:")
-        print(json.dumps(prompts[0], indent=2))
+        print(json.dumps(first_entry, indent=2))
 
 if __name__ == "__main__":
-    preprocess_data()
+    parser = argparse.ArgumentParser(description="Build LLM prediction prompts from the pilot dataset")
+    parser.add_argument("--prompt-mode", choices=["static", "retrieval"], default=PROMPT_MODE,
+                        help="static: template's fixed few-shot examples; retrieval: nearest labeled trials per prompt")
+    args = parser.parse_args()
+    preprocess_data(prompt_mode=args.prompt_mode)
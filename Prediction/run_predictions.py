@@ -1,28 +1,80 @@
+import argparse
 import json
 import os
+import sys
 import time
+from itertools import islice
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from jsonl_io import iter_jsonl, iter_records, read_ids, JsonlWriter
+from online_eval import METRICS, OnlineEvaluator, SequentialComparison
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "LLM_client"))
+from retry_policy import RetryPolicy
+from streaming import server_max_tokens, stream_completion
+from validation import PREDICTION_CATEGORIES, validate_prediction, repair_prompt
+from hedging import HedgePolicy
+from rate_limiter import SharedRateLimiter, estimate_tokens, limited
+from compact_schema import (OutputSavings, compact_prediction_prompt, expand_prediction,
+                            max_output_tokens as compact_max_output_tokens)
+
 # Define paths
 BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
-PROMPTS_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.json")
+PROMPTS_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.jsonl")
+LEGACY_PROMPTS_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.json") # Used if the JSONL file is absent
 TEMPLATE_PATH = os.path.join(BASE_DIR, "Prediction", "Prediction_prompts_instruct.txt")
+RETRIEVAL_TEMPLATE_PATH = os.path.join(BASE_DIR, "Prediction", "Prediction_prompts_retrieval.txt") # For prompts with retrieved few_shot_examples
 OUTPUT_DIR = os.path.join(BASE_DIR, "Prediction", "predicted_outcomes")
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "predictions.json")
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, "predictions.jsonl")
+LOCAL_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "predictions_local.jsonl") # --mode local writes here so baselines never mix with LLM runs
+GROUND_TRUTH_PATH = os.path.join(BASE_DIR, "Final_data_sets", "terminated_ground_truth_enriched.csv")
+LOCAL_MODEL_PATH = os.path.join(BASE_DIR, "Prediction", "models", "local_baseline.pkl")
+DATA_DIR = os.path.join(BASE_DIR, "CT_data_full", "main_data") # AACT snapshot: eligibility criteria for the local baseline's training texts
 ENV_PATH = os.path.join(BASE_DIR, ".env")
 
 # Configuration
 SAMPLE_LIMIT = None # Process all samples
 MODEL_NAME = "deepseek-chat" # or "deepseek-coder" depending on preference, usually 'deepseek-chat' for reasoning
+MAX_RETRIES = 5 # Per-trial retries on 429/5xx/timeouts (exponential backoff + jitter)
+PREDICTION_MODE = "llm" # "llm": DeepSeek only | "local": TF-IDF baseline only | "triage": local first, DeepSeek for uncertain trials
+TRIAGE_MIN_PROBABILITY = 0.8 # In triage mode, keep local predictions at or above this class probability
+LOCAL_BATCH_SIZE = 1000 # Prompts vectorized together by the local baseline
+LOCAL_PREDICTOR_NAME = "local_tfidf_logreg"
+STREAM_RESPONSES = False # Stream tokens, record TTFT and stop reading at the first complete JSON object
+MAX_OUTPUT_TOKENS = 1000 # Per-request ceiling on answer tokens (reasoning not counted)
+MAX_REASONING_TOKENS = None # Per-request ceiling on reasoning tokens of reasoning models (None = no limit)
+MAX_SECONDS_PER_REQUEST = None # Per-request wall-clock ceiling (None = no limit)
+HEDGE_REQUESTS = False # Duplicate requests still running after the observed p95 latency (capped, see LLM_client/hedging.py)
+MAX_REPAIR_ATTEMPTS = 2 # --repair re-queries per invalid/failed trial before giving up
+EVAL_EVERY = 25 # Print the running score every this many results (see online_eval.py)
+COMPARE_METRIC = "accuracy" # --compare-with: metric whose difference decides early stopping
+COMPACT_OUTPUT = False # Ask for a category code + confidence only; the reason is filled in locally (see LLM_client/compact_schema.py)
+COMPACT_EVIDENCE = False # With COMPACT_OUTPUT, also ask for evidence spans (character offsets into the trial text)
 
-def load_system_prompt():
+def load_system_prompt(path=TEMPLATE_PATH):
     """Reads the system prompt template."""
-    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+    with open(path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def run_predictions():
-    # 1. Load Environment
+def template_for(entry, templates):
+    """System template for a prompt entry (entries with few_shot_examples use the retrieval template), loaded once."""
+    key = "retrieval" if "few_shot_examples" in entry else "instruct"
+    if key not in templates:
+        templates[key] = load_system_prompt(RETRIEVAL_TEMPLATE_PATH if key == "retrieval" else TEMPLATE_PATH)
+    return templates[key]
+
+def batched(iterable, size):
+    """Yields lists of up to `size` items from a (lazy) iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def create_llm_client():
+    """Returns an OpenAI client for DeepSeek, or None if no API key is configured."""
     if os.path.exists(ENV_PATH):
         load_dotenv(ENV_PATH)
     
@@ -33,86 +85,372 @@ def run_predictions():
         
     if not api_key:
         print("Error: DEEPSEEK_API_KEY not found in .env or environment variables.")
-        return
+        return None
 
-    # Initialize Client
-    client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+    # Retries are handled by the shared RetryPolicy, not by the client
+    return OpenAI(api_key=api_key, base_url="https://api.deepseek.com", max_retries=0)
 
-    # 2. Load Prompts
-    print(f"Loading prompts from {PROMPTS_PATH}...")
-    with open(PROMPTS_PATH, 'r', encoding='utf-8') as f:
-        all_prompts = json.load(f)
-    
-    # Apply limit
-    prompts_to_process = all_prompts[:SAMPLE_LIMIT]
-    print(f"Processing {len(prompts_to_process)} samples (Test Run)...")
+def send_request(retry_policy, hedge_policy, fn, *args, rate_limiter=None, token_estimate=0, **kwargs):
+    """
+    RetryPolicy.call, with each attempt (and each hedged copy) taken from the
+    host-wide rate limit first, and hedged when a HedgePolicy is given.
+    """
+    cancel_kwarg = "cancel_event" if fn is stream_completion else None
+    fn = limited(rate_limiter, fn, token_estimate)
+    if hedge_policy is None:
+        return retry_policy.call(fn, *args, **kwargs)
+    return retry_policy.call(hedge_policy.call, fn, *args, cancel_kwarg=cancel_kwarg, **kwargs)
 
-    # 3. Load Template
-    system_template = load_system_prompt()
+def predict_with_llm(client, retry_policy, system_template, entry, stream=STREAM_RESPONSES, repair=None,
+                     hedge_policy=None, rate_limiter=None, compact=COMPACT_OUTPUT, evidence=COMPACT_EVIDENCE,
+                     savings=None):
+    """
+    Sends one prompt to DeepSeek and returns the validated result entry.
+    `repair` = (errors, previous output) re-asks with the errors appended (see LLM_client/validation.py).
+    `compact` asks for the compact schema and expands the reply to the usual
+    fields; `savings` (an OutputSavings) adds tokens_saved / latency_gained_s.
+    """
+    nct_id = entry['nct_id']
+    input_text = entry['input_text']
+    true_outcome = entry['true_outcome']
 
-    results = []
+    # Prepare messages
+    # The template contains {input_text}. We will replace it and send as a single user message
+    # or split it. For simplicity and adherence to the template structure, we'll format it
+    # and send it as the user message (DeepSeek handles this well).
     
-    for i, entry in enumerate(prompts_to_process):
-        nct_id = entry['nct_id']
-        input_text = entry['input_text']
-        true_outcome = entry['true_outcome']
-        
-        print(f"[{i+1}/{len(prompts_to_process)}] Predicting for {nct_id}...")
-        
-        # Prepare messages
-        # The template contains {input_text}. We will replace it and send as a single user message
-        # or split it. For simplicity and adherence to the template structure, we'll format it
-        # and send it as the user message (DeepSeek handles this well).
-        
-        full_prompt = system_template.replace("{input_text}", input_text)
-        
-        try:
-            response = client.chat.completions.create(
+    # Prompts built with --prompt-mode retrieval carry their own few-shot block
+    full_prompt = system_template.replace("{few_shot_examples}", entry.get("few_shot_examples", ""))
+    if compact:
+        full_prompt = compact_prediction_prompt(full_prompt, PREDICTION_CATEGORIES, evidence)
+    full_prompt = full_prompt.replace("{input_text}", input_text)
+    if repair:
+        full_prompt = repair_prompt(full_prompt, *repair)
+    # Answer tokens only: reasoning models get no server-side cap unless MAX_REASONING_TOKENS is set
+    output_tokens = compact_max_output_tokens(evidence) if compact else MAX_OUTPUT_TOKENS
+    max_tokens = server_max_tokens(MODEL_NAME, output_tokens, MAX_REASONING_TOKENS)
+    token_estimate = estimate_tokens(full_prompt, max_tokens)
+    
+    try:
+        stream_stats = {}
+        if stream:
+            response = send_request(
+                retry_policy,
+                hedge_policy,
+                stream_completion,
+                client,
+                rate_limiter=rate_limiter,
+                token_estimate=token_estimate,
+                max_output_tokens=output_tokens,
+                max_reasoning_tokens=MAX_REASONING_TOKENS,
+                max_seconds=MAX_SECONDS_PER_REQUEST,
                 model=MODEL_NAME,
                 messages=[
                     {"role": "user", "content": full_prompt}
                 ],
-                max_tokens=1000,
                 temperature=0.0,
                 response_format={ "type": "json_object" }
             )
-            
+            content = response.content
+            stream_stats = {**response.as_dict(), "completion_tokens": response.tokens + response.reasoning_tokens}
+        else:
+            start = time.monotonic()
+            response = send_request(
+                retry_policy,
+                hedge_policy,
+                client.chat.completions.create,
+                rate_limiter=rate_limiter,
+                token_estimate=token_estimate,
+                model=MODEL_NAME,
+                messages=[
+                    {"role": "user", "content": full_prompt}
+                ],
+                temperature=0.0,
+                response_format={ "type": "json_object" },
+                **({"max_tokens": max_tokens} if max_tokens else {}),
+                **({"timeout": MAX_SECONDS_PER_REQUEST} if MAX_SECONDS_PER_REQUEST else {})
+            )
             content = response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            stream_stats = {"latency_s": round(time.monotonic() - start, 3),
+                            "completion_tokens": getattr(usage, "completion_tokens", None)}
+        
+        # Parse JSON
+        compact_output = None
+        try:
+            prediction_data = json.loads(content)
+            if compact:
+                compact_output = prediction_data
+                prediction_data = expand_prediction(prediction_data, PREDICTION_CATEGORIES, input_text)
+        except json.JSONDecodeError:
+            print(f"Warning: Could not parse JSON response for {nct_id}. Raw: {content[:50]}...")
+            prediction_data = {"prediction": "Error", "reason": "JSON Parse Error", "confidence": 0, "raw_output": content}
+        
+        # Schema check (allowed categories, required keys, confidence values)
+        prediction_data, validation_errors = validate_prediction(prediction_data)
+        if validation_errors:
+            print(f"Warning: Invalid prediction for {nct_id}: {'; '.join(validation_errors)}")
             
-            # Parse JSON
-            try:
-                prediction_data = json.loads(content)
-            except json.JSONDecodeError:
-                print(f"Warning: Could not parse JSON response for {nct_id}. Raw: {content[:50]}...")
-                prediction_data = {"prediction": "Error", "reason": "JSON Parse Error", "confidence": 0, "raw_output": content}
-                
-            # Combine
-            result_entry = {
-                "nct_id": nct_id,
-                "input_text": input_text,
-                "true_outcome": true_outcome,
-                "model_prediction": prediction_data,
-                "system_fingerprint": response.system_fingerprint
-            }
-            results.append(result_entry)
-            
-        except Exception as e:
-            print(f"API Error for {nct_id}: {e}")
-            results.append({
-                "nct_id": nct_id,
-                "true_outcome": true_outcome,
-                "error": str(e)
-            })
-            
-        # Nice to have: sleep to avoid instant rate limiting if tier is low
-        time.sleep(1)
-
-    # 4. Save Results
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2)
+        # Combine
+        return {
+            "nct_id": nct_id,
+            "input_text": input_text,
+            "true_outcome": true_outcome,
+            "model_prediction": prediction_data,
+            "predictor": MODEL_NAME,
+            "validation_errors": validation_errors,
+            "system_fingerprint": response.system_fingerprint,
+            "output_schema": "compact" if compact else "full",
+            **({"compact_output": compact_output} if compact_output is not None else {}),
+            **stream_stats,
+            **(savings.record(stream_stats) if compact and savings is not None else {}),
+            **(hedge_policy.last_outcome() if hedge_policy is not None else {})
+        }
         
-    print(f"Saved results to {OUTPUT_FILE}")
+    except Exception as e:
+        print(f"API Error for {nct_id}: {e}")
+        return {
+            "nct_id": nct_id,
+            "true_outcome": true_outcome,
+            "predictor": MODEL_NAME,
+            "error": str(e)
+        }
+
+def local_result_entry(entry, prediction):
+    return {
+        "nct_id": entry['nct_id'],
+        "input_text": entry['input_text'],
+        "true_outcome": entry['true_outcome'],
+        "model_prediction": prediction,
+        "predictor": LOCAL_PREDICTOR_NAME
+    }
+
+def run_predictions(mode=PREDICTION_MODE, stream=STREAM_RESPONSES, hedge=HEDGE_REQUESTS, output_file=None,
+                    prompts_path=None, compare_with=None, metric=COMPARE_METRIC, compact=COMPACT_OUTPUT,
+                    evidence=COMPACT_EVIDENCE):
+    """
+    Predicts every pending prompt, scoring results as they are written.
+
+    `compare_with` is a finished predictions file of another configuration
+    (other model or prompt template): only its scored trials are predicted,
+    and the run stops as soon as the paired bootstrap interval on the
+    `metric` difference excludes zero (see online_eval.py). `compact` asks
+    the LLM for the compact schema (see LLM_client/compact_schema.py).
+    """
+    if mode not in ("llm", "local", "triage"):
+        raise ValueError(f"Unknown prediction mode: {mode}")
+    output_file = output_file or (LOCAL_OUTPUT_FILE if mode == "local" else OUTPUT_FILE)
+    print(f"Prediction mode: {mode}")
+
+    # 1. Load Environment / Client (not needed for the local baseline)
+    client = None
+    if mode != "local":
+        client = create_llm_client()
+        if client is None:
+            return
+    retry_policy = RetryPolicy(max_retries=MAX_RETRIES)
+    hedge_policy = HedgePolicy() if hedge and mode != "local" else None
+    # Host-wide RPM/TPM buckets shared with every other LLM process (DEEPSEEK_RPM / DEEPSEEK_TPM in .env)
+    rate_limiter = SharedRateLimiter.from_env("deepseek") if mode != "local" else None
+
+    # 2. Stream Prompts (consumed lazily, never fully loaded)
+    prompts_path = prompts_path or (PROMPTS_PATH if os.path.exists(PROMPTS_PATH) else LEGACY_PROMPTS_PATH)
+    print(f"Streaming prompts from {prompts_path}...")
+
+    # Resume: results are appended line by line, so skip trials already written
+    processed_ids = read_ids(output_file)
+    if processed_ids:
+        print(f"Found {len(processed_ids)} trials already in {output_file}; skipping them.")
+
+    # Compact schema: savings measured against the full-schema results already written
+    savings = None
+    if compact and mode != "local":
+        savings = OutputSavings(iter_jsonl(output_file) if processed_ids else ())
+        print(f"Compact output schema{' with evidence spans' if evidence else ''}")
+
+    # Online evaluation (and the comparison), starting from the results already written
+    evaluator = OnlineEvaluator()
+    comparison = None
+    if compare_with:
+        comparison = SequentialComparison(iter_records(compare_with), metric=metric)
+        print(f"Comparing with {compare_with} on {metric}: {len(comparison.reference)} scored reference trials")
+    if processed_ids:
+        for result in iter_jsonl(output_file):
+            evaluator.update(result)
+            if comparison is not None:
+                comparison.update(result)
+
+    # Local baseline: trained on the ground truth, excluding every trial in the prompt file
+    baseline = None
+    if mode != "llm":
+        from local_baseline import LocalBaseline
+        prompt_ids = {str(rec['nct_id']) for rec in iter_records(prompts_path)}
+        baseline = LocalBaseline.load_or_train(LOCAL_MODEL_PATH, GROUND_TRUTH_PATH, exclude_ids=prompt_ids,
+                                              data_dir=DATA_DIR)
+
+    # 3. Load Template
+    templates = {}
+
+    prompts_to_process = islice(iter_records(prompts_path), SAMPLE_LIMIT)
+    pending = (entry for entry in prompts_to_process if entry['nct_id'] not in processed_ids)
+    if comparison is not None:
+        # Trials the reference does not score cannot change the comparison
+        pending = (entry for entry in pending if str(entry['nct_id']) in comparison.reference)
+    counts = {"local": 0, "llm": 0}
+    verdict = comparison.check() if comparison is not None else None
+    start_time = time.time()
+
+    with JsonlWriter(output_file) as writer:
+        for batch in batched(pending, LOCAL_BATCH_SIZE if baseline else 1):
+            if verdict and verdict["decisive"]:
+                break
+            local_predictions = baseline.predict_batch([e['input_text'] for e in batch]) if baseline else [None] * len(batch)
+
+            for entry, local_prediction in zip(batch, local_predictions):
+                if mode == "local" or (mode == "triage" and local_prediction["probability"] >= TRIAGE_MIN_PROBABILITY):
+                    result_entry = local_result_entry(entry, local_prediction)
+                    counts["local"] += 1
+                else:
+                    print(f"[{writer.count + 1}] Predicting for {entry['nct_id']}...")
+                    result_entry = predict_with_llm(client, retry_policy, template_for(entry, templates), entry,
+                                                    stream=stream, hedge_policy=hedge_policy, rate_limiter=rate_limiter,
+                                                    compact=compact, evidence=evidence, savings=savings)
+                    if local_prediction is not None:
+                        result_entry["local_prediction"] = local_prediction
+                    counts["llm"] += 1
+                    # Without a shared rate limit, sleep to avoid instant rate limiting if tier is low
+                    if rate_limiter is None:
+                        time.sleep(1)
+
+                # 4. Save Result (appended immediately, one line per trial)
+                writer.write(result_entry)
+
+                # 5. Score it; stop once the comparison is decisive
+                evaluator.update(result_entry)
+                if writer.count % EVAL_EVERY == 0:
+                    print(f"  Running score: {evaluator.progress()}")
+                if comparison is not None and comparison.update(result_entry):
+                    verdict = comparison.check()
+                    if verdict:
+                        print(f"  Comparison: {comparison.describe(verdict)}")
+                        if verdict["decisive"]:
+                            print("  Stopping early: the difference is decisive.")
+                            break
+
+    elapsed = time.time() - start_time
+    print(f"Predicted {counts['local']} trials locally and {counts['llm']} with {MODEL_NAME} in {elapsed:.1f}s")
+    print(f"Saved {writer.count} new results to {output_file}")
+    if hedge_policy is not None:
+        print(hedge_policy.summary())
+    if rate_limiter is not None:
+        print(rate_limiter.summary())
+    if savings is not None:
+        print(savings.summary())
+    print(evaluator.summary())
+    if comparison is not None:
+        remaining = len(comparison.reference) - len(comparison)
+        print(f"Comparison with {compare_with}: {comparison.describe(comparison.check(force=True))}")
+        if verdict and verdict["decisive"]:
+            print(f"{remaining} reference trials were not predicted.")
+
+def result_errors(result):
+    """Why a saved result needs a re-query (empty if it is valid). Older entries are validated here."""
+    if "error" in result:
+        return [f"request failed: {result['error']}"]
+    if result.get("predictor") == LOCAL_PREDICTOR_NAME:
+        return []
+    if "validation_errors" in result:
+        return result["validation_errors"]
+    return validate_prediction(result.get("model_prediction"))[1]
+
+def repair_predictions(stream=STREAM_RESPONSES, output_file=OUTPUT_FILE, prompts_path=None, compact=COMPACT_OUTPUT,
+                       evidence=COMPACT_EVIDENCE):
+    """
+    Re-queries only the trials whose saved LLM result failed (API error) or
+    failed schema validation, with the errors appended to the prompt, and
+    replaces those lines in the output. Each trial is retried at most
+    MAX_REPAIR_ATTEMPTS times.
+    """
+    if not os.path.exists(output_file):
+        print(f"No results at {output_file}; nothing to repair.")
+        return
+
+    # 1. Queue: invalid results only (small), found in one streamed pass
+    queue = {}
+    n_results = 0
+    for result in iter_jsonl(output_file):
+        n_results += 1
+        errors = result_errors(result)
+        attempts = result.get("repair_attempts", 0)
+        if errors and attempts < MAX_REPAIR_ATTEMPTS:
+            previous = result.get("compact_output") or result.get("model_prediction")
+            previous = (previous.get("raw_output") or json.dumps(previous)) if isinstance(previous, dict) else None
+            queue[str(result["nct_id"])] = (errors, previous, attempts)
+    print(f"Repair queue: {len(queue)} failed or invalid results (of {n_results}) in {output_file}")
+    if not queue:
+        return
+
+    client = create_llm_client()
+    if client is None:
+        return
+    retry_policy = RetryPolicy(max_retries=MAX_RETRIES)
+    rate_limiter = SharedRateLimiter.from_env("deepseek")
+    templates = {}
+
+    # 2. Re-query with the stricter prompt
+    prompts_path = prompts_path or (PROMPTS_PATH if os.path.exists(PROMPTS_PATH) else LEGACY_PROMPTS_PATH)
+    repaired = {}
+    try:
+        for entry in iter_records(prompts_path):
+            nct_id = str(entry['nct_id'])
+            if nct_id not in queue or nct_id in repaired:
+                continue
+            errors, previous, attempts = queue[nct_id]
+            print(f"[{len(repaired) + 1}/{len(queue)}] Repairing {nct_id} (attempt {attempts + 1}): {'; '.join(map(str, errors))}")
+            result_entry = predict_with_llm(client, retry_policy, template_for(entry, templates), entry,
+                                            stream=stream, repair=(errors, previous), rate_limiter=rate_limiter,
+                                            compact=compact, evidence=evidence)
+            result_entry["repair_attempts"] = attempts + 1
+            repaired[nct_id] = result_entry
+            if rate_limiter is None:
+                time.sleep(1)
+    finally:
+        # 3. Replace the repaired lines (also on interruption, so finished repairs are kept)
+        if repaired:
+            tmp_path = output_file + ".tmp"
+            with JsonlWriter(tmp_path, mode='w') as writer:
+                for result in iter_jsonl(output_file):
+                    writer.write(repaired.get(str(result.get("nct_id")), result))
+            os.replace(tmp_path, output_file)
+    fixed = sum(1 for r in repaired.values() if not result_errors(r))
+    print(f"Repair completed: {fixed} of {len(repaired)} re-queried trials are now valid.")
 
 if __name__ == "__main__":
-    run_predictions()
+    parser = argparse.ArgumentParser(description="Predict termination categories for prepared prompts")
+    parser.add_argument("--mode", choices=["llm", "local", "triage"], default=PREDICTION_MODE,
+                        help="llm: DeepSeek only; local: TF-IDF baseline only; triage: local first, DeepSeek for uncertain trials")
+    parser.add_argument("--stream", action="store_true", default=STREAM_RESPONSES,
+                        help="Stream LLM responses (TTFT telemetry, stop at the first complete JSON object)")
+    parser.add_argument("--hedge", action="store_true", default=HEDGE_REQUESTS,
+                        help="Hedge requests still running after the observed p95 latency (at most 5%% of requests)")
+    parser.add_argument("--repair", action="store_true",
+                        help="Re-query only trials whose saved result failed or did not pass schema validation")
+    parser.add_argument("--model", default=MODEL_NAME, help="DeepSeek model name")
+    parser.add_argument("--prompts", help="Prompt file (default: pilot_prompts.jsonl)")
+    parser.add_argument("--output", help="Predictions file (default: predictions.jsonl, or predictions_local.jsonl with --mode local)")
+    parser.add_argument("--compare-with", help="Finished predictions of another configuration: predict its scored "
+                                               "trials only and stop once the difference is decisive")
+    parser.add_argument("--metric", choices=METRICS, default=COMPARE_METRIC, help="Metric compared with --compare-with")
+    parser.add_argument("--compact", action="store_true", default=COMPACT_OUTPUT,
+                        help="Ask for a category code and confidence only; the reason is filled in locally")
+    parser.add_argument("--compact-evidence", action="store_true", default=COMPACT_EVIDENCE,
+                        help="--compact plus evidence spans (character offsets into the trial text)")
+    args = parser.parse_args()
+    MODEL_NAME = args.model
+    if args.repair:
+        repair_predictions(stream=args.stream, output_file=args.output or OUTPUT_FILE, prompts_path=args.prompts,
+                           compact=args.compact or args.compact_evidence, evidence=args.compact_evidence)
+    else:
+        run_predictions(mode=args.mode, stream=args.stream, hedge=args.hedge, output_file=args.output,
+                        prompts_path=args.prompts, compare_with=args.compare_with, metric=args.metric,
+                        compact=args.compact or args.compact_evidence, evidence=args.compact_evidence)
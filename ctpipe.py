@@ -0,0 +1,163 @@
+"""
+ctpipe: one entry point for the clinical trials pipeline.
+
+    python ctpipe.py taxonomy  [args]   Dataset_building/assign_taxonomy.py
+    python ctpipe.py enrich    [args]   Dataset_building/add_medical_fields.py
+    python ctpipe.py pilot     [args]   Dataset_building/build_pilot_dataset.py
+    python ctpipe.py prompts   [args]   Prediction/prepare_llm_input.py
+    python ctpipe.py extract   [args]   PhaseI_Endpoint_extraction/analyze_reasons_deepseek.py
+    python ctpipe.py predict   [args]   Prediction/run_predictions.py
+    python ctpipe.py pipeline  [args]   Dataset_building/run_pipeline.py
+    python ctpipe.py status [--check]   stage freshness and extraction/prediction progress
+
+Arguments after the subcommand are passed to the script unchanged
+(`ctpipe.py extract --help` shows the agent's options). The script runs in
+this process via runpy, so pandas, numpy, openai and dotenv are imported only
+by the subcommand that needs them: `ctpipe.py --help` and `status` load the
+standard library only.
+
+`status` reads the pipeline state file, counts result rows with the csv/json
+modules and reports its own run time against STARTUP_BUDGET_S, warning if it
+is over budget or if a heavy module was imported on the way (a lazy-import
+regression). For a per-module breakdown: `python -X importtime ctpipe.py status`.
+"""
+
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+
+# Define paths
+BASE_DIR = r"C:\Users\1234\OneDrive - Vanderbilt\Projects\LLM-clinical trials"
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+EXTRACTION_OUTPUT = os.path.join(REPO_DIR, "output", "deepseek_extraction_results.csv") # Agent default (plus shard/model files)
+PROMPTS_PATH = os.path.join(BASE_DIR, "Prediction", "pilot_prompts.jsonl")
+PREDICTIONS_PATH = os.path.join(BASE_DIR, "Prediction", "predicted_outcomes", "predictions.jsonl")
+
+# Configuration
+STARTUP_BUDGET_S = 0.5 # status must finish within this
+HEAVY_MODULES = ("pandas", "numpy", "openai", "dotenv", "sklearn")
+
+# Subcommand -> (folder, script, help)
+COMMANDS = {
+    "taxonomy": ("Dataset_building", "assign_taxonomy.py", "Assign termination categories to terminated trials"),
+    "enrich": ("Dataset_building", "add_medical_fields.py", "Add medical field / subfield to the ground truth"),
+    "pilot": ("Dataset_building", "build_pilot_dataset.py", "Build the stratified pilot dataset"),
+    "prompts": ("Prediction", "prepare_llm_input.py", "Build LLM prompts from the pilot dataset"),
+    "extract": ("PhaseI_Endpoint_extraction", "analyze_reasons_deepseek.py", "LLM extraction of termination reasons"),
+    "predict": ("Prediction", "run_predictions.py", "Predict termination categories (LLM / local / triage)"),
+    "pipeline": ("Dataset_building", "run_pipeline.py", "Cached runner for all stages"),
+}
+
+
+def run_script(folder, script, args):
+    """Runs a pipeline script as __main__ in this process (its imports happen only now)."""
+    import runpy
+
+    path = os.path.join(REPO_DIR, folder, script)
+    sys.argv = [path] + list(args)
+    sys.path.insert(0, os.path.dirname(path)) # Sibling imports, as with `python <script>`
+    runpy.run_path(path, run_name="__main__")
+
+
+def count_csv_results(path):
+    """(rows, distinct nct_ids, rows with validation errors) of a results CSV, without pandas."""
+    csv.field_size_limit(2 ** 31 - 1) # raw_response cells can be large
+    rows, ids, invalid = 0, set(), 0
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            rows += 1
+            ids.add(record.get("nct_id"))
+            invalid += bool(record.get("validation_errors"))
+    return rows, len(ids), invalid
+
+
+def count_jsonl_results(path):
+    """(lines, failed or invalid results) of a predictions JSONL file."""
+    lines, bad = 0, 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            lines += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                bad += 1
+                continue
+            bad += bool(record.get("error") or record.get("validation_errors"))
+    return lines, bad
+
+
+def count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def status(check=False):
+    """Prints stage freshness and result progress, then the time it took."""
+    sys.path.insert(0, os.path.join(REPO_DIR, "Dataset_building"))
+    from run_pipeline import pipeline_status
+
+    print("Pipeline stages:")
+    for row in pipeline_status(check=check):
+        done = f"last run {row['completed_at']} ({row['duration_s']}s)" if row["completed_at"] else "never run"
+        outputs = "outputs present" if row["outputs_exist"] else "outputs MISSING"
+        line = f"  {row['name']:<9} {done}, {outputs}"
+        if check:
+            line += f", {'stale: ' + ', '.join(row['changes']) if row['changes'] else 'up to date'}"
+        print(line)
+
+    print("\nExtraction results:")
+    root, ext = os.path.splitext(EXTRACTION_OUTPUT)
+    paths = sorted(glob.glob(f"{root}*{ext}"))
+    if not paths:
+        print(f"  none in {os.path.dirname(EXTRACTION_OUTPUT)}")
+    for path in paths:
+        rows, n_ids, invalid = count_csv_results(path)
+        print(f"  {os.path.basename(path)}: {n_ids} trials ({rows} rows), {invalid} failing validation")
+
+    print("\nPredictions:")
+    if os.path.exists(PREDICTIONS_PATH):
+        lines, bad = count_jsonl_results(PREDICTIONS_PATH)
+        total = f" of {count_lines(PROMPTS_PATH)} prompts" if os.path.exists(PROMPTS_PATH) else ""
+        print(f"  {lines}{total} predicted, {bad} failed or invalid (fix with `ctpipe.py predict --repair`)")
+    else:
+        print(f"  none at {PREDICTIONS_PATH}")
+
+    elapsed = time.perf_counter() - _START
+    heavy = sorted(m for m in HEAVY_MODULES if m in sys.modules)
+    print(f"\nstatus took {elapsed * 1000:.0f} ms (budget {STARTUP_BUDGET_S * 1000:.0f} ms)")
+    if elapsed > STARTUP_BUDGET_S:
+        print("Warning: over the startup budget; profile with `python -X importtime ctpipe.py status`.")
+    if heavy:
+        print(f"Warning: heavy modules imported by status: {', '.join(heavy)} (should be imported lazily).")
+
+
+def main():
+    argv = sys.argv[1:]
+    # Script subcommands: everything after the name goes to the script's own parser
+    if argv and argv[0] in COMMANDS:
+        folder, script, _ = COMMANDS[argv[0]]
+        run_script(folder, script, argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(prog="ctpipe", description="Clinical trials termination pipeline",
+                                     epilog="Arguments after a script subcommand are passed to that script.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (folder, script, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=f"{help_text} ({folder}/{script})")
+    status_parser = subparsers.add_parser("status", help="Stage freshness and extraction/prediction progress")
+    status_parser.add_argument("--check", action="store_true", help="Also fingerprint inputs to report stale stages")
+    args = parser.parse_args(argv)
+    status(check=args.check)
+
+
+if __name__ == "__main__":
+    main()